@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import datetime
+import json
 
 from django.test import TestCase, Client
 from django.core.urlresolvers import reverse
@@ -49,6 +50,81 @@ class TestViews(TestCase):
             u'uuid": "35570d8b22494bb6a88487a8108ffd68", "lnglat": "16,45"}]'
         )
 
+    def _create_localities(self):
+        user = UserF.create(id=1, username='test')
+        chgset = ChangesetF.create(social_user=user)
+        dom = DomainF.create(name='test_domain', changeset=chgset)
+
+        return [LocalityF.create(
+            geom='POINT({} 45)'.format(i), uuid='uuid_{}'.format(i),
+            changeset=chgset, domain=dom
+        ) for i in range(3)]
+
+    def test_localities_api_view_pages(self):
+        localities = self._create_localities()
+
+        resp = self.client.get(
+            reverse('api_localities'), {'bbox': '-180,-90,180,90', 'limit': 2}
+        )
+
+        self.assertEqual(resp.status_code, 200)
+        page = json.loads(resp.content)
+        self.assertEqual(
+            [loc['uuid'] for loc in page['localities']], ['uuid_0', 'uuid_1']
+        )
+        self.assertEqual(page['localities'][0], {
+            'version': 1, 'user_id': 1, 'uuid': 'uuid_0', 'lnglat': '0,45'
+        })
+
+        resp = self.client.get(page['next'])
+
+        page = json.loads(resp.content)
+        self.assertEqual(
+            [loc['uuid'] for loc in page['localities']], ['uuid_2']
+        )
+        self.assertIsNone(page['next'])
+
+        # the next page starts after the Locality
+        resp = self.client.get(reverse('api_localities'), {
+            'bbox': '-180,-90,180,90', 'limit': 2, 'after': localities[1].pk
+        })
+
+        self.assertEqual(
+            [loc['uuid'] for loc in json.loads(resp.content)['localities']],
+            ['uuid_2']
+        )
+
+    def test_localities_api_view_bad_limit(self):
+        for limit in ('0', '1001', 'a'):
+            resp = self.client.get(
+                reverse('api_localities'),
+                {'bbox': '-180,-90,180,90', 'limit': limit}
+            )
+
+            self.assertEqual(resp.status_code, 404)
+
+    def test_localities_api_view_stream(self):
+        self._create_localities()
+
+        resp = self.client.get(
+            reverse('api_localities'), {'bbox': '-180,-90,180,90'}
+        )
+        stream_resp = self.client.get(
+            reverse('api_localities'), {'bbox': '-180,-90,180,90', 'stream': 1}
+        )
+
+        self.assertEqual(stream_resp.status_code, 200)
+        self.assertEqual(
+            ''.join(stream_resp.streaming_content), resp.content
+        )
+
+    def test_localities_api_view_stream_nodata(self):
+        resp = self.client.get(
+            reverse('api_localities'), {'bbox': '-180,-90,180,90', 'stream': 1}
+        )
+
+        self.assertEqual(''.join(resp.streaming_content), '[]')
+
     def test_localities_api_view_nodata(self):
         resp = self.client.get(
             reverse('api_localities'), {'bbox': '-180,-90,180,90'}
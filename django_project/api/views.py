@@ -2,7 +2,10 @@
 import logging
 LOG = logging.getLogger(__name__)
 
-from django.http import Http404
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, StreamingHttpResponse
 from django.views.generic import View
 from django.views.generic.detail import SingleObjectMixin
 
@@ -13,35 +16,127 @@ from localities.utils import parse_bbox
 
 from .utils import remap_dict
 
+# maximum number of Localities of a page
+MAX_LIMIT = 1000
+
+# number of Localities fetched at once by a streamed response
+STREAM_CHUNK_SIZE = 1000
+
 
 class LocalitiesAPI(JSONResponseMixin, View):
+    """
+    Localities in a *bbox*
+
+    Pages of Localities ordered by id are returned if *limit* is set, a page
+    starts after the Locality with the id *after*, and links to the next
+    page. With *stream*, all Localities are written incrementally, fetched
+    in chunks, so memory use doesn't depend on the size of the bbox
+    """
+
+    # remapped keys of Localities
+    transform = {
+        'changeset__social_user_id': 'user_id'
+    }
+
     def _parse_request_params(self, request):
         if not(all(param in request.GET for param in ['bbox'])):
             raise Http404
 
         try:
             bbox_poly = parse_bbox(request.GET.get('bbox'))
+
+            after = request.GET.get('after')
+            if after is not None:
+                after = int(after)
+
+            limit = request.GET.get('limit')
+            if limit is not None:
+                limit = int(limit)
+                if not 0 < limit <= MAX_LIMIT:
+                    raise ValueError
         except:
             # return 404 if any of parameters are missing or not parsable
             raise Http404
 
-        return bbox_poly
+        return bbox_poly, after, limit
 
-    def get(self, request, *args, **kwargs):
-        bbox = self._parse_request_params(request)
-        # iterate thorugh queryset and remap keys
-        transform = {
-            'changeset__social_user_id': 'user_id'
-        }
-        object_list = [
-            remap_dict(loc, transform)
-            for loc in Locality.objects.in_bbox(bbox)
+    def _get_localities(self, bbox, fields=()):
+        localities = (
+            Locality.objects.in_bbox(bbox)
             .select_related('changeset')
             .get_lnglat()
-            .values(
-                'uuid', 'lnglat', 'version', 'changeset__social_user_id',
-                # 'changeset__created'
+        )
+
+        return localities.values(
+            'uuid', 'lnglat', 'version', 'changeset__social_user_id',
+            # 'changeset__created'
+            *fields
+        )
+
+    def _get_page(self, bbox, after, limit):
+        """
+        Localities after the id *after*, and the id of the last Locality if
+        there can be more Localities
+        """
+
+        localities = self._get_localities(bbox, ('id',)).order_by('id')
+        if after is not None:
+            localities = localities.filter(id__gt=after)
+
+        object_list = []
+        last_id = None
+        for loc in localities[:limit]:
+            last_id = loc.pop('id')
+            object_list.append(remap_dict(loc, self.transform))
+
+        if len(object_list) < limit:
+            last_id = None
+
+        return object_list, last_id
+
+    def _stream(self, bbox):
+        yield '['
+
+        after = None
+        separator = ''
+        while True:
+            object_list, after = self._get_page(
+                bbox, after, STREAM_CHUNK_SIZE
+            )
+            for loc in object_list:
+                yield separator + json.dumps(loc, cls=DjangoJSONEncoder)
+                separator = ', '
+
+            if after is None:
+                break
+
+        yield ']'
+
+    def get(self, request, *args, **kwargs):
+        bbox, after, limit = self._parse_request_params(request)
+
+        if 'stream' in request.GET:
+            return StreamingHttpResponse(
+                self._stream(bbox), content_type='application/json'
             )
+
+        if limit is not None:
+            object_list, last_id = self._get_page(bbox, after, limit)
+
+            next_url = None
+            if last_id is not None:
+                params = request.GET.copy()
+                params['after'] = last_id
+                next_url = '{}?{}'.format(request.path, params.urlencode())
+
+            return self.render_json_response({
+                'localities': object_list,
+                'next': next_url
+            })
+
+        object_list = [
+            remap_dict(loc, self.transform)
+            for loc in self._get_localities(bbox)
         ]
 
         return self.render_json_response(object_list)
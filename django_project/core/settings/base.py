@@ -113,6 +113,34 @@ MIDDLEWARE_CLASSES = (
 
 ROOT_URLCONF = 'core.urls'
 
+# Rendered map tiles ('tiles'), and version stamps of data cached in-process
+# and progress of imports ('shared'), are stored in database caches, which are
+# shared by all of the uwsgi workers and Celery workers. Entries of the
+# 'shared' cache don't expire, and it's never culled. Create cache tables
+# using:
+# python manage.py createcachetable
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'healthsites_shared_cache',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000000
+        }
+    },
+    'tiles': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'healthsites_tile_cache',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000
+        }
+    }
+}
+
 # Python dotted path to the WSGI application used by Django's runserver.
 WSGI_APPLICATION = 'core.wsgi.application'
 
@@ -157,6 +157,8 @@ BROKER_URL = 'amqp://guest:guest@%s:5672//' % os.environ['RABBITMQ_HOST']
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
+# results of partitions of data loads are collected by a chord
+CELERY_RESULT_BACKEND = 'amqp'
 
 
 # Django envelop for contact forms
@@ -8,12 +8,11 @@ LOGGING_LOG_SQL = DEBUG
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
-# Disable caching while in development
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
-    }
-}
+# Disable caching while in development, the shared cache is still used to
+# invalidate in-process cached data
+CACHES = dict(CACHES, default={
+    'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+})
 
 # Make sure static files storage is set to default
 STATIC_FILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
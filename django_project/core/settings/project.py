@@ -41,6 +41,50 @@ LANGUAGES = (
 # Set storage path for the translation files
 LOCALE_PATHS = (absolute_path('locale'),)
 
+# Clustering backend of the localities layer, 'python' or 'postgis', it can be
+# overridden by the 'backend' request argument
+CLUSTER_BACKEND = 'python'
+
+# Zoom levels and icon sizes (width, height) of the precomputed cluster
+# pyramid, icon sizes should match the ones requested by clusterLayer.js
+CLUSTER_PYRAMID_ZOOM_LEVELS = range(0, 21)
+CLUSTER_PYRAMID_ICON_SIZES = ((48, 46),)
+
+# Changed Localities refresh only their cluster cells, a zoom level with more
+# changed cells is rebuilt and the tile cache is cleared
+CLUSTER_INVALIDATION_MAX_CELLS = 1000
+
+# LocalityIndex rows of more changed Localities are rebuilt in a Celery task
+LOCALITY_INDEX_TASK_THRESHOLD = 100
+
+# Seconds by which refreshes of stored statistics are delayed, changes made
+# in the meantime are refreshed together
+STATISTICS_REFRESH_DELAY = 60
+
+# Number of rows of uploaded CSV files which are saved in one transaction
+CSV_IMPORT_CHUNK_SIZE = 1000
+
+# If enabled, skip new rows of uploaded CSV files which are within 0.01
+# degrees of other localities, and have a name similarity (0 - 1) of at least
+# CSV_IMPORT_DUPLICATE_NAME_SIMILARITY, rows without names are not skipped
+# (None compares locations only, which skips distinct facilities in dense
+# areas)
+CSV_IMPORT_DETECT_DUPLICATES = False
+CSV_IMPORT_DUPLICATE_NAME_SIMILARITY = 0.8
+
+# Number of partitions of uploaded CSV files which are imported in parallel
+# Celery tasks, partitions require a Celery result backend
+CSV_IMPORT_PARTITIONS = 1
+
+# Seconds between checks of the version stamps of data cached in-process (the
+# schema registry, country names) in the shared cache, changes made by other
+# processes are seen after at most this delay
+CACHE_VERSION_CHECK_INTERVAL = 5
+
+# Browser cache lifetime (seconds) of localities tiles, server side tile cache
+# is defined by the 'tiles' alias of CACHES
+TILE_MAX_AGE = 60 * 5
+
 # Project specific javascript files to be pipelined
 # For third party libs like jquery should go in contrib.py
 # Maybe we can split these between project-home and project-map
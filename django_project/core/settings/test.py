@@ -8,6 +8,13 @@ INSTALLED_APPS += (
 
 TEST_RUNNER = 'django.test.runner.DiscoverRunner'
 
+# run celery tasks synchronously
+CELERY_ALWAYS_EAGER = True
+
+# version stamps in the shared (database) cache are rolled back with every
+# test, so they are always checked
+CACHE_VERSION_CHECK_INTERVAL = 0
+
 NOSE_ARGS = (
     '--with-coverage',
     '--cover-erase',
@@ -4,7 +4,9 @@
 
         includes: L.Mixin.Events,
         options: {
-            url: ''
+            // tile url template, for example: /localities/{z}/{x}/{y}.json
+            url: '',
+            iconsize: [48, 46]
         },
 
         initialize: function (options) {
@@ -12,7 +14,8 @@
 
             L.Util.setOptions(this, options);
 
-            this._curReq = null;
+            this._curReqs = [];
+            this._reqId = 0;
             this._center = null;
             this._maxBounds = null;
             this.editMode = false;
@@ -84,7 +87,7 @@
             // clear previous layers
             L.LayerGroup.prototype.clearLayers.call(this);
 
-            this._curReq = null;
+            this._curReqs = [];
 
             if (typeof response != 'undefined') {
                 for (var i = response.length - 1; i >= 0; i--) {
@@ -157,30 +160,80 @@
                 this.localitySaved = false;
                 return;
             }
-            var bb = this._map.getBounds();
-
-            if (this._curReq && this._curReq.abort)
-                this._curReq.abort();       //prevent parallel requests
-            var url = this.options.url + L.Util.getParamString({
-                    'bbox': bb.toBBoxString(),
-                    'zoom': this._map.getZoom(),
-                    'iconsize': [48, 46],
-                    'geoname': this.geoname,
-                    'tag': this.tag,
-                });
-
             // when using cached data we don't need to make any new requests
             // for example, this is useful when changing app contexts without changing map view
             if (use_cache) {
                 self._render_map(self.ajax_response);
-            } else {
-                this._curReq = this.getAjax(url, function (response) {
-                    self._render_map(response);
-                    // cache response
-                    self.ajax_response = response;
-                });
+                return;
             }
 
+            // responses of previous requests are ignored
+            var reqId = ++this._reqId;
+
+            //prevent parallel requests
+            for (var i = 0; i < this._curReqs.length; i++) {
+                if (this._curReqs[i].abort) {
+                    this._curReqs[i].abort();
+                }
+            }
+            this._curReqs = [];
+
+            var zoom = this._map.getZoom();
+            var tileRange = this._getTileRange(this._map.getBounds(), zoom);
+            var params = L.Util.getParamString({
+                'iconsize': this.options.iconsize,
+                'geoname': this.geoname,
+                'tag': this.tag
+            });
+
+            var pending = tileRange.length;
+            var clusters = [];
+
+            if (pending === 0) {
+                self._render_map(clusters);
+            }
+
+            for (var t = 0; t < tileRange.length; t++) {
+                var url = L.Util.template(this.options.url, tileRange[t]) + params;
+
+                this._curReqs.push(this.getAjax(url, function (response) {
+                    if (reqId !== self._reqId) {
+                        return;
+                    }
+                    if (response instanceof Array) {
+                        clusters = clusters.concat(response);
+                    }
+                    pending -= 1;
+                    // render the map once all of the tiles are loaded
+                    if (pending === 0) {
+                        self._render_map(clusters);
+                        // cache response
+                        self.ajax_response = clusters;
+                    }
+                }));
+            }
+        },
+
+        _getTileRange: function (bounds, zoom) {
+            // list World Mercator tiles {z, x, y} which cover map bounds
+            var tileSize = 256;
+            var maxTile = Math.pow(2, zoom) - 1;
+
+            var nw = this._map.project(bounds.getNorthWest(), zoom);
+            var se = this._map.project(bounds.getSouthEast(), zoom);
+
+            var minX = Math.max(Math.floor(nw.x / tileSize), 0);
+            var minY = Math.max(Math.floor(nw.y / tileSize), 0);
+            var maxX = Math.min(Math.floor(se.x / tileSize), maxTile);
+            var maxY = Math.min(Math.floor(se.y / tileSize), maxTile);
+
+            var tiles = [];
+            for (var x = minX; x <= maxX; x++) {
+                for (var y = minY; y <= maxY; y++) {
+                    tiles.push({'z': zoom, 'x': x, 'y': y});
+                }
+            }
+            return tiles;
         },
 
         _onMove: function (e) {
@@ -209,17 +262,20 @@
             request.open('GET', url);
             request.onreadystatechange = function () {
                 var response = {};
-                if (request.readyState === 4 && request.status === 200) {
-                    try {
-                        if (window.JSON) {
-                            response = JSON.parse(request.responseText);
-                        } else {
-                            response = eval("(" + request.responseText + ")");
+                if (request.readyState === 4) {
+                    if (request.status === 200) {
+                        try {
+                            if (window.JSON) {
+                                response = JSON.parse(request.responseText);
+                            } else {
+                                response = eval("(" + request.responseText + ")");
+                            }
+                        } catch (err) {
+                            console.info(err);
+                            response = {};
                         }
-                    } catch (err) {
-                        console.info(err);
-                        response = {};
                     }
+                    // failed requests are passed as empty responses
                     cb(response);
                 }
             };
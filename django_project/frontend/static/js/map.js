@@ -219,7 +219,7 @@ window.MAP = (function () {
         _setupClusterLayer: function () {
             var self = this;
             this.clusterLayer = L.clusterLayer({
-                'url': '/localities.json'
+                'url': '/localities/{z}/{x}/{y}.json'
             });
             self.MAP.addLayer(this.clusterLayer);
         },
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+import logging
+LOG = logging.getLogger(__name__)
+
+from collections import OrderedDict
+
+from .batching import DeferredQueue
+
+
+def write_archives(archives):
+    """
+    Insert archive objects, using a single bulk insert per archive model
+    """
+
+    by_model = OrderedDict()
+    for archive in archives:
+        by_model.setdefault(type(archive), []).append(archive)
+
+    for model, objects in by_model.iteritems():
+        LOG.debug('Archiving %s %s objects', len(objects), model.__name__)
+        model.objects.bulk_create(objects)
+
+
+# archive objects, buffered while a batch of the queue is open
+archive_queue = DeferredQueue(write_archives, transactional=True)
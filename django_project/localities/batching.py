@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import logging
+LOG = logging.getLogger(__name__)
+
+import threading
+from contextlib import contextmanager
+
+_queues = []
+
+
+class DeferredQueue(object):
+    """
+    Queue of items which are processed by a *flush* function
+
+    Items added while a *batch* is open are collected and flushed together
+    when the batch closes, otherwise items are flushed immediately
+
+    *transactional* queues write to the database, so they are only deferred
+    by batches which name them, usually opened inside a transaction
+    """
+
+    def __init__(self, flush, transactional=False):
+        self.flush = flush
+        self.transactional = transactional
+        self._local = threading.local()
+
+        _queues.append(self)
+
+    def add(self, *items):
+        pending = getattr(self._local, 'items', None)
+
+        if pending is None:
+            self.flush(list(items))
+        else:
+            pending.extend(items)
+
+    def _open(self):
+        depth = getattr(self._local, 'depth', 0)
+
+        if depth == 0:
+            self._local.items = []
+        self._local.depth = depth + 1
+
+    def _close(self):
+        """
+        Close a batch of the queue, pending items are returned only when the
+        outermost batch closes
+        """
+
+        self._local.depth -= 1
+
+        if self._local.depth > 0:
+            return None
+
+        items = self._local.items
+        self._local.items = None
+
+        return items
+
+
+@contextmanager
+def batch(*queues):
+    """
+    Defer flushing of DeferredQueues until the end of a block, all of the
+    non transactional queues unless *queues* are given. Batches can be nested
+    and a queue is flushed by its outermost batch
+
+    If the block raises an exception, queued items are discarded
+    """
+
+    queues = queues or [
+        queue for queue in _queues if not queue.transactional
+    ]
+
+    for queue in queues:
+        queue._open()
+
+    try:
+        yield
+    finally:
+        # close every queue, even if the block raised an exception
+        pending = [(queue, queue._close()) for queue in queues]
+
+    for queue, items in pending:
+        if items:
+            LOG.debug('Flushing %s deferred items', len(items))
+            queue.flush(items)
@@ -0,0 +1,484 @@
+# -*- coding: utf-8 -*-
+"""
+Set based import of Localities and their Values
+
+Parsed rows are copied into temporary staging tables, matched to existing
+Localities by uuid or upstream_id, and saved using a fixed number of bulk
+statements, together with archives and DataHistory of changed objects, or
+compared to the matched Localities in a dry run
+"""
+import logging
+LOG = logging.getLogger(__name__)
+
+import csv
+import uuid
+from cStringIO import StringIO
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+
+from .invalidation import cluster_queue, index_queue, statistics_queue
+from .models import (
+    Attribute,
+    Country,
+    DataHistory,
+    Locality,
+    LocalityArchive,
+    Specification,
+    Value,
+    ValueArchive
+)
+
+TABLES = {
+    'locality': Locality._meta.db_table,
+    'locality_archive': LocalityArchive._meta.db_table,
+    'value': Value._meta.db_table,
+    'value_archive': ValueArchive._meta.db_table,
+    'specification': Specification._meta.db_table,
+    'attribute': Attribute._meta.db_table,
+    'country': Country._meta.db_table,
+    'history': DataHistory._meta.db_table
+}
+
+STAGING_SQL = """
+DROP TABLE IF EXISTS import_locality;
+CREATE TEMPORARY TABLE import_locality (
+    upstream_id text PRIMARY KEY,
+    uuid text,
+    new_uuid text NOT NULL,
+    lng double precision NOT NULL,
+    lat double precision NOT NULL,
+    geom geometry(Point, 4326),
+    locality_id integer,
+    created boolean NOT NULL DEFAULT false,
+    old_geom geometry(Point, 4326),
+    old_country_id integer
+) ON COMMIT DROP;
+DROP TABLE IF EXISTS import_value;
+CREATE TEMPORARY TABLE import_value (
+    upstream_id text NOT NULL,
+    key text NOT NULL,
+    data text NOT NULL
+) ON COMMIT DROP;
+"""
+
+COPY_LOCALITY_SQL = """
+COPY import_locality (upstream_id, uuid, new_uuid, lng, lat)
+FROM STDIN WITH CSV
+"""
+
+COPY_VALUE_SQL = """
+COPY import_value (upstream_id, key, data)
+FROM STDIN WITH CSV
+"""
+
+# match Localities by uuid, and then by upstream_id
+MATCH_SQL = """
+UPDATE import_locality SET geom = ST_SetSRID(ST_MakePoint(lng, lat), 4326);
+UPDATE import_locality AS imp SET
+    locality_id = loc.id, old_geom = loc.geom, old_country_id = loc.country_id
+FROM {locality} AS loc
+WHERE loc.uuid = imp.uuid;
+UPDATE import_locality AS imp SET
+    locality_id = loc.id, old_geom = loc.geom, old_country_id = loc.country_id
+FROM {locality} AS loc
+WHERE imp.locality_id IS NULL AND loc.upstream_id = imp.upstream_id;
+"""
+
+# rows matched to the same Locality (one by uuid and another by upstream_id,
+# or by the same uuid) would update it more than once, only one of them is
+# kept, preferring a match by uuid
+DEDUPLICATE_MATCHED_SQL = """
+DELETE FROM import_locality AS imp
+WHERE imp.locality_id IS NOT NULL AND imp.upstream_id NOT IN (
+    SELECT DISTINCT ON (dup.locality_id) dup.upstream_id
+    FROM import_locality AS dup
+    JOIN {locality} AS loc ON loc.id = dup.locality_id
+    ORDER BY dup.locality_id, coalesce(dup.uuid = loc.uuid, false) DESC,
+        dup.upstream_id
+)
+"""
+
+# new rows with the same uuid would create Localities with a duplicated uuid,
+# only the first of them is kept
+DEDUPLICATE_NEW_SQL = """
+DELETE FROM import_locality AS imp
+USING import_locality AS other
+WHERE imp.locality_id IS NULL AND other.locality_id IS NULL
+    AND imp.new_uuid = other.new_uuid AND other.upstream_id < imp.upstream_id
+"""
+
+# Values of removed rows
+DEDUPLICATE_VALUE_SQL = """
+DELETE FROM import_value AS val
+WHERE NOT EXISTS (
+    SELECT 1 FROM import_locality AS imp
+    WHERE imp.upstream_id = val.upstream_id
+);
+"""
+
+COUNTRY_SQL = """(
+    SELECT country.id FROM {country} AS country
+    WHERE ST_Contains(country.polygon_geometry, imp.geom)
+    ORDER BY country.id
+    LIMIT 1
+)"""
+
+UPDATE_LOCALITY_SQL = """
+UPDATE {locality} AS loc SET
+    geom = imp.geom,
+    changeset_id = %(changeset)s,
+    version = loc.version + 1,
+    country_id = CASE
+        WHEN ST_Equals(loc.geom, imp.geom) THEN loc.country_id
+        ELSE {country_query}
+    END
+FROM import_locality AS imp
+WHERE loc.id = imp.locality_id
+"""
+
+INSERT_LOCALITY_SQL = """
+WITH created AS (
+    INSERT INTO {locality} (
+        changeset_id, version, domain_id, uuid, upstream_id, geom, country_id,
+        completeness
+    )
+    SELECT
+        %(changeset)s, 1, %(domain)s, imp.new_uuid, imp.upstream_id, imp.geom,
+        {country_query}, 0
+    FROM import_locality AS imp
+    WHERE imp.locality_id IS NULL
+    RETURNING id, upstream_id
+)
+UPDATE import_locality AS imp SET locality_id = created.id, created = true
+FROM created
+WHERE imp.upstream_id = created.upstream_id
+"""
+
+ARCHIVE_LOCALITY_SQL = """
+INSERT INTO {locality_archive} (
+    changeset_id, version, content_type_id, object_id, domain_id, uuid,
+    upstream_id, geom
+)
+SELECT
+    loc.changeset_id, loc.version, %(locality_type)s, loc.id, loc.domain_id,
+    loc.uuid, loc.upstream_id, loc.geom
+FROM {locality} AS loc
+JOIN import_locality AS imp ON imp.locality_id = loc.id
+"""
+
+# new data of Values, keys are resolved to Specifications of the Domain of
+# every Locality
+VALUE_DATA_SQL = """
+DROP TABLE IF EXISTS import_value_data;
+CREATE TEMPORARY TABLE import_value_data ON COMMIT DROP AS
+SELECT DISTINCT ON (imp.locality_id, spec.id)
+    imp.locality_id, spec.id AS specification_id, val.data
+FROM import_value AS val
+JOIN import_locality AS imp ON imp.upstream_id = val.upstream_id
+JOIN {locality} AS loc ON loc.id = imp.locality_id
+JOIN {specification} AS spec ON spec.domain_id = loc.domain_id
+JOIN {attribute} AS attr ON attr.id = spec.attribute_id AND attr.key = val.key
+ORDER BY imp.locality_id, spec.id;
+"""
+
+# Replace mode, values of existing Localities which are not in the file are
+# emptied
+REPLACE_VALUE_DATA_SQL = """
+INSERT INTO import_value_data (locality_id, specification_id, data)
+SELECT val.locality_id, val.specification_id, ''
+FROM {value} AS val
+JOIN import_locality AS imp
+    ON imp.locality_id = val.locality_id AND NOT imp.created
+JOIN {locality} AS loc ON loc.id = val.locality_id
+JOIN {specification} AS spec
+    ON spec.id = val.specification_id AND spec.domain_id = loc.domain_id
+WHERE val.data <> '' AND NOT EXISTS (
+    SELECT 1 FROM import_value_data AS new
+    WHERE new.locality_id = val.locality_id
+        AND new.specification_id = val.specification_id
+)
+"""
+
+UPDATE_VALUE_SQL = """
+WITH changed AS (
+    UPDATE {value} AS val SET
+        data = new.data,
+        version = val.version + 1,
+        changeset_id = %(changeset)s
+    FROM import_value_data AS new
+    WHERE val.locality_id = new.locality_id
+        AND val.specification_id = new.specification_id
+        AND val.data IS DISTINCT FROM new.data
+    RETURNING val.id, val.version, val.locality_id, val.specification_id,
+        val.data
+)
+INSERT INTO {value_archive} (
+    changeset_id, version, content_type_id, object_id, locality_id,
+    specification_id, data
+)
+SELECT
+    %(changeset)s, version, %(value_type)s, id, locality_id,
+    specification_id, data
+FROM changed
+"""
+
+INSERT_VALUE_SQL = """
+WITH created AS (
+    INSERT INTO {value} (
+        changeset_id, version, locality_id, specification_id, data
+    )
+    SELECT %(changeset)s, 1, new.locality_id, new.specification_id, new.data
+    FROM import_value_data AS new
+    WHERE new.data <> '' AND NOT EXISTS (
+        SELECT 1 FROM {value} AS val
+        WHERE val.locality_id = new.locality_id
+            AND val.specification_id = new.specification_id
+    )
+    RETURNING id, version, locality_id, specification_id, data
+)
+INSERT INTO {value_archive} (
+    changeset_id, version, content_type_id, object_id, locality_id,
+    specification_id, data
+)
+SELECT
+    %(changeset)s, version, %(value_type)s, id, locality_id,
+    specification_id, data
+FROM created
+"""
+
+COMPLETENESS_SQL = """
+UPDATE {locality} AS loc SET completeness = ((
+    SELECT count(*) FROM {value} AS val
+    WHERE val.locality_id = loc.id AND val.data IS NOT NULL AND val.data <> ''
+) + 1) * 100.0 / ((
+    SELECT count(*) FROM {specification} AS spec
+    WHERE spec.domain_id = loc.domain_id
+) + 1)
+FROM import_locality AS imp
+WHERE loc.id = imp.locality_id
+"""
+
+# data of Values of staged rows for a dry run, new Localities have Values of
+# the imported Domain
+DIFF_VALUE_DATA_SQL = """
+DROP TABLE IF EXISTS import_value_data;
+CREATE TEMPORARY TABLE import_value_data ON COMMIT DROP AS
+SELECT DISTINCT ON (imp.upstream_id, spec.id)
+    imp.upstream_id, attr.key, val.data
+FROM import_value AS val
+JOIN import_locality AS imp ON imp.upstream_id = val.upstream_id
+LEFT JOIN {locality} AS loc ON loc.id = imp.locality_id
+JOIN {specification} AS spec
+    ON spec.domain_id = coalesce(loc.domain_id, %(domain)s)
+JOIN {attribute} AS attr ON attr.id = spec.attribute_id AND attr.key = val.key
+ORDER BY imp.upstream_id, spec.id;
+"""
+
+# changed Values of staged rows, missing new data (NULL) is blanked data, and
+# only returned in Replace mode
+DIFF_VALUES_SQL = """
+WITH old AS (
+    SELECT imp.upstream_id, attr.key, val.data
+    FROM import_locality AS imp
+    JOIN {locality} AS loc ON loc.id = imp.locality_id
+    JOIN {value} AS val ON val.locality_id = loc.id
+    JOIN {specification} AS spec
+        ON spec.id = val.specification_id AND spec.domain_id = loc.domain_id
+    JOIN {attribute} AS attr ON attr.id = spec.attribute_id
+    WHERE val.data <> ''
+)
+SELECT
+    coalesce(new.upstream_id, old.upstream_id), coalesce(new.key, old.key),
+    old.data, new.data
+FROM import_value_data AS new
+FULL OUTER JOIN old
+    ON old.upstream_id = new.upstream_id AND old.key = new.key
+WHERE new.data IS DISTINCT FROM old.data
+    AND (new.upstream_id IS NOT NULL OR %(replace)s)
+"""
+
+DIFF_LOCALITIES_SQL = """
+SELECT
+    imp.upstream_id, imp.locality_id IS NULL,
+    coalesce(NOT ST_Equals(imp.old_geom, imp.geom), false),
+    ST_X(imp.old_geom), ST_Y(imp.old_geom), imp.lng, imp.lat
+FROM import_locality AS imp
+"""
+
+HISTORY_SQL = """
+INSERT INTO {history} (locality_id, time_changed, mode, author_id)
+SELECT imp.locality_id, %(time)s, %(history_mode)s, %(author)s
+FROM import_locality AS imp
+"""
+
+CHANGES_SQL = """
+SELECT
+    imp.locality_id, imp.created, imp.old_country_id, loc.country_id,
+    ST_X(imp.old_geom), ST_Y(imp.old_geom), ST_X(imp.geom), ST_Y(imp.geom)
+FROM import_locality AS imp
+JOIN {locality} AS loc ON loc.id = imp.locality_id
+"""
+
+
+def _copy(cursor, sql, rows):
+    data = StringIO()
+    writer = csv.writer(data)
+    for row in rows:
+        writer.writerow([
+            val.encode('utf-8') if isinstance(val, unicode) else val
+            for val in row
+        ])
+    data.seek(0)
+
+    cursor.copy_expert(sql, data)
+
+
+def _execute(cursor, sql, params=None):
+    cursor.execute(
+        sql.format(country_query=COUNTRY_SQL.format(**TABLES), **TABLES),
+        params
+    )
+
+    return cursor.rowcount
+
+
+def _stage(cursor, parsed_data):
+    """
+    Copy parsed rows to staging tables, and match them to existing Localities,
+    keeping a single row of every matched Locality or new uuid. Returns the
+    number of removed (duplicated) rows
+    """
+
+    cursor.execute(STAGING_SQL)
+
+    _copy(cursor, COPY_LOCALITY_SQL, (
+        (
+            upstream_id, row['uuid'], row['uuid'] or uuid.uuid4().hex,
+            repr(row['geom'][0]), repr(row['geom'][1])
+        ) for upstream_id, row in parsed_data.iteritems()
+    ))
+    _copy(cursor, COPY_VALUE_SQL, (
+        (upstream_id, key, data)
+        for upstream_id, row in parsed_data.iteritems()
+        for key, data in row['values'].iteritems()
+    ))
+
+    _execute(cursor, MATCH_SQL)
+    duplicated = _execute(cursor, DEDUPLICATE_MATCHED_SQL)
+    duplicated += _execute(cursor, DEDUPLICATE_NEW_SQL)
+    _execute(cursor, DEDUPLICATE_VALUE_SQL)
+
+    return duplicated
+
+
+def bulk_save(parsed_data, domain, changeset, user, mode, history_time,
+              history_mode):
+    """
+    Save parsed rows of a CSVImporter, must be called in a transaction
+
+    In Replace mode (1), values of existing Localities which are not in the
+    file are emptied, otherwise they are kept. Returns numbers of created and
+    modified Localities, and of duplicated rows (of a Locality or uuid of
+    another row) which are not saved
+    """
+
+    if not parsed_data:
+        return 0, 0, 0
+
+    cursor = connection.cursor()
+    duplicated = _stage(cursor, parsed_data)
+
+    params = {
+        'changeset': changeset.pk,
+        'domain': domain.pk,
+        'locality_type': ContentType.objects.get_for_model(Locality).pk,
+        'value_type': ContentType.objects.get_for_model(Value).pk,
+        'time': history_time,
+        'history_mode': history_mode,
+        'author': user.pk
+    }
+
+    modified = _execute(cursor, UPDATE_LOCALITY_SQL, params)
+    created = _execute(cursor, INSERT_LOCALITY_SQL, params)
+    _execute(cursor, ARCHIVE_LOCALITY_SQL, params)
+
+    _execute(cursor, VALUE_DATA_SQL)
+    if mode == 1:
+        _execute(cursor, REPLACE_VALUE_DATA_SQL)
+    _execute(cursor, UPDATE_VALUE_SQL, params)
+    _execute(cursor, INSERT_VALUE_SQL, params)
+
+    _execute(cursor, COMPLETENESS_SQL)
+    _execute(cursor, HISTORY_SQL, params)
+
+    # derived data of changed Localities
+    _execute(cursor, CHANGES_SQL)
+    for (locality_id, _created, old_country_id, country_id,
+            old_x, old_y, x, y) in cursor.fetchall():
+        if _created:
+            cluster_queue.add((x, y))
+        elif (old_x, old_y) != (x, y):
+            cluster_queue.add((old_x, old_y), (x, y))
+
+        index_queue.add(locality_id)
+        statistics_queue.add(old_country_id, country_id)
+
+    LOG.info(
+        'Created %s and updated %s localities, %s duplicated rows',
+        created, modified, duplicated
+    )
+
+    return created, modified, duplicated
+
+
+def bulk_diff(parsed_data, domain, mode):
+    """
+    Compare parsed rows of a CSVImporter to existing Localities, without
+    changing them, must be called in a transaction
+
+    Returns statuses of rows (created, modified, blanked or untouched), keyed
+    by upstream_id, and a list of changes (upstream_id, attribute, old data,
+    new data), a changed location is a change of the 'geom' attribute.
+    Blanked Localities have Values which are emptied in Replace mode (1)
+    """
+
+    if not parsed_data:
+        return {}, []
+
+    cursor = connection.cursor()
+    _stage(cursor, parsed_data)
+
+    _execute(cursor, DIFF_VALUE_DATA_SQL, {'domain': domain.pk})
+    _execute(cursor, DIFF_VALUES_SQL, {'replace': mode == 1})
+
+    changes = []
+    changed = set()
+    blanked = set()
+    for upstream_id, key, old_data, new_data in cursor.fetchall():
+        if new_data is None:
+            blanked.add(upstream_id)
+        changed.add(upstream_id)
+        changes.append((upstream_id, key, old_data or '', new_data or ''))
+
+    _execute(cursor, DIFF_LOCALITIES_SQL)
+
+    statuses = {}
+    for (upstream_id, created, moved,
+            old_x, old_y, x, y) in cursor.fetchall():
+        if created:
+            statuses[upstream_id] = 'created'
+        elif upstream_id in blanked:
+            statuses[upstream_id] = 'blanked'
+        elif moved or upstream_id in changed:
+            statuses[upstream_id] = 'modified'
+        else:
+            statuses[upstream_id] = 'untouched'
+
+        if moved:
+            changes.append((
+                upstream_id, 'geom',
+                '{} {}'.format(old_x, old_y), '{} {}'.format(x, y)
+            ))
+
+    return statuses, sorted(changes)
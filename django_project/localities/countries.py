@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import logging
+LOG = logging.getLogger(__name__)
+
+from collections import namedtuple
+
+from .models import Country
+from .utils import get_cache_version, new_cache_version
+
+# shared cache key of the current version of cached countries
+VERSION_KEY = 'country:version'
+
+# in-process caches of CountryName objects, keyed by lowercase names, and of
+# prepared country geometries, keyed by pk
+_countries = {}
+_geometries = {}
+_countries_version = None
+
+CountryName = namedtuple('CountryName', ['pk', 'name'])
+
+
+def invalidate_countries():
+    """
+    Invalidate cached country names and geometries of every process
+    """
+
+    new_cache_version(VERSION_KEY)
+
+
+def _check_version():
+    global _countries_version
+
+    version = get_cache_version(VERSION_KEY)
+
+    if _countries_version != version:
+        _countries.clear()
+        _geometries.clear()
+        _countries_version = version
+
+
+def get_country(name):
+    """
+    Get a CountryName (pk and name) by a case insensitive country name
+
+    Countries are cached in-process, so they are not looked up on every
+    request. Raises Country.DoesNotExist if the country does not exist
+    """
+
+    name = name.lower()
+    _check_version()
+
+    try:
+        return _countries[name]
+    except KeyError:
+        pass
+
+    pk, country_name = Country.objects.filter(
+        name__iexact=name
+    ).values_list('pk', 'name').get()
+
+    LOG.debug('Loaded country: %s', country_name)
+    _countries[name] = CountryName(pk, country_name)
+
+    return _countries[name]
+
+
+def get_country_geometry(pk):
+    """
+    Get a prepared geometry of a Country by its pk, for fast point in polygon
+    tests in Python
+
+    Geometries are cached in-process, only for Countries which are tested, so
+    a (usually huge) MultiPolygon is not loaded and parsed on every test.
+    Raises Country.DoesNotExist if the country does not exist
+    """
+
+    _check_version()
+
+    try:
+        return _geometries[pk]
+    except KeyError:
+        pass
+
+    geometry = Country.objects.values_list(
+        'polygon_geometry', flat=True
+    ).get(pk=pk)
+
+    LOG.debug('Loaded geometry of country: %s', pk)
+    _geometries[pk] = geometry.prepared
+
+    return _geometries[pk]
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+Fast reading of (gzip, bzip2 or zip compressed) CSV files
+
+Rows are parsed by the csv module from the encoded data, and decoded in
+batches, joining all cells of a batch with NUL characters (which can't appear
+in cells parsed by the csv module), so every batch is decoded by a single
+decode call
+"""
+import bz2
+import codecs
+import csv
+import gzip
+import io
+import itertools
+import zipfile
+
+# number of bytes used to detect an encoding
+SAMPLE_SIZE = 1024 * 1024
+
+# number of compressed bytes decompressed at once from bzip2 compressed files
+BZIP2_BLOCK_SIZE = 64 * 1024
+
+GZIP_MAGIC = '\x1f\x8b'
+BZIP2_MAGIC = 'BZh'
+ZIP_MAGIC = 'PK\x03\x04'
+
+# byte order marks, UTF-32 marks start with UTF-16 marks
+BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16')
+)
+
+# encodings tried, in order, for data without a byte order mark, every byte
+# is valid latin-1
+ENCODINGS = ('utf-8', 'cp1252', 'latin-1')
+
+# encodings which are not ASCII compatible, and are recoded to UTF-8 before
+# parsing
+WIDE_ENCODINGS = ('utf-16', 'utf-32')
+
+
+def get_compression(data_file):
+    """
+    Compression (gzip, bz2 or zip) of an open file, detected from its magic
+    number, or None for a plain file
+    """
+
+    data_file.seek(0)
+    magic = data_file.read(4)
+    data_file.seek(0)
+
+    if magic.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if magic.startswith(BZIP2_MAGIC):
+        return 'bz2'
+    if magic == ZIP_MAGIC:
+        return 'zip'
+
+    return None
+
+
+def _zip_member(archive):
+    """
+    The only file of a zip archive
+    """
+
+    members = [
+        info for info in archive.infolist()
+        if not info.filename.endswith('/')
+    ]
+    if len(members) != 1:
+        raise IOError(
+            'Zip archive should contain a single file, found {}'
+            .format(len(members))
+        )
+
+    return members[0]
+
+
+def check_data(data_file):
+    """
+    Check that an open (uploaded) file is a plain or a compressed file which
+    can be read by *open_data*, raises IOError otherwise
+    """
+
+    if get_compression(data_file) == 'zip':
+        try:
+            _zip_member(zipfile.ZipFile(data_file))
+        except zipfile.BadZipfile as e:
+            raise IOError(str(e))
+        finally:
+            data_file.seek(0)
+
+
+class _BZ2Stream(io.RawIOBase):
+    """
+    Decompressed data of a bzip2 compressed file object, unlike *BZ2File*,
+    the compressed data is read from the file object, so its position is
+    known
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.decompressor = bz2.BZ2Decompressor()
+        self.buffer = ''
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.buffer:
+            data = self.fileobj.read(BZIP2_BLOCK_SIZE)
+            if not data:
+                return 0
+            try:
+                self.buffer = self.decompressor.decompress(data)
+            except EOFError:
+                # data after the end of the stream is ignored
+                return 0
+
+        size = min(len(b), len(self.buffer))
+        b[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+
+        return size
+
+
+class DataFile(object):
+    """
+    A (decompressed) data file, *position* is the number of bytes read from
+    the (compressed) file on disk, which can be compared to its size
+    """
+
+    def __init__(self, data, raw):
+        self.data = data
+        self.raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self.data, name)
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def position(self):
+        return self.raw.tell()
+
+    def close(self):
+        self.data.close()
+        self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_data(filename):
+    """
+    Open a plain, gzip, bzip2 or zip compressed CSV file for reading, as a
+    DataFile, compressed files are decompressed while they are read, without
+    writing the decompressed data
+
+    A zip archive should contain a single CSV file
+    """
+
+    raw = open(filename, 'rb')
+
+    try:
+        compression = get_compression(raw)
+
+        if compression == 'gzip':
+            return DataFile(gzip.GzipFile(fileobj=raw, mode='rb'), raw)
+
+        if compression == 'bz2':
+            return DataFile(io.BufferedReader(_BZ2Stream(raw)), raw)
+
+        if compression == 'zip':
+            archive = zipfile.ZipFile(raw)
+            try:
+                # the member reads from the (not closed) raw file
+                return DataFile(archive.open(_zip_member(archive)), raw)
+            finally:
+                archive.close()
+    except Exception:
+        raw.close()
+        raise
+
+    return DataFile(raw, raw)
+
+
+def detect_encoding(filename):
+    """
+    Detect encoding of a CSV file from its byte order mark, or the first
+    encoding which decodes the first *SAMPLE_SIZE* bytes
+    """
+
+    with open_data(filename) as data_file:
+        sample = data_file.read(SAMPLE_SIZE)
+
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding
+
+    for encoding in ENCODINGS:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            # the sample can end in the middle of a character
+            decoder.decode(sample, final=False)
+        except UnicodeDecodeError:
+            continue
+
+        return encoding
+
+
+class DictReader(object):
+    """
+    A CSV reader which iterates over rows of a CSV file object *f*, as dicts
+    of unicode cells keyed by the header
+
+    Rows are decoded in batches of *batch_size* rows, which can be read
+    directly using *batches*. Empty rows are skipped, like by
+    *csv.DictReader*
+    """
+
+    def __init__(
+            self, f, delimiter=',', encoding='utf-8', batch_size=1000):
+        self.batch_size = batch_size
+
+        if encoding in WIDE_ENCODINGS:
+            f = (
+                line.encode('utf-8') for line in codecs.getreader(encoding)(f)
+            )
+            encoding = 'utf-8'
+        elif encoding == 'utf-8-sig':
+            f = self._strip_bom(f)
+            encoding = 'utf-8'
+        self.encoding = encoding
+
+        self.reader = csv.reader(f, delimiter=delimiter)
+        self.header = self._decode_rows([self.reader.next()])[0]
+
+    @staticmethod
+    def _strip_bom(f):
+        lines = iter(f)
+        first = next(lines, '')
+
+        return itertools.chain([first[len(codecs.BOM_UTF8):]], lines)
+
+    def _decode_rows(self, rows):
+        cells = '\x00'.join(
+            cell for row in rows for cell in row
+        ).decode(self.encoding).split(u'\x00')
+
+        decoded = []
+        offset = 0
+        for row in rows:
+            decoded.append(cells[offset:offset + len(row)])
+            offset += len(row)
+
+        return decoded
+
+    def batches(self):
+        """
+        Iterate over lists of at most *batch_size* rows
+        """
+
+        header = self.header
+
+        while True:
+            rows = list(itertools.islice(self.reader, self.batch_size))
+            if not rows:
+                return
+
+            rows = [row for row in rows if row]
+            if rows:
+                yield [
+                    dict(itertools.izip(header, row))
+                    for row in self._decode_rows(rows)
+                ]
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.batches())
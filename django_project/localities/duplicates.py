@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import logging
+LOG = logging.getLogger(__name__)
+
+import difflib
+import math
+
+from django.db import connection
+
+from .models import Attribute, Locality, Specification, Value
+
+# key of the Attribute compared by name similarity
+NAME_KEY = 'name'
+
+LOCALITIES_SQL = """
+SELECT ST_X(loc.geom), ST_Y(loc.geom), min(val.data)
+FROM {locality} AS loc
+LEFT JOIN {value} AS val
+    ON val.locality_id = loc.id AND val.specification_id IN (
+        SELECT spec.id FROM {specification} AS spec
+        JOIN {attribute} AS attr ON attr.id = spec.attribute_id
+        WHERE attr.key = %s
+    )
+GROUP BY loc.id
+"""
+
+
+class GridIndex(object):
+    """
+    Points (lng, lat) in square grid cells of size *delta*
+
+    Points within *delta* of a point are in the 3x3 cells around its cell, so
+    a lookup checks a constant number of cells
+    """
+
+    def __init__(self, delta):
+        self.delta = delta
+        self.cells = {}
+
+    def _cell(self, x, y):
+        return int(math.floor(x / self.delta)), int(math.floor(y / self.delta))
+
+    def add(self, x, y, item=None):
+        self.cells.setdefault(self._cell(x, y), []).append((x, y, item))
+
+    def nearby(self, x, y):
+        """
+        Items of points within the envelope of *delta* around a point
+        """
+
+        cell_x, cell_y = self._cell(x, y)
+
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for p_x, p_y, item in self.cells.get(
+                        (cell_x + dx, cell_y + dy), ()):
+                    if (abs(p_x - x) < self.delta and
+                            abs(p_y - y) < self.delta):
+                        yield item
+
+
+class DuplicateDetector(object):
+    """
+    Find possible duplicates of new Localities, existing Localities and
+    Localities added to the detector, within *delta* degrees
+
+    Coordinates (and names) of existing Localities are loaded once, on the
+    first lookup. If *name_similarity* (0 - 1) is set, only Localities with
+    similar names are duplicates, Localities without names are not similar
+    to any Locality
+    """
+
+    def __init__(self, delta, name_similarity=None):
+        self.index = GridIndex(delta)
+        self.name_similarity = name_similarity
+        self.loaded = False
+
+    def _load(self):
+        cursor = connection.cursor()
+        cursor.execute(LOCALITIES_SQL.format(
+            locality=Locality._meta.db_table,
+            value=Value._meta.db_table,
+            specification=Specification._meta.db_table,
+            attribute=Attribute._meta.db_table
+        ), [NAME_KEY])
+
+        count = 0
+        for x, y, name in cursor:
+            self.index.add(x, y, name)
+            count += 1
+
+        LOG.debug('Loaded %s localities to find duplicates', count)
+        self.loaded = True
+
+    def _similar(self, name, other_name):
+        if not self.name_similarity:
+            return True
+        if not name or not other_name:
+            return False
+
+        ratio = difflib.SequenceMatcher(
+            None, name.lower(), other_name.lower()
+        ).ratio()
+
+        return ratio >= self.name_similarity
+
+    def is_duplicate(self, x, y, name=None):
+        if not self.loaded:
+            self._load()
+
+        return any(
+            self._similar(name, other_name)
+            for other_name in self.index.nearby(x, y)
+        )
+
+    def add(self, x, y, name=None):
+        """
+        Add a new Locality, so it's found as a duplicate of later Localities
+        """
+
+        self.index.add(x, y, name)
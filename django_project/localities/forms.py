@@ -6,7 +6,9 @@ LOG = logging.getLogger(__name__)
 import django.forms as forms
 from django.forms import models
 
+from .csv_reader import check_data
 from .models import Domain, DataLoader
+from .registry import get_schema
 from .utils import render_fragment
 
 
@@ -50,11 +52,9 @@ class DomainForm(forms.Form):
         super(DomainForm, self).__init__(*args, **kwargs)
 
         # populate form with attribute specifications
-        for spec in domain.specification_set.select_related('attribute'):
-            field = forms.CharField(
-                label=spec.attribute.key, required=spec.required
-            )
-            self.fields[spec.attribute.key] = field
+        for spec in get_schema().domain(domain.pk).specifications:
+            field = forms.CharField(label=spec.key, required=spec.required)
+            self.fields[spec.key] = field
 
 
 class LocalityForm(forms.Form):
@@ -76,11 +76,14 @@ class LocalityForm(forms.Form):
             'lon': locality.geom.x, 'lat': locality.geom.y
         }
 
+        schema = get_schema()
+
         # Locality forms are special as they automatically collect initial data
         # based on the actual models
-        for value in locality.value_set.select_related('specification').all():
+        for spec_id, data in locality.value_set.values_list(
+                'specification_id', 'data'):
             tmp_initial_data.update({
-                value.specification.attribute.key: value.data
+                schema.specification(spec_id).key: data
             })
 
         # set initial form data
@@ -88,13 +91,10 @@ class LocalityForm(forms.Form):
 
         super(LocalityForm, self).__init__(*args, **kwargs)
 
-        for spec in (
-                locality.domain.specification_set.select_related('attribute')):
-            field = forms.CharField(
-                label=spec.attribute.key, required=spec.required
-            )
-            self.fields[spec.attribute.key] = field
-            self.fields[spec.attribute.key].widget.attrs.update(
+        for spec in schema.domain(locality.domain_id).specifications:
+            field = forms.CharField(label=spec.key, required=spec.required)
+            self.fields[spec.key] = field
+            self.fields[spec.key].widget.attrs.update(
                 {'class': 'form-control'})
 
 
@@ -109,6 +109,7 @@ class DataLoaderForm(models.ModelForm):
             'json_concept_mapping',
             'csv_data',
             'data_loader_mode',
+            'dry_run',
         )
 
     organisation_name = forms.CharField(
@@ -123,7 +124,14 @@ class DataLoaderForm(models.ModelForm):
 
     csv_data = forms.FileField(
         widget=forms.FileInput(
-            attrs={'class': 'form-control'})
+            attrs={
+                'class': 'form-control',
+                'accept': '.csv,.tsv,.txt,.gz,.bz2,.zip'
+            }),
+        help_text=(
+            'CSV data, optionally compressed (gzip, bzip2 or a zip archive '
+            'of a single CSV file).'
+        )
     )
 
     data_loader_mode = forms.ChoiceField(
@@ -133,10 +141,26 @@ class DataLoaderForm(models.ModelForm):
         initial=DataLoader.REPLACE_DATA_CODE,
     )
 
+    dry_run = forms.BooleanField(
+        label='Dry run (only report changes)',
+        required=False
+    )
+
     def __init__(self, *args, **kwargs):
         self.user = kwargs.pop('user', None)
         super(DataLoaderForm, self).__init__(*args, **kwargs)
 
+    def clean_csv_data(self):
+        """Check that CSV data is a plain or a supported compressed file.
+        """
+        csv_data = self.cleaned_data['csv_data']
+        try:
+            check_data(csv_data)
+        except IOError as e:
+            raise forms.ValidationError(
+                'Unsupported CSV data: {}'.format(e))
+        return csv_data
+
     def save(self, commit=True):
         """Save method.
         """
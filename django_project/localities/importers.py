@@ -3,18 +3,95 @@ import logging
 
 LOG = logging.getLogger(__name__)
 
+import csv
+import itertools
 import uuid
 import json
+import os
+import zlib
+from cStringIO import StringIO
 
 from django.contrib.gis.geos import Point, Polygon
 from django.db import transaction
+from django.db.models import Q
 from django.contrib.auth import get_user_model
 
 from .models import Locality, Domain, Changeset
 
+from .archive import archive_queue
+from .batching import batch
+from .duplicates import DuplicateDetector, NAME_KEY
+from .invalidation import cluster_queue, index_queue, statistics_queue
 from .exceptions import LocalityImportError
+from .progress import ImportProgress
+from .csv_reader import DictReader, detect_encoding, open_data
 
-from ._csv_unicode import UnicodeDictReader
+
+def generate_report(counts, exception=None):
+    """Generate report of an import process from counts of localities and
+    an optional exception
+    """
+    report = 'Report\n\n'
+    total = 0
+    for i, key in enumerate(sorted(counts.iterkeys())):
+        total += counts[key]
+    for i, key in enumerate(sorted(counts.iterkeys())):
+        if total > 0:
+            percentage = 100.0 * counts[key] / total
+        else:
+            percentage = 0
+        report += ('%s. Number of %s locality is %s (%.2f %%).\n' % (
+            i + 1, key, counts[key], percentage))
+
+    if exception:
+        report += 'Notes:\n'
+        report += '{}\n'.format(exception)
+
+    return report
+
+
+class DiffReport(object):
+    """
+    Changes of localities found by a dry run of an import, see
+    *bulk_import.bulk_diff*
+    """
+
+    HEADER = ('upstream_id', 'status', 'attribute', 'old', 'new')
+
+    def __init__(self):
+        self.counts = {
+            'created': 0,
+            'modified': 0,
+            'blanked': 0,
+            'untouched': 0
+        }
+        self.rows = []
+
+    def add(self, statuses, changes):
+        for status in statuses.itervalues():
+            self.counts[status] += 1
+
+        for upstream_id, attribute, old_data, new_data in changes:
+            self.rows.append((
+                upstream_id, statuses[upstream_id], attribute, old_data,
+                new_data
+            ))
+
+    def to_csv(self):
+        """
+        Changes as a (UTF-8 encoded) CSV document
+        """
+
+        data = StringIO()
+        writer = csv.writer(data)
+        writer.writerow(self.HEADER)
+        for row in self.rows:
+            writer.writerow([
+                val.encode('utf-8') if isinstance(val, unicode) else val
+                for val in row
+            ])
+
+        return data.getvalue()
 
 
 class CSVImporter:
@@ -26,16 +103,47 @@ class CSVImporter:
     * name of the source - used to distinguish upstream_ids
     * csv filename
     * attribute mapping file (JSON) - maps csv column names to specifications
+
+    If *partition* (index, count) is set, only rows with a hash of their
+    upstream_id in the partition are imported, so partitions of a file can be
+    imported in parallel without conflicts
+
+    If *chunk_size* is set, rows are read, validated and saved in chunks of
+    *chunk_size* rows, every chunk in its own transaction, so memory use does
+    not depend on the size of the file. With *checkpoint*, every committed
+    chunk is recorded on the (saved) DataLoader and an interrupted import of
+    the DataLoader continues after the last committed chunk
+
+    Progress of an import of a saved DataLoader is published while it runs,
+    see *progress.get_progress*
+
+    With *detect_duplicates*, new rows within *delta* degrees of an existing
+    Locality or of another new row (in the same partition), and optionally
+    with a name similarity of at least *name_similarity*, are not imported
+    and are reported as duplicated
+
+    A *dry_run* doesn't change any data, rows are compared to existing
+    Localities and their changes are collected in a DiffReport (*diff*)
     """
 
     def __init__(
             self, data_loader, domain_name, source_name, csv_filename, attr_json_file,
-            use_tabs=False, user=None, mode=1):
+            use_tabs=False, user=None, mode=1, chunk_size=None,
+            checkpoint=False, partition=None, changeset=None,
+            detect_duplicates=False, name_similarity=None, dry_run=False):
         self.data_loader = data_loader
         self.domain_name = domain_name
         self.source_name = source_name
         self.csv_filename = csv_filename
         self.parsed_data = {}
+        # upstream_ids of already saved chunks, used to find duplicated rows
+        self.saved_upstream_ids = set()
+        self.chunk_size = chunk_size
+        self.checkpoint = checkpoint
+        self.partition = partition
+        self.dry_run = dry_run
+        self.diff = DiffReport() if dry_run else None
+        self.changeset = changeset
         # Mode
         # 1 : Replace Data
         # 2 : Update Data
@@ -50,6 +158,11 @@ class CSVImporter:
         self.use_tabs = use_tabs
         self.delta = 0.01
 
+        if detect_duplicates:
+            self.duplicates = DuplicateDetector(self.delta, name_similarity)
+        else:
+            self.duplicates = None
+
         with open(attr_json_file, 'rb') as attr_map_file:
             self.attr_map = json.load(attr_map_file)
 
@@ -60,6 +173,8 @@ class CSVImporter:
             'skipped': 0
         }
         self.exception = None
+        self.progress = None
+        self.csv_file = None
 
         # import
         self._get_domain()
@@ -131,6 +246,13 @@ class CSVImporter:
         except ValueError:
             return None
 
+    def _in_partition(self, gen_upstream_id):
+        index, count = self.partition
+        # crc32 is the same in every process, unlike hash()
+        checksum = zlib.crc32(gen_upstream_id.encode('utf-8')) & 0xffffffff
+
+        return checksum % count == index
+
     def parse_row(self, row_num, row_data):
         """
         Parse row of data and add it to the *parsed_data* dictionary
@@ -147,7 +269,12 @@ class CSVImporter:
 
         gen_upstream_id = u'{}¶{}'.format(self.source_name, row_upstream_id)
 
-        if gen_upstream_id in self.parsed_data:
+        if self.partition and not self._in_partition(gen_upstream_id):
+            # row is imported with another partition
+            return None
+
+        if (gen_upstream_id in self.parsed_data or
+                gen_upstream_id in self.saved_upstream_ids):
             LOG.error(
                     'Row %s with upstream_id: %s already exists, skipping...',
                     row_num, gen_upstream_id
@@ -189,8 +316,14 @@ class CSVImporter:
         Save every locality in the parsed_data dictionary
         """
 
-        # generate a new changeset id
-        tmp_changeset = Changeset.objects.create(social_user=self.user)
+        if self.dry_run:
+            self.diff_localities()
+            return
+
+        # generate a new changeset id, shared by all chunks of the file
+        if not self.changeset:
+            self.changeset = Changeset.objects.create(social_user=self.user)
+        tmp_changeset = self.changeset
 
         for gen_upstream_id, values in self.parsed_data.iteritems():
             row_uuid = values['uuid']
@@ -198,16 +331,9 @@ class CSVImporter:
 
             if _created:
                 # finding duplication
-                # loc_geom = Point(*values['geom'])
-                # loc_envelope = self.envelope(loc_geom.x, loc_geom.y)
-                # duplicate_localities = Locality.objects.filter(
-                #     geom__within=loc_envelope)
-                #
-                # if len(duplicate_localities) > 0:
-                #     LOG.info('Possible duplicate %s (%s) at (%s, %s)',
-                #              loc.uuid, loc.id, loc_geom.x, loc_geom.y)
-                #     self.report['duplicated'] += 1
-                #     continue
+                if self._is_duplicate(values):
+                    self.report['duplicated'] += 1
+                    continue
 
                 loc.changeset = tmp_changeset
                 loc.domain = self.domain
@@ -261,6 +387,82 @@ class CSVImporter:
 
             loc.update_history(self.data_loader.date_time_uploaded, self.data_loader.data_loader_mode, self.user);
 
+    def _is_duplicate(self, values):
+        """
+        Check whether a new row is a possible duplicate, rows which are not
+        duplicates are added to the duplicate detector
+        """
+
+        if not self.duplicates:
+            return False
+
+        x, y = values['geom']
+        name = values['values'].get(NAME_KEY)
+
+        if self.duplicates.is_duplicate(x, y, name):
+            LOG.info(
+                'Possible duplicate %s at (%s, %s)',
+                values['upstream_id'], x, y
+            )
+            return True
+
+        self.duplicates.add(x, y, name)
+        return False
+
+    def _exclude_duplicates(self, parsed_data):
+        """
+        Parsed rows without new rows which are possible duplicates
+        """
+
+        uuids = set(
+            row['uuid'] for row in parsed_data.itervalues()
+        ) - {None, ''}
+        existing = Locality.objects.filter(
+            Q(upstream_id__in=parsed_data.keys()) | Q(uuid__in=uuids)
+        ).values_list('uuid', 'upstream_id')
+
+        existing_uuids = set()
+        existing_upstream_ids = set()
+        for row_uuid, upstream_id in existing:
+            existing_uuids.add(row_uuid)
+            existing_upstream_ids.add(upstream_id)
+
+        result = {}
+        for gen_upstream_id, values in parsed_data.iteritems():
+            created = (
+                values['uuid'] not in existing_uuids and
+                gen_upstream_id not in existing_upstream_ids
+            )
+            if created and self._is_duplicate(values):
+                self.report['duplicated'] += 1
+                continue
+
+            result[gen_upstream_id] = values
+
+        return result
+
+    def diff_localities(self):
+        """
+        Compare every locality in the parsed_data dictionary to existing
+        localities, without saving them
+        """
+
+        # Put here to avoid circular import
+        from .bulk_import import bulk_diff
+
+        parsed_data = self.parsed_data
+        if self.duplicates:
+            parsed_data = self._exclude_duplicates(parsed_data)
+
+        statuses, changes = bulk_diff(parsed_data, self.domain, self.mode)
+        self.diff.add(statuses, changes)
+
+        for status in statuses.itervalues():
+            if status == 'created':
+                self.report['created'] += 1
+            else:
+                self.report['modified'] += 1
+
     def envelope(self, lon, lat):
         """Return polygon envelope for point (lon, lat)
         """
@@ -275,44 +477,213 @@ class CSVImporter:
 
     def parse_file(self):
         """
-        Open a file and parse rows
+        Open a (gzip or zip compressed) file and parse rows
 
         All modifications to the database are going to be executed as a single
-        transaction to minimize inconsistent database state
+        transaction to minimize inconsistent database state, unless the file
+        is imported in chunks
         """
 
         try:
-            with open(self.csv_filename, 'rb') as csv_file:
+            self._start_progress()
+
+            encoding = detect_encoding(self.csv_filename)
+            with open_data(self.csv_filename) as csv_file:
+                # the position in the file is published as progress
+                self.csv_file = csv_file
                 if self.use_tabs:
-                    data_file = UnicodeDictReader(csv_file, delimiter='\t')
+                    data_file = DictReader(
+                        csv_file, delimiter='\t', encoding=encoding
+                    )
                 else:
-                    data_file = UnicodeDictReader(csv_file)
+                    data_file = DictReader(csv_file, encoding=encoding)
+
+                if self.chunk_size:
+                    self.parse_chunks(data_file)
+                    return
 
-                with transaction.atomic():
-                    for r_num, r_data in enumerate(data_file):
-                        self.parse_row(r_num, r_data)
+                rows = 0
+                for r_num, r_data in enumerate(data_file):
+                    self.parse_row(r_num, r_data)
+                    rows += 1
+                self._update_progress(rows_parsed=rows)
+
+                # invalidate clusters once, after the import is committed,
+                # and archive changes in bulk, before the commit
+                with batch(), transaction.atomic(), batch(archive_queue):
                     # save localities to the database
                     self.save_localities()
+                self._update_progress(rows_saved=rows)
         except EnvironmentError as e:
             self.exception = e
+        finally:
+            self.csv_file = None
+
+    def parse_chunks(self, data_file):
+        """
+        Parse and save rows in chunks of *chunk_size* rows, every chunk is
+        saved in its own transaction
+
+        Clusters, the LocalityIndex and statistics are refreshed once, after
+        the last chunk
+        """
+
+        rows = enumerate(data_file)
+        row_offset = 0
+
+        if self.checkpoint:
+            row_offset = self._restore_checkpoint(rows)
+            self._update_progress(
+                rows_parsed=row_offset, rows_saved=row_offset
+            )
+
+        with batch(cluster_queue, index_queue, statistics_queue):
+            while True:
+                chunk = list(itertools.islice(rows, self.chunk_size))
+                if not chunk:
+                    break
+
+                row_offset += len(chunk)
+
+                # rows are parsed before the transaction, so the progress is
+                # visible to other processes
+                for r_num, r_data in chunk:
+                    self.parse_row(r_num, r_data)
+                self._update_progress(rows_parsed=row_offset)
+
+                with batch(), transaction.atomic(), batch(archive_queue):
+                    self.save_localities()
+
+                    if self.checkpoint:
+                        self._save_checkpoint(row_offset)
+
+                self._update_progress(rows_saved=row_offset)
+
+                LOG.info(
+                    'Saved chunk of %s rows (%s localities)',
+                    len(chunk), len(self.parsed_data)
+                )
+
+                self.saved_upstream_ids.update(self.parsed_data)
+                self.parsed_data = {}
+
+    def _start_progress(self):
+        """
+        Start publishing progress of an import of a saved DataLoader
+        """
+
+        if self.data_loader.pk is None:
+            return
+
+        partition = self.partition[0] if self.partition else 0
+        self.progress = ImportProgress(
+            self.data_loader.pk, os.path.getsize(self.csv_filename), partition
+        )
+
+    def _update_progress(self, **kwargs):
+        if self.progress:
+            if self.csv_file is not None:
+                kwargs['bytes_read'] = self.csv_file.position()
+            self.progress.update(**kwargs)
+
+    def _save_checkpoint(self, row_offset):
+        """
+        Record the number of imported rows, the report and the changeset on
+        the DataLoader
+        """
+
+        # Put here to avoid circular import
+        from .models import DataLoader
+
+        # update, as saving a DataLoader triggers loading of its data
+        DataLoader.objects.filter(pk=self.data_loader.pk).update(
+            checkpoint_row=row_offset,
+            checkpoint_report=json.dumps(self.report),
+            checkpoint_changeset=self.changeset
+        )
+
+    def _restore_checkpoint(self, rows):
+        """
+        Restore the report and the changeset of an interrupted import, and
+        skip rows which are already imported
+
+        Skipped rows are parsed, but not saved, to find duplicated rows in
+        the rest of the file. Returns the number of skipped rows
+        """
+
+        # Put here to avoid circular import
+        from .models import DataLoader
+
+        data_loader = DataLoader.objects.get(pk=self.data_loader.pk)
+        row_offset = data_loader.checkpoint_row
+
+        if not row_offset:
+            return 0
+
+        LOG.info('Resuming import after row %s', row_offset)
+
+        skipped = 0
+        while skipped < row_offset:
+            chunk = list(itertools.islice(
+                rows, min(self.chunk_size, row_offset - skipped)
+            ))
+            if not chunk:
+                break
+
+            for r_num, r_data in chunk:
+                self.parse_row(r_num, r_data)
+
+            skipped += len(chunk)
+            self.saved_upstream_ids.update(self.parsed_data)
+            self.parsed_data = {}
+
+        # counts of skipped rows are a part of the restored report
+        self.report = json.loads(data_loader.checkpoint_report)
+        self.changeset = data_loader.checkpoint_changeset
+
+        return skipped
 
     def generate_report(self):
         """Generate report for the import process
         """
-        report = 'Report\n\n'
-        total = 0
-        for i, key in enumerate(sorted(self.report.iterkeys())):
-            total += self.report[key]
-        for i, key in enumerate(sorted(self.report.iterkeys())):
-            if total > 0:
-                percentage = 100.0 * self.report[key] / total
-            else:
-                percentage = 0
-            report += ('%s. Number of %s locality is %s (%.2f %%).\n' % (
-                i + 1, key, self.report[key], percentage))
+        return generate_report(self.report, self.exception)
+
 
-        if self.exception:
-            report += 'Notes:\n'
-            report += self.exception
+class BulkCSVImporter(CSVImporter):
+    """
+    CSV based importer which saves parsed rows using set based queries,
+    instead of saving every Locality and its Values separately
+
+    Rows are copied into staging tables and matched to existing Localities
+    by uuid or upstream_id, see *bulk_import.bulk_save*
+    """
+
+    def save_localities(self):
+        """
+        Save every locality in the parsed_data dictionary
+        """
+
+        if self.dry_run:
+            self.diff_localities()
+            return
+
+        # Put here to avoid circular import
+        from .bulk_import import bulk_save
+
+        # generate a new changeset id, shared by all chunks of the file
+        if not self.changeset:
+            self.changeset = Changeset.objects.create(social_user=self.user)
+
+        parsed_data = self.parsed_data
+        if self.duplicates:
+            parsed_data = self._exclude_duplicates(parsed_data)
+
+        created, modified, duplicated = bulk_save(
+            parsed_data, self.domain, self.changeset, self.user,
+            self.mode, self.data_loader.date_time_uploaded,
+            self.data_loader.data_loader_mode
+        )
 
-        return report
+        self.report['created'] += created
+        self.report['modified'] += modified
+        self.report['duplicated'] += duplicated
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import logging
+LOG = logging.getLogger(__name__)
+
+from django.db import connection, transaction
+
+from .models import Locality, LocalityIndex, Specification, Value
+
+# data of Values of Localities, grouped by FTS ranks of their Specifications
+RANKED_VALUES_SQL = """
+SELECT
+    loc.id AS locality_id,
+    coalesce(string_agg(CASE WHEN spec.fts_rank = 'A' THEN val.data END, ' '
+        ORDER BY val.id), '') AS ranka,
+    coalesce(string_agg(CASE WHEN spec.fts_rank = 'B' THEN val.data END, ' '
+        ORDER BY val.id), '') AS rankb,
+    coalesce(string_agg(CASE WHEN spec.fts_rank = 'C' THEN val.data END, ' '
+        ORDER BY val.id), '') AS rankc,
+    coalesce(string_agg(CASE WHEN spec.fts_rank = 'D' THEN val.data END, ' '
+        ORDER BY val.id), '') AS rankd
+FROM {locality} AS loc
+LEFT JOIN {value} AS val ON val.locality_id = loc.id
+LEFT JOIN {specification} AS spec ON spec.id = val.specification_id
+WHERE loc.id = ANY(%s)
+GROUP BY loc.id
+"""
+
+FTS_INDEX_SQL = """
+    setweight(to_tsvector('english', ranked.ranka), 'A') ||
+    setweight(to_tsvector('english', ranked.rankb), 'B') ||
+    setweight(to_tsvector('english', ranked.rankc), 'C') ||
+    setweight(to_tsvector('english', ranked.rankd), 'D')
+"""
+
+UPDATE_INDEX_SQL = """
+UPDATE {index} AS idx SET
+    ranka = ranked.ranka,
+    rankb = ranked.rankb,
+    rankc = ranked.rankc,
+    rankd = ranked.rankd,
+    fts_index = {fts_index}
+FROM ({ranked_values}) AS ranked
+WHERE idx.locality_id = ranked.locality_id
+"""
+
+INSERT_INDEX_SQL = """
+INSERT INTO {index} (locality_id, ranka, rankb, rankc, rankd, fts_index)
+SELECT
+    ranked.locality_id, ranked.ranka, ranked.rankb, ranked.rankc,
+    ranked.rankd, {fts_index}
+FROM ({ranked_values}) AS ranked
+WHERE NOT EXISTS (
+    SELECT 1 FROM {index} AS idx WHERE idx.locality_id = ranked.locality_id
+)
+"""
+
+
+def _format(sql):
+    return sql.format(
+        index=LocalityIndex._meta.db_table,
+        fts_index=FTS_INDEX_SQL,
+        ranked_values=RANKED_VALUES_SQL.format(
+            locality=Locality._meta.db_table,
+            value=Value._meta.db_table,
+            specification=Specification._meta.db_table
+        )
+    )
+
+
+def rebuild_locality_index(locality_ids):
+    """
+    Rebuild LocalityIndex rows, and their FTS vectors, of Localities using
+    two bulk queries
+    """
+
+    locality_ids = sorted(set(locality_ids))
+
+    if not locality_ids:
+        return
+
+    LOG.debug('Rebuilding LocalityIndex for %s localities', len(locality_ids))
+
+    with transaction.atomic():
+        cursor = connection.cursor()
+        cursor.execute(_format(UPDATE_INDEX_SQL), [locality_ids])
+        cursor.execute(_format(INSERT_INDEX_SQL), [locality_ids])
+
+
+def locality_id_chunks(chunk_size):
+    """
+    Ids of all Localities in chunks of *chunk_size*, ordered by id
+    """
+
+    last_id = None
+
+    while True:
+        localities = Locality.objects.order_by('id')
+        if last_id is not None:
+            localities = localities.filter(id__gt=last_id)
+
+        chunk = list(localities.values_list('id', flat=True)[:chunk_size])
+        if not chunk:
+            return
+
+        yield chunk
+
+        last_id = chunk[-1]
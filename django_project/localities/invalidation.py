@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+import logging
+LOG = logging.getLogger(__name__)
+
+from django.conf import settings
+
+from .batching import DeferredQueue
+from .map_clustering import cell_index, cell_tiles
+from .utils import shared_cache
+
+
+def invalidate_clusters(points):
+    """
+    Refresh cluster pyramid cells and remove cached tiles affected by a
+    sequence of changed Locality points (lng, lat)
+
+    Only cells which contain the points are reclustered, unless a level has
+    more than *CLUSTER_INVALIDATION_MAX_CELLS* affected cells, in which case
+    the whole level is rebuilt and the tile cache is cleared
+    """
+
+    # Put here to avoid circular import
+    from .pyramid import (
+        build_pyramid_level,
+        pyramid_level_exists,
+        refresh_pyramid_cells
+    )
+    from .tiles import (
+        tile_cache,
+        tile_cache_key,
+        TILE_FORMATS,
+        TILE_ZOOM_LEVELS
+    )
+
+    points = set(points)
+    max_cells = settings.CLUSTER_INVALIDATION_MAX_CELLS
+
+    cache_keys = set()
+    clear_tiles = False
+
+    for pix_x, pix_y in settings.CLUSTER_PYRAMID_ICON_SIZES:
+        zoom_levels = set(TILE_ZOOM_LEVELS)
+        zoom_levels.update(settings.CLUSTER_PYRAMID_ZOOM_LEVELS)
+
+        for zoom in sorted(zoom_levels):
+            cells = set(
+                cell_index(lng, lat, zoom, pix_x, pix_y) for lng, lat in points
+            )
+
+            if (zoom in settings.CLUSTER_PYRAMID_ZOOM_LEVELS and
+                    pyramid_level_exists(zoom, pix_x, pix_y)):
+                if len(cells) > max_cells:
+                    build_pyramid_level(zoom, pix_x, pix_y)
+                else:
+                    refresh_pyramid_cells(zoom, pix_x, pix_y, cells)
+
+            if len(cells) > max_cells:
+                clear_tiles = True
+            elif not clear_tiles:
+                cache_keys.update(
+                    tile_cache_key(
+                        zoom, tile_x, tile_y, pix_x, pix_y,
+                        tile_format=tile_format
+                    )
+                    for cell in cells
+                    for tile_x, tile_y in cell_tiles(cell, zoom, pix_x, pix_y)
+                    for tile_format in TILE_FORMATS
+                )
+
+    if clear_tiles:
+        LOG.info('Clearing the tile cache')
+        tile_cache().clear()
+    else:
+        LOG.debug('Removing %s tiles from the tile cache', len(cache_keys))
+        tile_cache().delete_many(cache_keys)
+
+
+def dispatch_cluster_invalidation(points):
+    """
+    Refresh cluster pyramid cells and cached tiles of changed Locality points
+    in a Celery task, so low zoom cells, which cover a large part of the
+    world, are never reclustered within a request
+    """
+
+    # Put here to avoid circular import
+    from .tasks import invalidate_clusters_task
+
+    invalidate_clusters_task.delay(sorted(set(points)))
+
+
+# changed Locality points (lng, lat), coalesced while a batch is open
+cluster_queue = DeferredQueue(dispatch_cluster_invalidation)
+
+
+# shared cache key of a pending refresh of the statistic of a Country, or of
+# all Localities (None)
+STATISTICS_PENDING_KEY = 'statistics-refresh-pending:{}'
+
+# seconds after which a pending refresh which never ran (a lost task) doesn't
+# block refreshes any more
+STATISTICS_PENDING_TIMEOUT = 60 * 60
+
+
+def dispatch_statistics_refresh(country_ids):
+    """
+    Refresh stored statistics of all Localities and of Countries of changed
+    Localities, in a Celery task delayed by *STATISTICS_REFRESH_DELAY* seconds
+
+    Statistics which already have a pending refresh are not refreshed again,
+    so every statistic is recomputed at most once per delay, however many
+    Localities change
+    """
+
+    # Put here to avoid circular import
+    from .tasks import refresh_statistics_task
+
+    cache = shared_cache()
+    delay = settings.STATISTICS_REFRESH_DELAY
+
+    pending = [
+        country_id for country_id in sorted(set(country_ids) | set([None]))
+        if cache.add(
+            STATISTICS_PENDING_KEY.format(country_id), True,
+            delay + STATISTICS_PENDING_TIMEOUT
+        )
+    ]
+
+    if pending:
+        refresh_statistics_task.apply_async((pending,), countdown=delay)
+
+
+# Countries of changed Localities, coalesced while a batch is open
+statistics_queue = DeferredQueue(dispatch_statistics_refresh)
+
+
+def dispatch_locality_statistics_refresh(locality_ids):
+    """
+    Refresh statistics of changed Localities which are not loaded, their
+    Countries are looked up in a single query
+    """
+
+    # Put here to avoid circular import
+    from .models import Locality
+
+    statistics_queue.add(None, *Locality.objects.filter(
+        pk__in=set(locality_ids)
+    ).values_list('country_id', flat=True).distinct())
+
+
+# ids of changed Localities which are not loaded, coalesced while a batch is
+# open
+locality_statistics_queue = DeferredQueue(
+    dispatch_locality_statistics_refresh
+)
+
+
+# number of Localities of a LocalityIndex rebuild task
+INDEX_TASK_CHUNK_SIZE = 1000
+
+
+def dispatch_index_rebuild(locality_ids):
+    """
+    Rebuild LocalityIndex rows of changed Localities, in Celery tasks of
+    *INDEX_TASK_CHUNK_SIZE* Localities if there are more than
+    *LOCALITY_INDEX_TASK_THRESHOLD* of them
+    """
+
+    # Put here to avoid circular import
+    from .indexing import rebuild_locality_index
+    from .tasks import rebuild_locality_index_task
+
+    locality_ids = sorted(set(locality_ids))
+
+    if len(locality_ids) > settings.LOCALITY_INDEX_TASK_THRESHOLD:
+        for start in range(0, len(locality_ids), INDEX_TASK_CHUNK_SIZE):
+            rebuild_locality_index_task.delay(
+                locality_ids[start:start + INDEX_TASK_CHUNK_SIZE]
+            )
+    else:
+        rebuild_locality_index(locality_ids)
+
+
+# ids of Localities with changed values, coalesced while a batch is open
+index_queue = DeferredQueue(dispatch_index_rebuild)
+
+
+DOMAIN_COMPLETENESS_SQL = """
+UPDATE {locality} AS loc SET completeness = ((
+    SELECT count(*) FROM {value} AS val
+    WHERE val.locality_id = loc.id AND val.data IS NOT NULL AND val.data <> ''
+) + 1) * 100.0 / ((
+    SELECT count(*) FROM {specification} AS spec
+    WHERE spec.domain_id = loc.domain_id
+) + 1)
+WHERE loc.domain_id IN %s
+RETURNING loc.country_id
+"""
+
+
+def update_domain_completeness(domain_ids):
+    """
+    Recompute stored completeness of all Localities of Domains, after their
+    Specifications changed, and refresh statistics of affected Countries
+    """
+
+    # Put here to avoid circular import
+    from django.db import connection
+    from .models import Locality, Specification, Value
+
+    domain_ids = sorted(set(domain_ids) - set([None]))
+    if not domain_ids:
+        return
+
+    cursor = connection.cursor()
+    cursor.execute(DOMAIN_COMPLETENESS_SQL.format(
+        locality=Locality._meta.db_table,
+        value=Value._meta.db_table,
+        specification=Specification._meta.db_table
+    ), [tuple(domain_ids)])
+    country_ids = set(country_id for country_id, in cursor.fetchall())
+
+    LOG.info('Updated completeness of Domains %s', domain_ids)
+
+    # completeness is a part of statistics
+    if country_ids:
+        statistics_queue.add(*country_ids)
+
+
+def dispatch_completeness_update(domain_ids):
+    """
+    Recompute completeness of Localities of Domains with created or deleted
+    Specifications in a Celery task, as it updates whole Domains
+    """
+
+    # Put here to avoid circular import
+    from .tasks import update_domain_completeness_task
+
+    update_domain_completeness_task.delay(sorted(set(domain_ids)))
+
+
+# Domains with created or deleted Specifications, coalesced while a batch is
+# open
+completeness_queue = DeferredQueue(dispatch_completeness_update)
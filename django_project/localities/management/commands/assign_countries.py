@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from ...models import Locality
+
+
+class Command(BaseCommand):
+
+    help = 'Assign Localities to Countries which contain them'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--missing', action='store_true', dest='missing', default=False,
+            help='Only assign Localities without a Country'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        localities = Locality.objects.all()
+
+        if options['missing']:
+            localities = localities.filter(country__isnull=True)
+
+        updated = localities.assign_countries()
+
+        self.stdout.write('Assigned {} localities'.format(updated))
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import random
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from ...map_clustering import grid_cluster, linear_cluster
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Benchmark map clustering of random points, the number of clusters '
+        'grows with the zoom level while per point cost should stay flat'
+    )
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--points', action='store', dest='points', type='int',
+            default=100000, help='Number of random points'
+        ),
+        make_option(
+            '--max-zoom', action='store', dest='max_zoom', type='int',
+            default=10, help='Benchmark zoom levels from 0 to max-zoom'
+        ),
+        make_option(
+            '--linear', action='store_true', dest='linear', default=False,
+            help='Also benchmark the reference point by cluster scan'
+        ),
+    )
+
+    def _time(self, engine, points, zoom):
+        start = time.time()
+        clusters = engine(points, zoom, 48, 46)
+        elapsed = time.time() - start
+
+        return len(clusters), elapsed * 1e6 / len(points)
+
+    def handle(self, *args, **options):
+        random.seed(0)
+        points = [
+            (str(i), random.uniform(-180, 180), random.uniform(-85, 85))
+            for i in xrange(options['points'])
+        ]
+
+        header = '{:>4} {:>10} {:>14}'.format('zoom', 'clusters', 'grid us/pt')
+        if options['linear']:
+            header += ' {:>14}'.format('linear us/pt')
+        self.stdout.write(header)
+
+        for zoom in range(options['max_zoom'] + 1):
+            clusters, grid_cost = self._time(grid_cluster, points, zoom)
+            line = '{:>4} {:>10} {:>14.2f}'.format(zoom, clusters, grid_cost)
+
+            if options['linear']:
+                _, linear_cost = self._time(linear_cluster, points, zoom)
+                line += ' {:>14.2f}'.format(linear_cost)
+
+            self.stdout.write(line)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import csv
+import os
+import random
+import tempfile
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ..._csv_unicode import UnicodeDictReader
+from ...csv_reader import DictReader, detect_encoding, open_data
+
+COLUMNS = (
+    '_num', 'name', 'services', 'physical_address', 'contact_details', 'lat',
+    'lon'
+)
+
+
+def write_random_csv(csv_file, rows):
+    """
+    Write random (UTF-8 encoded) rows which look like uploaded data
+    """
+
+    words = [
+        u'clinic', u'hospital', u'Sant\xe9', u'Gesundheitsst\xe4tte',
+        u'مستشفى', u'HIV Testing', u'Maternity',
+        u'Eastern Cape', u'Primary Number: 017 8646 9612'
+    ]
+
+    writer = csv.writer(csv_file)
+    writer.writerow(COLUMNS)
+    for i in xrange(rows):
+        writer.writerow([str(i)] + [
+            u' '.join(random.sample(words, 3)).encode('utf-8')
+            for _ in range(4)
+        ] + [
+            repr(random.uniform(-85, 85)), repr(random.uniform(-180, 180))
+        ])
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Benchmark reading of a CSV file by the UnicodeDictReader and the '
+        'batch decoding DictReader'
+    )
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--rows', action='store', dest='rows', type='int',
+            default=100000, help='Number of random rows'
+        ),
+        make_option(
+            '--file', action='store', dest='filename', default=None,
+            help='Read a CSV file instead of random rows'
+        ),
+        make_option(
+            '--tabs', action='store_true', dest='tabs', default=False,
+            help='The CSV file is tab separated'
+        ),
+    )
+
+    def _time(self, reader):
+        start = time.time()
+        rows = list(reader)
+        elapsed = time.time() - start
+
+        return rows, elapsed
+
+    def handle(self, *args, **options):
+        delimiter = '\t' if options['tabs'] else ','
+        filename = options['filename']
+
+        if filename:
+            if not os.path.exists(filename):
+                raise CommandError('File does not exist: {}'.format(filename))
+        else:
+            random.seed(0)
+            csv_file = tempfile.NamedTemporaryFile(suffix='.csv', delete=False)
+            with csv_file:
+                write_random_csv(csv_file, options['rows'])
+            filename = csv_file.name
+
+        try:
+            encoding = detect_encoding(filename)
+
+            with open_data(filename) as data_file:
+                rows, dict_reader_time = self._time(
+                    DictReader(data_file, delimiter, encoding)
+                )
+
+            # the reference reader only reads UTF-8 encoded plain files
+            with open(filename, 'rb') as data_file:
+                old_rows, unicode_reader_time = self._time(
+                    UnicodeDictReader(data_file, delimiter=delimiter)
+                )
+        finally:
+            if not options['filename']:
+                os.remove(filename)
+
+        if rows != old_rows:
+            raise CommandError('Readers returned different rows')
+
+        self.stdout.write('{:>20} {:>10} {:>12}'.format(
+            'reader', 'seconds', 'us/row'
+        ))
+        for name, elapsed in (
+                ('UnicodeDictReader', unicode_reader_time),
+                ('DictReader', dict_reader_time)):
+            self.stdout.write('{:>20} {:>10.3f} {:>12.2f}'.format(
+                name, elapsed, elapsed * 1e6 / max(len(rows), 1)
+            ))
+        self.stdout.write('Encoding: {}, rows: {}, speedup: {:.2f}x'.format(
+            encoding, len(rows), unicode_reader_time / dict_reader_time
+        ))
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...pyramid import build_cluster_pyramid
+
+
+class Command(BaseCommand):
+
+    help = 'Build the precomputed cluster pyramid for the localities layer'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--zoom', action='append', dest='zoom_levels', type='int',
+            help='Zoom level to build, can be used multiple times'
+        ),
+        make_option(
+            '--iconsize', action='append', dest='icon_sizes',
+            help='Icon size (width,height) to build, can be used multiple '
+                 'times'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        icon_sizes = options['icon_sizes']
+
+        if icon_sizes:
+            try:
+                icon_sizes = [
+                    map(int, icon_size.split(',')) for icon_size in icon_sizes
+                ]
+            except ValueError:
+                raise CommandError('Icon size should be: width,height')
+
+            if any(
+                    len(icon_size) != 2 or min(icon_size) <= 0
+                    for icon_size in icon_sizes):
+                raise CommandError('Icon size should be: width,height')
+
+        build_cluster_pyramid(options['zoom_levels'], icon_sizes)
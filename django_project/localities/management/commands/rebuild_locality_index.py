@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...indexing import locality_id_chunks, rebuild_locality_index
+from ...tasks import rebuild_locality_index_task
+
+
+class Command(BaseCommand):
+
+    help = 'Rebuild the full text search index (LocalityIndex) of Localities'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--chunk-size', action='store', dest='chunk_size', type='int',
+            default=1000, help='Number of Localities rebuilt at once'
+        ),
+        make_option(
+            '--async', action='store_true', dest='async', default=False,
+            help='Rebuild chunks in parallel, using Celery tasks'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+
+        if chunk_size <= 0:
+            raise CommandError('Chunk size should be a positive number')
+
+        count = 0
+        for locality_ids in locality_id_chunks(chunk_size):
+            if options['async']:
+                rebuild_locality_index_task.delay(locality_ids)
+            else:
+                rebuild_locality_index(locality_ids)
+
+            count += len(locality_ids)
+
+        if options['async']:
+            self.stdout.write(
+                'Dispatched index rebuild of {} localities'.format(count)
+            )
+        else:
+            self.stdout.write('Rebuilt index of {} localities'.format(count))
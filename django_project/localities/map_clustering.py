@@ -4,6 +4,16 @@ LOG = logging.getLogger(__name__)
 
 import math
 
+# World Mercator tile size in pixels
+TILE_SIZE = 256
+
+# clustering backends, 'python' clusters using *grid_cluster* and 'postgis'
+# clusters by cluster cells in the database
+CLUSTER_BACKENDS = ('python', 'postgis')
+
+# World Mercator is limited to a square, which is at about 85 deg
+MAX_LATITUDE = 85.0511287798
+
 
 def within_bbox(bbox, geomx, geomy):
     """
@@ -57,26 +67,86 @@ def update_minbbox(point, minbbox):
     return new_minbbox
 
 
-def cluster(query_set, zoom, pix_x, pix_y):
+def catchment_cell_size(zoom, pix_x, pix_y):
+    """
+    Calculate a size (lng_deg, lat_deg) of a grid cell for a zoom and an icon
+
+    Cluster 'catchment' area is the largest on the equator, so a cell of this
+    size is never smaller than the 'catchment' area of any cluster, at any
+    latitude, and a cluster can overlap at most 2x2 grid cells
+    """
+
+    x_range, y_range = overlapping_area(zoom, pix_x, pix_y, 0)
+
+    return (x_range * 3, y_range * 3)
+
+
+def grid_cell(geomx, geomy, cell_size):
+    """
+    Return a (column, row) key of a grid cell which contains a point
+    """
+
+    return (
+        int(math.floor(geomx / cell_size[0])),
+        int(math.floor(geomy / cell_size[1]))
+    )
+
+
+def linear_cluster(points, zoom, pix_x, pix_y):
+    """
+    Reference clustering which tests every point against every cluster,
+    *grid_cluster* creates the same clusters without scanning all of them
+    """
+
+    cluster_points = []
+
+    for uuid, geomx, geomy in points:
+        for pt in cluster_points:
+            if within_bbox(pt['bbox'], geomx, geomy):
+                pt['count'] += 1
+                pt['minbbox'] = update_minbbox((geomx, geomy), pt['minbbox'])
+                break
+        else:
+            x_range, y_range = overlapping_area(zoom, pix_x, pix_y, geomy)
+            cluster_points.append({
+                'uuid': uuid,
+                'count': 1,
+                'geom': (geomx, geomy),
+                'bbox': (
+                    geomx - x_range*1.5, geomy - y_range*1.5,
+                    geomx + x_range*1.5, geomy + y_range*1.5
+                ),
+                'minbbox': (geomx, geomy, geomx, geomy)
+            })
+
+    return cluster_points
+
+
+def grid_cluster(points, zoom, pix_x, pix_y):
     """
-    Walk though a set of Localities and create point clusters
+    Walk though a sequence of (uuid, lng, lat) points and create point
+    clusters
 
-    We use a simple method that for every point, that is not within any
-    cluster, calculate it's 'catchment' area and add it to the cluster
+    For every point, that is not within any cluster, calculate it's
+    'catchment' area and add it to the cluster
 
     If a point is within a cluster 'catchment' area increase point count for
     that cluster and recalculate clusters minimum bbox
+
+    Clusters are registered in every grid cell their 'catchment' area
+    overlaps, so a point is only tested against clusters in its own grid cell.
+    Cell lists are kept in creation order, so a point is added to the first
+    created cluster which contains it
     """
 
     cluster_points = []
+    grid = {}
 
-    localites = query_set.get_lnglat().values('id', 'uuid', 'lnglat')
-
-    for locality in localites.iterator():
-        geomx, geomy = map(float, locality['lnglat'].split(','))
+    cell_size = catchment_cell_size(zoom, pix_x, pix_y)
 
-        # check every point in cluster_points
-        for pt in cluster_points:
+    for uuid, geomx, geomy in points:
+        # check only clusters registered in the grid cell of the point
+        for pt in grid.get(grid_cell(geomx, geomy, cell_size), ()):
             if within_bbox(pt['bbox'], geomx, geomy):
                 # it's in the cluster 'catchment' area
                 pt['count'] += 1
@@ -91,12 +161,236 @@ def cluster(query_set, zoom, pix_x, pix_y):
                 geomx - x_range*1.5, geomy - y_range*1.5,
                 geomx + x_range*1.5, geomy + y_range*1.5
             )
-            cluster_points.append({
-                'uuid': locality['uuid'],
+            new_cluster = {
+                'uuid': uuid,
                 'count': 1,
                 'geom': (geomx, geomy),
                 'bbox': bbox,
                 'minbbox': (geomx, geomy, geomx, geomy)
-            })
+            }
+            cluster_points.append(new_cluster)
+
+            # register the cluster in every cell its 'catchment' area overlaps
+            min_col, min_row = grid_cell(bbox[0], bbox[1], cell_size)
+            max_col, max_row = grid_cell(bbox[2], bbox[3], cell_size)
+
+            for col in range(min_col, max_col + 1):
+                for row in range(min_row, max_row + 1):
+                    grid.setdefault((col, row), []).append(new_cluster)
 
     return cluster_points
+
+
+def cluster(query_set, zoom, pix_x, pix_y, backend='python'):
+    """
+    Cluster a set of Localities for a zoom and an icon size
+
+    See *grid_cluster* for details about the 'python' clustering backend, and
+    *LocalitiesQuerySet.cluster_in_db* about the 'postgis' backend
+    """
+
+    if backend == 'postgis':
+        return query_set.cluster_in_db(zoom, pix_x, pix_y)
+
+    return grid_cluster(query_set.iter_points(), zoom, pix_x, pix_y)
+
+
+def lnglat_to_pixel(lng, lat, zoom):
+    """
+    Convert a point (lng, lat) to World Mercator pixel coordinates (x, y) for
+    a zoom, pixel coordinates start at the top left corner of the world
+    """
+
+    world_size = float(TILE_SIZE * 2 ** zoom)
+    sin_lat = math.sin(
+        math.radians(max(min(lat, MAX_LATITUDE), -MAX_LATITUDE))
+    )
+
+    pix_x = (lng + 180.0) / 360.0 * world_size
+    pix_y = (
+        0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    ) * world_size
+
+    return (pix_x, pix_y)
+
+
+def pixel_to_lnglat(pix_x, pix_y, zoom):
+    """
+    Convert World Mercator pixel coordinates (x, y) for a zoom to a point
+    (lng, lat)
+    """
+
+    world_size = float(TILE_SIZE * 2 ** zoom)
+
+    lng = pix_x / world_size * 360.0 - 180.0
+    lat = math.degrees(
+        math.atan(math.sinh(math.pi * (1 - 2 * pix_y / world_size)))
+    )
+
+    return (lng, lat)
+
+
+def cell_index(lng, lat, zoom, pix_x, pix_y):
+    """
+    Return a (column, row) key of a cluster cell which contains a point
+
+    Cluster cells are fixed in World Mercator pixel space and, as a cluster
+    'catchment' area, cells are three icons wide and three icons high
+    """
+
+    geom_pix_x, geom_pix_y = lnglat_to_pixel(lng, lat, zoom)
+
+    return (
+        int(math.floor(geom_pix_x / (pix_x * 3))),
+        int(math.floor(geom_pix_y / (pix_y * 3)))
+    )
+
+
+def cell_bbox(cell, zoom, pix_x, pix_y):
+    """
+    Calculate a bbox (minx, miny, maxx, maxy) in degrees of a cluster cell
+    """
+
+    minx, maxy = pixel_to_lnglat(
+        cell[0] * pix_x * 3, cell[1] * pix_y * 3, zoom
+    )
+    maxx, miny = pixel_to_lnglat(
+        (cell[0] + 1) * pix_x * 3, (cell[1] + 1) * pix_y * 3, zoom
+    )
+
+    return (minx, miny, maxx, maxy)
+
+
+def cell_cluster(points, zoom, pix_x, pix_y):
+    """
+    Group a sequence of (uuid, lng, lat) points by cluster cells
+
+    Every cell with at least one point is a cluster, and the first point of a
+    cell represents the cluster. Unlike *grid_cluster*, a point always ends in
+    the same cluster regardless of other points, so any part of the map can
+    be clustered, or updated, independently
+
+    Returns a dictionary of clusters keyed by cells
+    """
+
+    clusters = {}
+
+    for uuid, geomx, geomy in points:
+        cell = cell_index(geomx, geomy, zoom, pix_x, pix_y)
+
+        try:
+            pt = clusters[cell]
+        except KeyError:
+            clusters[cell] = {
+                'uuid': uuid,
+                'count': 1,
+                'geom': (geomx, geomy),
+                'bbox': cell_bbox(cell, zoom, pix_x, pix_y),
+                'minbbox': (geomx, geomy, geomx, geomy)
+            }
+        else:
+            pt['count'] += 1
+            pt['minbbox'] = update_minbbox((geomx, geomy), pt['minbbox'])
+
+    return clusters
+
+
+def tile_index(lng, lat, zoom):
+    """
+    Return a (x, y) key of a World Mercator tile which contains a point
+    """
+
+    geom_pix_x, geom_pix_y = lnglat_to_pixel(lng, lat, zoom)
+
+    return (
+        int(math.floor(geom_pix_x / TILE_SIZE)),
+        int(math.floor(geom_pix_y / TILE_SIZE))
+    )
+
+
+def tile_bbox(zoom, tile_x, tile_y):
+    """
+    Calculate a bbox (minx, miny, maxx, maxy) in degrees of a World Mercator
+    tile
+    """
+
+    minx, maxy = pixel_to_lnglat(tile_x * TILE_SIZE, tile_y * TILE_SIZE, zoom)
+    maxx, miny = pixel_to_lnglat(
+        (tile_x + 1) * TILE_SIZE, (tile_y + 1) * TILE_SIZE, zoom
+    )
+
+    return (minx, miny, maxx, maxy)
+
+
+def _pixel_bbox(min_pix_x, min_pix_y, max_pix_x, max_pix_y, zoom):
+    """
+    Calculate a bbox (minx, miny, maxx, maxy) in degrees of a World Mercator
+    pixel extent
+
+    Points north or south of World Mercator limits are in the first or the
+    last row of cells, so extents on world edges are extended to the poles
+    """
+
+    world_size = TILE_SIZE * 2 ** zoom
+
+    minx, maxy = pixel_to_lnglat(min_pix_x, min_pix_y, zoom)
+    maxx, miny = pixel_to_lnglat(max_pix_x, max_pix_y, zoom)
+
+    if min_pix_y <= 0:
+        maxy = 90.0
+    if max_pix_y >= world_size:
+        miny = -90.0
+
+    return (minx, miny, maxx, maxy)
+
+
+def tile_cells_bbox(zoom, tile_x, tile_y, pix_x, pix_y):
+    """
+    Calculate a bbox (minx, miny, maxx, maxy) in degrees of all cluster cells
+    which intersect a World Mercator tile
+    """
+
+    cell_width = pix_x * 3
+    cell_height = pix_y * 3
+
+    min_pix_x = math.floor(
+        tile_x * TILE_SIZE / float(cell_width)) * cell_width
+    min_pix_y = math.floor(
+        tile_y * TILE_SIZE / float(cell_height)) * cell_height
+    max_pix_x = math.ceil(
+        (tile_x + 1) * TILE_SIZE / float(cell_width)) * cell_width
+    max_pix_y = math.ceil(
+        (tile_y + 1) * TILE_SIZE / float(cell_height)) * cell_height
+
+    return _pixel_bbox(min_pix_x, min_pix_y, max_pix_x, max_pix_y, zoom)
+
+
+def cell_points_bbox(cell, zoom, pix_x, pix_y):
+    """
+    Calculate a bbox (minx, miny, maxx, maxy) in degrees of all points within
+    a cluster cell
+    """
+
+    return _pixel_bbox(
+        cell[0] * pix_x * 3, cell[1] * pix_y * 3,
+        (cell[0] + 1) * pix_x * 3, (cell[1] + 1) * pix_y * 3, zoom
+    )
+
+
+def cell_tiles(cell, zoom, pix_x, pix_y):
+    """
+    Return (x, y) keys of World Mercator tiles which intersect a cluster cell
+    """
+
+    last_tile = 2 ** zoom - 1
+
+    def tile_range(cell_pos, size):
+        first = int(cell_pos * size * 3 // TILE_SIZE)
+        last = int((cell_pos + 1) * size * 3 // TILE_SIZE)
+        return range(max(first, 0), min(last, last_tile) + 1)
+
+    return [
+        (tile_x, tile_y)
+        for tile_x in tile_range(cell[0], pix_x)
+        for tile_y in tile_range(cell[1], pix_y)
+    ]
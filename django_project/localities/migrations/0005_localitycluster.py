@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.contrib.gis.db.models.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('localities', '0004_datahistory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocalityCluster',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('zoom', models.IntegerField()),
+                ('pix_x', models.IntegerField()),
+                ('pix_y', models.IntegerField()),
+                ('cell_x', models.IntegerField()),
+                ('cell_y', models.IntegerField()),
+                ('uuid', models.TextField()),
+                ('count', models.IntegerField()),
+                ('geom', django.contrib.gis.db.models.fields.PointField(srid=4326)),
+                ('min_lng', models.FloatField()),
+                ('min_lat', models.FloatField()),
+                ('max_lng', models.FloatField()),
+                ('max_lat', models.FloatField()),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='localitycluster',
+            unique_together=set([('zoom', 'pix_x', 'pix_y', 'cell_x', 'cell_y')]),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('localities', '0005_localitycluster'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='locality',
+            name='country',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.SET_NULL, blank=True, to='localities.Country', null=True),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE localities_locality AS loc SET country_id = (
+                SELECT country.id FROM localities_country AS country
+                WHERE ST_Within(loc.geom, country.polygon_geometry)
+                ORDER BY country.id
+                LIMIT 1
+            )
+            """,
+            migrations.RunSQL.noop
+        ),
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('localities', '0006_locality_country'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocalityStatistic',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('data', models.TextField()),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('country', models.OneToOneField(null=True, blank=True, to='localities.Country')),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('localities', '0007_localitystatistic'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='locality',
+            name='completeness',
+            field=models.FloatField(default=0, db_index=True),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE localities_locality AS loc SET completeness = ((
+                SELECT count(*) FROM localities_value AS val
+                WHERE val.locality_id = loc.id
+                    AND val.data IS NOT NULL AND val.data <> ''
+            ) + 1) * 100.0 / ((
+                SELECT count(*) FROM localities_specification AS spec
+                WHERE spec.domain_id = loc.domain_id
+            ) + 1)
+            """,
+            migrations.RunSQL.noop
+        ),
+    ]
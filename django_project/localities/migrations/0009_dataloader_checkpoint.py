@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('localities', '0008_locality_completeness'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataloader',
+            name='checkpoint_changeset',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.SET_NULL, blank=True, to='localities.Changeset', help_text='Changeset of the imported rows', null=True, verbose_name='Checkpoint (changeset)'),
+        ),
+        migrations.AddField(
+            model_name='dataloader',
+            name='checkpoint_report',
+            field=models.TextField(default='', help_text='Report (JSON) of the imported rows', verbose_name='Checkpoint (report)', blank=True),
+        ),
+        migrations.AddField(
+            model_name='dataloader',
+            name='checkpoint_row',
+            field=models.IntegerField(default=0, help_text='Number of rows of the CSV data which are imported', verbose_name='Checkpoint (row)'),
+        ),
+    ]
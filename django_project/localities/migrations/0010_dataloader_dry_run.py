@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('localities', '0009_dataloader_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataloader',
+            name='diff_report',
+            field=models.FileField(help_text='CSV report of changes found by a dry run.', upload_to='diff_report/%Y/%m/%d', verbose_name='Diff Report', blank=True),
+        ),
+        migrations.AddField(
+            model_name='dataloader',
+            name='dry_run',
+            field=models.BooleanField(default=False, help_text='Only report changes, without loading the data.', verbose_name='Dry Run'),
+        ),
+    ]
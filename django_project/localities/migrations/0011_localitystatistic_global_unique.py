@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('localities', '0010_dataloader_dry_run'),
+    ]
+
+    operations = [
+        # NULL countries are not equal in the unique constraint of country_id,
+        # so there can be a single statistic of all Localities only with a
+        # partial unique index, keep the latest of duplicate rows
+        migrations.RunSQL(
+            """
+            DELETE FROM localities_localitystatistic
+            WHERE country_id IS NULL AND id < (
+                SELECT max(id) FROM localities_localitystatistic
+                WHERE country_id IS NULL
+            );
+            CREATE UNIQUE INDEX localities_localitystatistic_all_uniq
+            ON localities_localitystatistic ((country_id IS NULL))
+            WHERE country_id IS NULL
+            """,
+            'DROP INDEX localities_localitystatistic_all_uniq'
+        ),
+    ]
@@ -3,18 +3,20 @@ import logging
 
 LOG = logging.getLogger(__name__)
 
-import itertools
 from datetime import datetime
 from django.utils import timezone
 from django.utils.text import slugify
 from django.contrib.gis.db import models
+from django.db import connection
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.fields import GenericForeignKey
 from model_utils import FieldTracker
 from pg_fts.fields import TSVectorField
 from .querysets import PassThroughGeoManager, LocalitiesQuerySet
-from django.db.models.signals import post_save
+from .invalidation import statistics_queue
+from .map_clustering import cell_bbox
+from django.db.models.signals import post_save, post_delete
 
 
 class ChangesetMixin(models.Model):
@@ -129,6 +131,18 @@ class DomainArchive(ArchiveMixin):
     template_fragment = models.TextField(null=True, blank=True)
 
 
+# bulk update of data, version and changeset of Values
+UPDATE_VALUES_SQL = """
+UPDATE {value} AS val
+SET data = changed.data, version = changed.version,
+    changeset_id = changed.changeset_id
+FROM (VALUES {rows}) AS changed (id, data, version, changeset_id)
+WHERE val.id = changed.id
+"""
+
+UPDATE_VALUES_ROW = '(%s::integer, %s::text, %s::integer, %s::integer)'
+
+
 class Locality(UpdateMixin, ChangesetMixin):
     """
     A Locality is uniquely defined by an *uuid* attribute. Attribute *geom*
@@ -137,13 +151,18 @@ class Locality(UpdateMixin, ChangesetMixin):
     any reoccurring data imports.
 
     A Locality is in a *Domain* and data values for Attributes, to be exact,
-    their Specifications, are defined through *Value*
+    their Specifications, are defined through *Value*. *completeness* is a
+    percentage of Specifications with a value, maintained by *set_values*
     """
 
     domain = models.ForeignKey('Domain')
     uuid = models.TextField(unique=True)
     upstream_id = models.TextField(null=True, unique=True)
     geom = models.PointField(srid=4326)
+    country = models.ForeignKey(
+        'Country', null=True, blank=True, on_delete=models.SET_NULL
+    )
+    completeness = models.FloatField(default=0, db_index=True)
     specifications = models.ManyToManyField('Specification', through='Value')
 
     objects = PassThroughGeoManager.for_queryset_class(LocalitiesQuerySet)()
@@ -155,13 +174,42 @@ class Locality(UpdateMixin, ChangesetMixin):
         if self.tracker.previous('uuid') and self.tracker.has_changed('uuid'):
             self.uuid = self.tracker.previous('uuid')
 
-    def _get_attr_map(self):
+        # keep the Country of a Locality in sync with its geometry
+        if kwargs.get('create') or self.tracker.has_changed('geom'):
+            self.country_id = self._find_country_id()
+
+        # a new Locality has no values yet, only its geometry is counted
+        if kwargs.get('create'):
+            spec_count = len(self._get_domain_schema().specifications)
+            self.completeness = 100.0 / (spec_count + 1)
+
+    def _find_country_id(self):
+        # Put here to avoid circular import
+        from .countries import get_country_geometry
+
+        # a moved Locality usually stays within its Country, which is tested
+        # using its cached prepared geometry
+        if self.country_id is not None:
+            try:
+                if get_country_geometry(self.country_id).contains(self.geom):
+                    return self.country_id
+            except Country.DoesNotExist:
+                pass
+
         return (
-            self.domain.specification_set
-                .order_by('id')
-                .values('id', 'attribute__key')
+            Country.objects
+            .filter(polygon_geometry__contains=self.geom)
+            .order_by('id')
+            .values_list('id', flat=True)
+            .first()
         )
 
+    def _get_domain_schema(self):
+        # Put here to avoid circular import
+        from .registry import get_schema
+
+        return get_schema().domain(self.domain_id)
+
     def set_geom(self, lon, lat):
         """
         Helper method to set Locality geometry
@@ -174,56 +222,64 @@ class Locality(UpdateMixin, ChangesetMixin):
         """
         Set values for a Locality which are defined by Specifications
 
+        Existing values are loaded in a single query, new values are bulk
+        created and changed values are updated in a single query, so the
+        number of queries does not depend on the number of values. Bulk
+        writes don't send *post_save*, so changed values are archived here
+
         Once all of values are set, 'SIG_locality_values_updated' signal will
         be triggered to update FullTextSearch index for this Locality
         """
 
-        attrs = self._get_attr_map()
+        spec_map = self._get_domain_schema().spec_ids
+        values = {
+            val.specification_id: val for val in self.value_set.all()
+        }
 
         tmp_changeset = None
 
         changed_values = []
         for key, data in changed_data.iteritems():
-            # try to match key from changed items with a key from attr_map
-            attr_list = [
-                attr for attr in attrs if attr['attribute__key'] == key
-                ]
-
-            if attr_list:
+            try:
                 # get specification id for specific key
-                spec_id = attr_list[0]['id']
-
-                # update or create new values
-                try:
-                    obj = self.value_set.get(specification_id=spec_id)
-                    _created = False
-                except Value.DoesNotExist:
-                    # in case there is no value for the specification, create
-                    obj = Value()
-                    obj.locality = self
-                    obj.specification_id = spec_id
-                    _created = True
-
-                # set data
-                obj.data = data
-
-                # check if Value.data actually changed, and save if it did
-                if obj.tracker.changed():
-                    if not (tmp_changeset):
-                        tmp_changeset = Changeset.objects.create(
-                                social_user=social_user
-                        )
-                    obj.changeset = tmp_changeset
-                    obj.save()
-                    changed_values.append((obj, _created))
-                else:
-                    # nothing changed, don't save the value
-                    pass
-            else:
+                spec_id = spec_map[key]
+            except KeyError:
                 # attr_id was not found (maybe a bad attribute)
                 LOG.warning(
                         'Locality %s has no attribute key %s', self.pk, key
                 )
+                continue
+
+            # update or create new values
+            try:
+                obj = values[spec_id]
+                _created = False
+            except KeyError:
+                # in case there is no value for the specification, create
+                obj = Value(locality=self, specification_id=spec_id)
+                _created = True
+
+            # set data
+            obj.data = data
+
+            # check if Value.data actually changed, and save if it did
+            if obj.tracker.changed():
+                if not (tmp_changeset):
+                    tmp_changeset = Changeset.objects.create(
+                            social_user=social_user
+                    )
+                obj.changeset = tmp_changeset
+                obj.inc_version()
+                values[spec_id] = obj
+                changed_values.append((obj, _created))
+
+        if changed_values:
+            self._save_values(changed_values)
+
+            value_count = len([val for val in values.itervalues() if val.data])
+            self.update_completeness(
+                (value_count + 1) * 100.0 / (len(spec_map) + 1)
+            )
 
         # send values_updated signal
         signals.SIG_locality_values_updated.send(
@@ -232,6 +288,83 @@ class Locality(UpdateMixin, ChangesetMixin):
 
         return changed_values
 
+    def _save_values(self, changed_values):
+        """
+        Bulk create new and update changed values, and archive all of them
+        """
+
+        new_values = [obj for obj, _created in changed_values if _created]
+        updated_values = [
+            obj for obj, _created in changed_values if not _created
+        ]
+
+        if new_values:
+            Value.objects.bulk_create(new_values)
+
+            # bulk_create doesn't set primary keys of created objects
+            new_ids = dict(
+                self.value_set
+                    .filter(specification_id__in=[
+                        obj.specification_id for obj in new_values
+                    ])
+                    .values_list('specification_id', 'id')
+            )
+            for obj in new_values:
+                obj.pk = new_ids[obj.specification_id]
+
+        if updated_values:
+            sql = UPDATE_VALUES_SQL.format(
+                value=Value._meta.db_table,
+                rows=', '.join([UPDATE_VALUES_ROW] * len(updated_values))
+            )
+            params = []
+            for obj in updated_values:
+                params.extend(
+                    (obj.pk, obj.data, obj.version, obj.changeset_id)
+                )
+            connection.cursor().execute(sql, params)
+
+        for obj, _created in changed_values:
+            obj.tracker.set_saved_fields()
+
+        signals.archive_values([obj for obj, _created in changed_values])
+
+    def calculate_completeness(self):
+        """
+        Percentage of Specifications of the Domain which have a non empty
+        Value, geometry is counted as an attribute which is always set
+        """
+
+        spec_count = len(self._get_domain_schema().specifications)
+        value_count = (
+            self.value_set
+                .exclude(data__isnull=True)
+                .exclude(data__exact='')
+                .count()
+        )
+
+        return (value_count + 1) * 100.0 / (spec_count + 1)
+
+    def update_completeness(self, completeness=None):
+        """
+        Store completeness of a Locality, as a derived attribute it does not
+        create a new version of the Locality
+
+        *completeness* is calculated unless it's already known
+        """
+
+        if completeness is None:
+            completeness = self.calculate_completeness()
+
+        self.completeness = completeness
+        Locality.objects.filter(pk=self.pk).update(
+            completeness=self.completeness
+        )
+        self.tracker.set_saved_fields(fields=['completeness'])
+
+        # completeness is a part of statistics
+        statistics_queue.add(self.country_id)
+
     def repr_dict(self):
         """
         Basic locality representation, as a dictionary
@@ -254,13 +387,19 @@ class Locality(UpdateMixin, ChangesetMixin):
         FTS ordering (defined by *Specification*)
         """
 
-        data_values = itertools.groupby(
-                self.value_set.order_by('specification__fts_rank')
-                    .values_list('specification__fts_rank', 'data'),
-                lambda x: x[0]
-        )
+        # Put here to avoid circular import
+        from .registry import get_schema
+
+        schema = get_schema()
 
-        return {k: ' '.join([x[1] for x in v]) for k, v in data_values}
+        data_values = {}
+        for spec_id, data in (
+                self.value_set.order_by('id')
+                    .values_list('specification_id', 'data')):
+            fts_rank = schema.specification(spec_id).fts_rank
+            data_values.setdefault(fts_rank, []).append(data)
+
+        return {k: ' '.join(v) for k, v in data_values.iteritems()}
 
     def update_history(self, time, mode, user):
         history = DataHistory(locality=self, time_changed=time, mode=mode, author=user)
@@ -426,7 +565,7 @@ class LocalityIndex(models.Model):
     its *Values* and *fts_rank* specified by a *Specification*
 
     LocalityIndex will be autoupdated when 'SIG_locality_values_updated' is
-    triggered
+    triggered, or rebuilt using the 'rebuild_locality_index' command
     """
 
     locality = models.OneToOneField('Locality')
@@ -542,6 +681,46 @@ class DataLoader(models.Model):
             default=''
     )
 
+    # checkpoint of an import, updated when a chunk of rows is committed, so
+    # an interrupted import can be resumed
+    checkpoint_row = models.IntegerField(
+            verbose_name='Checkpoint (row)',
+            help_text='Number of rows of the CSV data which are imported',
+            default=0
+    )
+
+    checkpoint_report = models.TextField(
+            verbose_name='Checkpoint (report)',
+            help_text='Report (JSON) of the imported rows',
+            blank=True,
+            default=''
+    )
+
+    checkpoint_changeset = models.ForeignKey(
+            'Changeset',
+            verbose_name='Checkpoint (changeset)',
+            help_text='Changeset of the imported rows',
+            null=True,
+            blank=True,
+            on_delete=models.SET_NULL
+    )
+
+    # a dry run compares the CSV data to existing localities, without loading
+    # it, the DataLoader can be applied afterwards
+    dry_run = models.BooleanField(
+            verbose_name='Dry Run',
+            help_text='Only report changes, without loading the data.',
+            default=False
+    )
+
+    diff_report = models.FileField(
+            verbose_name='Diff Report',
+            help_text='CSV report of changes found by a dry run.',
+            upload_to='diff_report/%Y/%m/%d',
+            max_length=100,
+            blank=True
+    )
+
     def __str__(self):
         return self.organisation_name
 
@@ -613,6 +792,15 @@ class DataHistory(models.Model):
     )
 
 
+# method for refreshing statistics of Localities
+def refresh_history_statistics(sender, instance, **kwargs):
+    statistics_queue.add(instance.locality.country_id)
+
+
+# register the signal
+post_save.connect(refresh_history_statistics, sender=DataHistory)
+
+
 # -------------------------------------------------
 # BOUNDARY OF COUNTRY
 # -------------------------------------------------
@@ -650,3 +838,103 @@ class Country(Boundary):
 
 Country._meta.get_field('name').verbose_name = 'Country name'
 Country._meta.get_field('name').help_text = 'The name of the country.'
+
+
+# method for updating countries of Localities and cached countries
+def update_country(sender, instance, **kwargs):
+    # Put here to avoid circular import
+    from .countries import invalidate_countries
+
+    invalidate_countries()
+
+    # reassign Localities which were or are within the Country
+    Locality.objects.filter(
+        models.Q(country=instance) |
+        models.Q(geom__within=instance.polygon_geometry)
+    ).assign_countries()
+
+
+def invalidate_country_names(sender, instance, **kwargs):
+    # Put here to avoid circular import
+    from .countries import invalidate_countries
+
+    invalidate_countries()
+
+
+# register the signals
+post_save.connect(update_country, sender=Country)
+post_delete.connect(invalidate_country_names, sender=Country)
+
+
+# -------------------------------------------------
+# CLUSTER PYRAMID
+# -------------------------------------------------
+class LocalityCluster(models.Model):
+    """
+    Precomputed cluster of Localities in a cluster cell for a *zoom* level
+    and an icon size (*pix_x*, *pix_y*)
+
+    Clusters for all of the zoom levels are built offline, a cluster is
+    represented by the first Locality (*uuid*, *geom*) in its cell and
+    *minbbox* is defined by *min_lng*, *min_lat*, *max_lng* and *max_lat*
+    """
+
+    zoom = models.IntegerField()
+    pix_x = models.IntegerField()
+    pix_y = models.IntegerField()
+    cell_x = models.IntegerField()
+    cell_y = models.IntegerField()
+
+    uuid = models.TextField()
+    count = models.IntegerField()
+    geom = models.PointField(srid=4326)
+
+    min_lng = models.FloatField()
+    min_lat = models.FloatField()
+    max_lng = models.FloatField()
+    max_lat = models.FloatField()
+
+    objects = models.GeoManager()
+
+    class Meta:
+        unique_together = ('zoom', 'pix_x', 'pix_y', 'cell_x', 'cell_y')
+
+    def repr_dict(self):
+        """
+        Cluster representation, same as the one created by *map_clustering*
+        """
+
+        return {
+            'uuid': self.uuid,
+            'count': self.count,
+            'geom': (self.geom.x, self.geom.y),
+            'bbox': cell_bbox(
+                (self.cell_x, self.cell_y), self.zoom, self.pix_x, self.pix_y
+            ),
+            'minbbox': (self.min_lng, self.min_lat, self.max_lng, self.max_lat)
+        }
+
+    def __unicode__(self):
+        return u'{} {},{} ({})'.format(
+            self.zoom, self.cell_x, self.cell_y, self.count
+        )
+
+
+# -------------------------------------------------
+# STATISTICS
+# -------------------------------------------------
+class LocalityStatistic(models.Model):
+    """
+    Precomputed statistics of Localities in a *country*, or of all of the
+    Localities when *country* is not set (unique by a partial index)
+
+    Statistics are stored as JSON *data*, in the format of
+    *statistics.get_statistic*, and refreshed after Localities change
+    """
+
+    country = models.OneToOneField('Country', null=True, blank=True)
+    data = models.TextField()
+    updated = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return u'{}'.format(self.country or 'All countries')
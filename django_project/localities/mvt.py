@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Minimal Mapbox Vector Tile (version 2) encoder for point features
+
+https://github.com/mapbox/vector-tile-spec/tree/master/2.1
+"""
+import struct
+
+from .map_clustering import TILE_SIZE, lnglat_to_pixel
+
+# protobuf wire types
+VARINT = 0
+FIXED64 = 1
+LENGTH_DELIMITED = 2
+
+# vector tile geometry types and commands
+POINT = 1
+MOVE_TO = 1
+
+EXTENT = 4096
+
+
+def _varint(value):
+    """
+    Encode an unsigned integer as a protobuf varint
+    """
+
+    data = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            data.append(byte | 0x80)
+        else:
+            data.append(byte)
+            return data
+
+
+def _zigzag(value):
+    """
+    Encode a signed integer as an unsigned integer
+    """
+
+    return (value << 1) ^ (value >> 63)
+
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _bytes_field(field, data):
+    return _key(field, LENGTH_DELIMITED) + _varint(len(data)) + data
+
+
+def _varint_field(field, value):
+    return _key(field, VARINT) + _varint(value)
+
+
+def _packed_field(field, values):
+    data = bytearray()
+    for value in values:
+        data += _varint(value)
+    return _bytes_field(field, data)
+
+
+def _value(value):
+    """
+    Encode a feature property value as a vector tile Value message
+    """
+
+    if isinstance(value, bool):
+        return _varint_field(7, int(value))
+    if isinstance(value, (int, long)):
+        if value < 0:
+            return _varint_field(6, _zigzag(value))
+        return _varint_field(5, value)
+    if isinstance(value, float):
+        return _key(3, FIXED64) + bytearray(struct.pack('<d', value))
+    if not isinstance(value, unicode):
+        value = unicode(value)
+    return _bytes_field(1, bytearray(value.encode('utf-8')))
+
+
+def tile_point(lng, lat, zoom, tile_x, tile_y, extent=EXTENT):
+    """
+    Convert a point (lng, lat) to integer coordinates of a tile
+    """
+
+    pix_x, pix_y = lnglat_to_pixel(lng, lat, zoom)
+    scale = float(extent) / TILE_SIZE
+
+    return (
+        int(round((pix_x - tile_x * TILE_SIZE) * scale)),
+        int(round((pix_y - tile_y * TILE_SIZE) * scale))
+    )
+
+
+def encode_layer(name, features, extent=EXTENT):
+    """
+    Encode a vector tile Layer message
+
+    Every feature is an (id, (x, y), properties) tuple, where (x, y) are tile
+    coordinates and properties is a dictionary
+    """
+
+    keys = []
+    key_index = {}
+    values = []
+    value_index = {}
+
+    layer = _varint_field(15, 2) + _bytes_field(1, bytearray(name))
+
+    for feature_id, (geom_x, geom_y), properties in features:
+        tags = []
+        for key, value in sorted(properties.iteritems()):
+            if key not in key_index:
+                key_index[key] = len(keys)
+                keys.append(key)
+            # bool and int values are equal in Python, keep them apart
+            value_key = (type(value), value)
+            if value_key not in value_index:
+                value_index[value_key] = len(values)
+                values.append(value)
+            tags.extend((key_index[key], value_index[value_key]))
+
+        feature = _varint_field(1, feature_id)
+        feature += _packed_field(2, tags)
+        feature += _varint_field(3, POINT)
+        feature += _packed_field(4, (
+            (MOVE_TO & 0x7) | (1 << 3), _zigzag(geom_x), _zigzag(geom_y)
+        ))
+
+        layer += _bytes_field(2, feature)
+
+    for key in keys:
+        layer += _bytes_field(3, bytearray(key.encode('utf-8')))
+    for value in values:
+        layer += _bytes_field(4, _value(value))
+
+    layer += _varint_field(5, extent)
+
+    return layer
+
+
+def encode_tile(layers, extent=EXTENT):
+    """
+    Encode a vector tile from a sequence of (name, features) layers, see
+    *encode_layer* for the definition of features
+    """
+
+    tile = bytearray()
+    for name, features in layers:
+        tile += _bytes_field(3, encode_layer(name, features, extent))
+
+    return str(tile)
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import logging
+LOG = logging.getLogger(__name__)
+
+import time
+
+from .utils import shared_cache
+
+# shared cache key of the progress of an import (partition) of a DataLoader
+PROGRESS_KEY = 'data-loader-progress:{}:{}'
+
+# progress of stalled or abandoned imports expires after a day
+PROGRESS_TIMEOUT = 24 * 60 * 60
+
+
+class ImportProgress(object):
+    """
+    Progress of an import (partition) of a DataLoader, published in the
+    shared cache, so it can be polled by other processes
+
+    Progress is measured by the position in the (compressed) file, of
+    *bytes_total* bytes, as the number of rows is not known until the whole
+    file is read
+    """
+
+    def __init__(self, data_loader_pk, bytes_total, partition=0):
+        self.key = PROGRESS_KEY.format(data_loader_pk, partition)
+        self.started = time.time()
+        self.bytes_total = bytes_total
+        self.bytes_read = 0
+        self.rows_parsed = 0
+        self.rows_saved = 0
+
+        self.publish()
+
+    def update(self, rows_parsed=None, rows_saved=None, bytes_read=None):
+        if rows_parsed is not None:
+            self.rows_parsed = rows_parsed
+        if rows_saved is not None:
+            self.rows_saved = rows_saved
+        if bytes_read is not None:
+            self.bytes_read = bytes_read
+
+        self.publish()
+
+    def publish(self):
+        shared_cache().set(self.key, {
+            'started': self.started,
+            'updated': time.time(),
+            'bytes_total': self.bytes_total,
+            'bytes_read': self.bytes_read,
+            'rows_parsed': self.rows_parsed,
+            'rows_saved': self.rows_saved
+        }, PROGRESS_TIMEOUT)
+
+
+def get_progress(data_loader_pk, partitions=1):
+    """
+    Progress of an import of a DataLoader, aggregated over its partitions, or
+    None if no partition has started yet
+
+    Every partition reads all rows of the file, so the import is as far as
+    its slowest partition. The total number of rows is estimated from the
+    parsed rows and the read part of the file. Rate is the number of saved
+    rows per second, and ETA the estimated number of seconds until all rows
+    are saved
+    """
+
+    progresses = shared_cache().get_many([
+        PROGRESS_KEY.format(data_loader_pk, partition)
+        for partition in range(partitions)
+    ]).values()
+
+    if not progresses:
+        return None
+
+    started = min(progress['started'] for progress in progresses)
+    bytes_total = max(progress['bytes_total'] for progress in progresses)
+    # partitions which have not started yet didn't read or save any rows
+    if len(progresses) < partitions:
+        bytes_read = rows_parsed = rows_saved = 0
+    else:
+        bytes_read = min(progress['bytes_read'] for progress in progresses)
+        rows_parsed = min(progress['rows_parsed'] for progress in progresses)
+        rows_saved = min(progress['rows_saved'] for progress in progresses)
+
+    if bytes_read > 0:
+        rows_total = int(round(
+            rows_parsed * max(bytes_total, bytes_read) / float(bytes_read)
+        ))
+    else:
+        rows_total = None
+
+    elapsed = time.time() - started
+    rate = rows_saved / elapsed if elapsed > 0 else 0.0
+    if rate > 0 and rows_total is not None:
+        eta = max(rows_total - rows_saved, 0) / rate
+    else:
+        eta = None
+
+    return {
+        'bytes_total': bytes_total,
+        'bytes_read': bytes_read,
+        'rows_total': rows_total,
+        'rows_parsed': rows_parsed,
+        'rows_saved': rows_saved,
+        'rate': round(rate, 2),
+        'eta': round(eta) if eta is not None else None,
+        'updated': max(progress['updated'] for progress in progresses)
+    }
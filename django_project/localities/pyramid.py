@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+import logging
+LOG = logging.getLogger(__name__)
+
+from django.conf import settings
+from django.contrib.gis.geos import Polygon
+from django.db import transaction
+
+from .map_clustering import cell_cluster, cell_points_bbox
+from .models import Locality, LocalityCluster
+
+
+def _cluster_model(zoom, pix_x, pix_y, cell, cluster):
+    """
+    Create a LocalityCluster object from a *map_clustering* cluster
+    """
+
+    return LocalityCluster(
+        zoom=zoom, pix_x=pix_x, pix_y=pix_y, cell_x=cell[0], cell_y=cell[1],
+        uuid=cluster['uuid'], count=cluster['count'],
+        geom='POINT({} {})'.format(*cluster['geom']),
+        min_lng=cluster['minbbox'][0], min_lat=cluster['minbbox'][1],
+        max_lng=cluster['minbbox'][2], max_lat=cluster['minbbox'][3]
+    )
+
+
+def build_pyramid_level(zoom, pix_x, pix_y):
+    """
+    Cluster all of the Localities for a zoom and an icon size, and replace
+    the pyramid level with new clusters
+    """
+
+    points = Locality.objects.order_by('id').iter_points()
+    clusters = cell_cluster(points, zoom, pix_x, pix_y)
+
+    with transaction.atomic():
+        LocalityCluster.objects.filter(
+            zoom=zoom, pix_x=pix_x, pix_y=pix_y
+        ).delete()
+
+        LocalityCluster.objects.bulk_create([
+            _cluster_model(zoom, pix_x, pix_y, cell, cluster)
+            for cell, cluster in clusters.iteritems()
+        ], batch_size=1000)
+
+    LOG.info(
+        'Built cluster pyramid level %s for icon %sx%s, %s clusters',
+        zoom, pix_x, pix_y, len(clusters)
+    )
+
+
+def build_cluster_pyramid(zoom_levels=None, icon_sizes=None):
+    """
+    Build the cluster pyramid for zoom levels and icon sizes, by default
+    *CLUSTER_PYRAMID_ZOOM_LEVELS* and *CLUSTER_PYRAMID_ICON_SIZES* settings
+    """
+
+    if zoom_levels is None:
+        zoom_levels = settings.CLUSTER_PYRAMID_ZOOM_LEVELS
+    if icon_sizes is None:
+        icon_sizes = settings.CLUSTER_PYRAMID_ICON_SIZES
+
+    for pix_x, pix_y in icon_sizes:
+        for zoom in zoom_levels:
+            build_pyramid_level(zoom, pix_x, pix_y)
+
+
+def pyramid_level_exists(zoom, pix_x, pix_y):
+    return LocalityCluster.objects.filter(
+        zoom=zoom, pix_x=pix_x, pix_y=pix_y
+    ).exists()
+
+
+def refresh_pyramid_cells(zoom, pix_x, pix_y, cells):
+    """
+    Recluster Localities of some cells of a pyramid level, cells without
+    Localities are removed from the level
+    """
+
+    with transaction.atomic():
+        for cell in cells:
+            points = Locality.objects.in_bbox(
+                Polygon.from_bbox(cell_points_bbox(cell, zoom, pix_x, pix_y))
+            ).order_by('id').iter_points()
+            # points on cell edges can fall into neighbouring cells
+            cluster = cell_cluster(points, zoom, pix_x, pix_y).get(cell)
+
+            LocalityCluster.objects.filter(
+                zoom=zoom, pix_x=pix_x, pix_y=pix_y,
+                cell_x=cell[0], cell_y=cell[1]
+            ).delete()
+
+            if cluster is not None:
+                _cluster_model(zoom, pix_x, pix_y, cell, cluster).save()
+
+
+def get_pyramid_clusters(bbox, zoom, pix_x, pix_y):
+    """
+    Slice a pyramid level by a bbox, only clusters represented by a point
+    within the bbox are returned
+
+    Returns None if the pyramid level was not built
+    """
+
+    level = LocalityCluster.objects.filter(zoom=zoom, pix_x=pix_x, pix_y=pix_y)
+
+    object_list = [
+        clu.repr_dict() for clu in level.filter(geom__contained=bbox)
+    ]
+
+    if not object_list and not level.exists():
+        return None
+
+    return object_list
@@ -2,11 +2,57 @@
 import logging
 LOG = logging.getLogger(__name__)
 
+import math
+
 from django.contrib.gis.db import models
 from django.contrib.gis.db.models.query import GeoQuerySet
+from django.db import connections
 
 from model_utils.managers import PassThroughManagerMixin
 
+from .map_clustering import MAX_LATITUDE, TILE_SIZE, cell_bbox
+
+
+# group Localities by cluster cells, see map_clustering.cell_index, points
+# are snapped to centers of cells in Web Mercator and every cluster is
+# represented by its first Locality
+CELL_CLUSTER_SQL = """
+SELECT
+    cell_x, cell_y, count(*),
+    (array_agg(uuid ORDER BY id))[1],
+    (array_agg(ST_X(geom) ORDER BY id))[1],
+    (array_agg(ST_Y(geom) ORDER BY id))[1],
+    ST_XMin(ST_Extent(geom)), ST_YMin(ST_Extent(geom)),
+    ST_XMax(ST_Extent(geom)), ST_YMax(ST_Extent(geom))
+FROM (
+    SELECT id, uuid, geom, ST_X(cell) AS cell_x, ST_Y(cell) AS cell_y
+    FROM (
+        SELECT
+            id, uuid, geom,
+            ST_SnapToGrid(ST_Transform(ST_SetSRID(ST_MakePoint(
+                ST_X(geom), greatest(least(ST_Y(geom), %s), %s)
+            ), 4326), 3857), %s, %s, %s, %s) AS cell
+        FROM {table}
+        WHERE id IN ({query})
+    ) AS snapped
+) AS cells
+GROUP BY cell_x, cell_y
+"""
+
+# half of the size of the Web Mercator (EPSG:3857) world square, in meters
+MERCATOR_HALF_SIZE = math.pi * 6378137.0
+
+# assign every Locality to the first Country which contains it
+ASSIGN_COUNTRY_SQL = """
+UPDATE {table} AS loc SET country_id = (
+    SELECT country.id FROM {country_table} AS country
+    WHERE ST_Within(loc.geom, country.polygon_geometry)
+    ORDER BY country.id
+    LIMIT 1
+)
+WHERE loc.id IN ({query})
+"""
+
 
 class PassThroughGeoManager(PassThroughManagerMixin, models.GeoManager):
     """
@@ -34,6 +80,66 @@ class LocalitiesQuerySet(GeoQuerySet):
 
         return self.extra(select={'lnglat': 'st_x(geom)||$$,$$||st_y(geom)'})
 
+    def iter_points(self):
+        """
+        Iterate over Localities as (uuid, lng, lat) points
+        """
+
+        localities = self.get_lnglat().values_list('uuid', 'lnglat')
+
+        for loc_uuid, lnglat in localities.iterator():
+            lng, lat = lnglat.split(',')
+            yield loc_uuid, float(lng), float(lat)
+
+    def cluster_in_db(self, zoom, pix_x, pix_y):
+        """
+        Cluster Localities using a single aggregate query, Localities are
+        grouped by cluster cells and every cluster is represented by the
+        first Locality in its cell, same as in *map_clustering.cell_cluster*
+
+        Returns clusters in the same format as *map_clustering*
+        """
+
+        # cell size in Web Mercator meters, cells start at the top left
+        # corner of the world and they are snapped to their centers
+        meters = 2 * MERCATOR_HALF_SIZE / (TILE_SIZE * 2 ** zoom)
+        cell_width = pix_x * 3 * meters
+        cell_height = pix_y * 3 * meters
+        origin_x = -MERCATOR_HALF_SIZE + cell_width / 2
+        origin_y = MERCATOR_HALF_SIZE - cell_height / 2
+
+        query, query_params = self.values('id').query.sql_with_params()
+
+        sql = CELL_CLUSTER_SQL.format(
+            table=self.model._meta.db_table, query=query
+        )
+        params = [
+            MAX_LATITUDE, -MAX_LATITUDE,
+            origin_x, origin_y, cell_width, cell_height
+        ] + list(query_params)
+
+        cursor = connections[self.db].cursor()
+        cursor.execute(sql, params)
+
+        clusters = []
+        for (
+            cell_x, cell_y, count, loc_uuid, geomx, geomy, minx, miny, maxx,
+            maxy
+        ) in cursor.fetchall():
+            cell = (
+                int(round((cell_x - origin_x) / cell_width)),
+                int(round((origin_y - cell_y) / cell_height))
+            )
+            clusters.append({
+                'uuid': loc_uuid,
+                'count': count,
+                'geom': (geomx, geomy),
+                'bbox': cell_bbox(cell, zoom, pix_x, pix_y),
+                'minbbox': (minx, miny, maxx, maxy)
+            })
+
+        return clusters
+
     def in_polygon(self, polygon):
         """
         Filter Localities within a polygon
@@ -41,3 +147,33 @@ class LocalitiesQuerySet(GeoQuerySet):
 
         LOG.debug('Filtering Localities using polygon: %s', polygon)
         return self.filter(geom__within=polygon)
+
+    def in_country(self, country_id):
+        """
+        Filter Localities assigned to a Country
+        """
+
+        LOG.debug('Filtering Localities using country: %s', country_id)
+        return self.filter(country_id=country_id)
+
+    def assign_countries(self):
+        """
+        Assign Localities to Countries using a single spatial join, instead
+        of saving every Locality
+
+        Returns the number of updated Localities
+        """
+
+        query, query_params = self.values('id').query.sql_with_params()
+
+        sql = ASSIGN_COUNTRY_SQL.format(
+            table=self.model._meta.db_table,
+            country_table=self.model._meta.get_field(
+                'country').rel.to._meta.db_table,
+            query=query
+        )
+
+        cursor = connections[self.db].cursor()
+        cursor.execute(sql, query_params)
+
+        return cursor.rowcount
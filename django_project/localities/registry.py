@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import logging
+LOG = logging.getLogger(__name__)
+
+from collections import namedtuple
+
+from .models import Attribute, Domain, Specification
+from .utils import get_cache_version, new_cache_version
+
+# shared cache key of the current version of the schema
+VERSION_KEY = 'schema-registry:version'
+
+# in-process cache of the Schema
+_schema = None
+_schema_version = None
+
+SpecificationSchema = namedtuple(
+    'SpecificationSchema', ['pk', 'domain_id', 'key', 'required', 'fts_rank']
+)
+
+
+class DomainSchema(object):
+    """
+    A Domain with its Specifications, ordered by id
+    """
+
+    def __init__(self, pk, name, specifications):
+        self.pk = pk
+        self.name = name
+        self.specifications = specifications
+
+    @property
+    def spec_ids(self):
+        """
+        Map of Specification ids, keyed by attribute keys
+        """
+
+        return {spec.key: spec.pk for spec in self.specifications}
+
+    @property
+    def required(self):
+        return [spec for spec in self.specifications if spec.required]
+
+
+class Schema(object):
+    """
+    Domains, Attributes and Specifications, which define the data model of
+    Localities
+    """
+
+    def __init__(self, domains, attributes, specifications):
+        self._domains = {domain.pk: domain for domain in domains}
+        self._domain_names = {domain.name: domain for domain in domains}
+        self._specifications = {spec.pk: spec for spec in specifications}
+
+        # map of Attribute ids, keyed by attribute keys
+        self.attributes = attributes
+
+    def domain(self, pk):
+        """
+        Get a DomainSchema by Domain id, raises Domain.DoesNotExist if the
+        domain does not exist
+        """
+
+        try:
+            return self._domains[pk]
+        except KeyError:
+            raise Domain.DoesNotExist('Domain {} does not exist'.format(pk))
+
+    def domain_by_name(self, name):
+        """
+        Get a DomainSchema by Domain name, raises Domain.DoesNotExist if the
+        domain does not exist
+        """
+
+        try:
+            return self._domain_names[name]
+        except KeyError:
+            raise Domain.DoesNotExist(
+                'Domain "{}" does not exist'.format(name)
+            )
+
+    def specification(self, pk):
+        """
+        Get a SpecificationSchema by Specification id, raises
+        Specification.DoesNotExist if the specification does not exist
+        """
+
+        try:
+            return self._specifications[pk]
+        except KeyError:
+            raise Specification.DoesNotExist(
+                'Specification {} does not exist'.format(pk)
+            )
+
+    def has_attribute(self, key):
+        return key in self.attributes
+
+
+def _load_schema():
+    specifications = [
+        SpecificationSchema(*spec) for spec in (
+            Specification.objects
+            .order_by('id')
+            .values_list(
+                'id', 'domain_id', 'attribute__key', 'required', 'fts_rank'
+            )
+        )
+    ]
+
+    domains = [
+        DomainSchema(pk, name, [
+            spec for spec in specifications if spec.domain_id == pk
+        ])
+        for pk, name in Domain.objects.order_by('id').values_list('id', 'name')
+    ]
+
+    attributes = dict(Attribute.objects.values_list('key', 'id'))
+
+    return Schema(domains, attributes, specifications)
+
+
+def invalidate_schema():
+    """
+    Invalidate the cached schema of every process
+    """
+
+    new_cache_version(VERSION_KEY)
+
+
+def get_schema():
+    """
+    Get the Schema, which is loaded once per process and reloaded when a
+    Domain, Attribute or Specification changes in any process
+    """
+
+    global _schema, _schema_version
+
+    version = get_cache_version(VERSION_KEY)
+
+    if _schema is None or _schema_version != version:
+        LOG.debug('Loading schema registry, version: %s', version)
+        _schema = _load_schema()
+        _schema_version = version
+
+    return _schema
@@ -3,7 +3,7 @@ import logging
 LOG = logging.getLogger(__name__)
 
 from django.dispatch import receiver, Signal
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.contrib.contenttypes.models import ContentType
 
 from .models import (
@@ -15,10 +15,19 @@ from .models import (
     SpecificationArchive,
     Locality,
     LocalityArchive,
-    LocalityIndex,
     Value,
     ValueArchive
 )
+from .archive import archive_queue
+from .batching import batch
+from .invalidation import (
+    cluster_queue,
+    completeness_queue,
+    index_queue,
+    locality_statistics_queue,
+    statistics_queue
+)
+from .registry import invalidate_schema
 
 
 # define custom signals
@@ -35,7 +44,7 @@ def archive_basic_info(archive, instance, content_type):
     archive.object_id = instance.pk
 
     archive.version = instance.version
-    archive.changeset = instance.changeset
+    archive.changeset_id = instance.changeset_id
 
 
 @receiver(post_save, sender=Domain)
@@ -44,7 +53,7 @@ def domain_archive_handler(sender, instance, created, raw, **kwargs):
     *post_save* triggered change archival for a Domain object
     """
 
-    ct = ContentType.objects.get(app_label='localities', model='domain')
+    ct = ContentType.objects.get_for_model(Domain)
     archive = DomainArchive()
 
     archive_basic_info(archive, instance, ct)
@@ -53,7 +62,7 @@ def domain_archive_handler(sender, instance, created, raw, **kwargs):
     archive.description = instance.description
     archive.template_fragment = instance.template_fragment
 
-    archive.save()
+    archive_queue.add(archive)
 
 
 @receiver(post_save, sender=Attribute)
@@ -62,7 +71,7 @@ def attribute_archive_handler(sender, instance, created, raw, **kwargs):
     *post_save* triggered change archival for an Attribute object
     """
 
-    ct = ContentType.objects.get(app_label='localities', model='attribute')
+    ct = ContentType.objects.get_for_model(Attribute)
     archive = AttributeArchive()
 
     archive_basic_info(archive, instance, ct)
@@ -70,7 +79,7 @@ def attribute_archive_handler(sender, instance, created, raw, **kwargs):
     archive.key = instance.key
     archive.description = instance.description
 
-    archive.save()
+    archive_queue.add(archive)
 
 
 @receiver(post_save, sender=Specification)
@@ -79,16 +88,47 @@ def specification_archive_handler(sender, instance, created, raw, **kwargs):
     *post_save* triggered change archival for a Specification object
     """
 
-    ct = ContentType.objects.get(app_label='localities', model='specification')
+    ct = ContentType.objects.get_for_model(Specification)
     archive = SpecificationArchive()
 
     archive_basic_info(archive, instance, ct)
 
-    archive.domain_id = instance.domain.pk
-    archive.attribute_id = instance.attribute.pk
+    archive.domain_id = instance.domain_id
+    archive.attribute_id = instance.attribute_id
     archive.required = instance.required
 
-    archive.save()
+    archive_queue.add(archive)
+
+
+@receiver(post_save, sender=Domain)
+@receiver(post_delete, sender=Domain)
+@receiver(post_save, sender=Attribute)
+@receiver(post_delete, sender=Attribute)
+@receiver(post_save, sender=Specification)
+@receiver(post_delete, sender=Specification)
+def schema_handler(sender, instance, **kwargs):
+    """
+    *post_save* and *post_delete* triggered invalidation of the schema
+    registry for Domain, Attribute and Specification objects
+    """
+
+    invalidate_schema()
+
+
+@receiver(post_save, sender=Specification)
+@receiver(post_delete, sender=Specification)
+def specification_completeness_handler(sender, instance, **kwargs):
+    """
+    *post_save* and *post_delete* triggered update of completeness of
+    Localities of the Domain of a created or deleted Specification
+    """
+
+    # other changes of a Specification don't change the number of
+    # Specifications of its Domain
+    if kwargs.get('raw') or not kwargs.get('created', True):
+        return
+
+    completeness_queue.add(instance.domain_id)
 
 
 @receiver(post_save, sender=Locality)
@@ -97,17 +137,69 @@ def locality_archive_handler(sender, instance, created, raw, **kwargs):
     *post_save* triggered change archival for a Locality object
     """
 
-    ct = ContentType.objects.get(app_label='localities', model='locality')
+    ct = ContentType.objects.get_for_model(Locality)
     archive = LocalityArchive()
 
     archive_basic_info(archive, instance, ct)
 
-    archive.domain_id = instance.domain.pk
+    archive.domain_id = instance.domain_id
     archive.uuid = instance.uuid
     archive.upstream_id = instance.upstream_id
     archive.geom = instance.geom
 
-    archive.save()
+    archive_queue.add(archive)
+
+
+@receiver(post_save, sender=Locality)
+def locality_clusters_handler(sender, instance, created, raw, **kwargs):
+    """
+    *post_save* triggered invalidation of clusters for a new or moved Locality
+    """
+
+    old_geom = instance.tracker.previous('geom')
+
+    if old_geom is not None and old_geom != instance.geom:
+        cluster_queue.add(
+            (old_geom.x, old_geom.y), (instance.geom.x, instance.geom.y)
+        )
+    elif created:
+        cluster_queue.add((instance.geom.x, instance.geom.y))
+
+
+@receiver(post_delete, sender=Locality)
+def locality_delete_clusters_handler(sender, instance, **kwargs):
+    """
+    *post_delete* triggered invalidation of clusters for a Locality
+    """
+
+    cluster_queue.add((instance.geom.x, instance.geom.y))
+
+
+@receiver(post_save, sender=Locality)
+def locality_statistics_handler(sender, instance, created, raw, **kwargs):
+    """
+    *post_save* triggered refresh of statistics for a changed Locality
+    """
+
+    statistics_queue.add(
+        instance.tracker.previous('country_id'), instance.country_id
+    )
+
+
+@receiver(post_save, sender=Value)
+def value_statistics_handler(sender, instance, created, raw, **kwargs):
+    """
+    *post_save* triggered refresh of statistics for a changed Value
+    """
+
+    # the Locality of a Value is usually loaded, otherwise its Country is
+    # looked up once for a batch of Values
+    locality = getattr(instance, Value.locality.cache_name, None)
+
+    if locality is None:
+        locality_statistics_queue.add(instance.locality_id)
+    else:
+        statistics_queue.add(locality.country_id)
 
 
 @receiver(post_save, sender=Value)
@@ -116,36 +208,35 @@ def value_archive_handler(sender, instance, created, raw, **kwargs):
     *post_save* triggered change archival for a Value object
     """
 
-    ct = ContentType.objects.get(app_label='localities', model='value')
+    ct = ContentType.objects.get_for_model(Value)
     archive = ValueArchive()
 
     archive_basic_info(archive, instance, ct)
 
-    archive.locality_id = instance.locality.pk
-    archive.specification_id = instance.specification.pk
+    archive.locality_id = instance.locality_id
+    archive.specification_id = instance.specification_id
     archive.data = instance.data
 
-    archive.save()
+    archive_queue.add(archive)
 
 
-@receiver(SIG_locality_values_updated, sender=Locality)
-def values_updated_handler(sender, instance, **kwargs):
+def archive_values(values):
     """
-    *SIG_locality_values_updated* triggered LocalityIndex update for a Locality
+    Change archival for Value objects which were bulk saved, as bulk saves
+    don't trigger *post_save*
     """
 
-    LOG.debug('Updating LocalityIndex for Locality: %s', instance.pk)
-
-    # retrieve ranked attribute values for a Locality
-    loc_fts = instance.prepare_for_fts()
+    # archive all of the values in a single insert
+    with batch(archive_queue):
+        for instance in values:
+            value_archive_handler(Value, instance, created=False, raw=False)
 
-    # in case there is no index for the Locality, create one
-    locind = LocalityIndex.objects.get_or_create(locality=instance)[0]
 
-    # either we got some data or set to ''
-    locind.ranka = loc_fts.get('A', '')
-    locind.rankb = loc_fts.get('B', '')
-    locind.rankc = loc_fts.get('C', '')
-    locind.rankd = loc_fts.get('D', '')
+@receiver(SIG_locality_values_updated, sender=Locality)
+def values_updated_handler(sender, instance, **kwargs):
+    """
+    *SIG_locality_values_updated* triggered LocalityIndex update for a
+    Locality, rebuilt in bulk with other Localities of a batch
+    """
 
-    locind.save()
+    index_queue.add(instance.pk)
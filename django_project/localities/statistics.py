@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+import logging
+LOG = logging.getLogger(__name__)
+
+import json
+
+from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import (
+    Attribute,
+    Country,
+    DataHistory,
+    Locality,
+    LocalityStatistic,
+    Specification,
+    Value
+)
+from .invalidation import STATISTICS_PENDING_KEY
+from .utils import shared_cache
+
+# facility types counted by the statistics, (output key, type value)
+FACILITY_TYPES = (
+    ('hospital', 'hospital'),
+    ('medical_clinic', 'clinic'),
+    ('orthopaedic_clinic', 'orthopaedic')
+)
+
+# completeness (percentage) of complete Localities and of partially complete
+# Localities, other Localities are basic
+COMPLETE_SCORE = 100
+PARTIAL_SCORE = 25
+
+# completeness of Localities with (most of) 4 mandatory and 12 core values,
+# used by simple statistics
+CORE_SCORE = 85
+
+# facility type and completeness counts in a single aggregate pass
+COUNTS_SQL = """
+SELECT
+    count(*),
+    {type_counts},
+    coalesce(sum(CASE WHEN loc.completeness >= %s THEN 1 ELSE 0 END), 0),
+    coalesce(sum(CASE
+        WHEN loc.completeness >= %s AND loc.completeness < %s THEN 1 ELSE 0
+    END), 0),
+    coalesce(sum(CASE WHEN loc.completeness < %s THEN 1 ELSE 0 END), 0)
+FROM {locality} AS loc
+LEFT JOIN (
+    SELECT val.locality_id, lower(val.data) AS type
+    FROM {value} AS val
+    JOIN {specification} AS spec ON spec.id = val.specification_id
+    JOIN {attribute} AS attr ON attr.id = spec.attribute_id
+    WHERE attr.key = 'type'
+) AS loc_type ON loc_type.locality_id = loc.id
+WHERE loc.id IN ({query})
+"""
+
+TYPE_COUNT_SQL = 'coalesce(sum(CASE WHEN type = %s THEN 1 ELSE 0 END), 0)'
+
+# last updates grouped by time, author and mode, the Locality and its name
+# are only reported for updates of a single Locality
+LAST_UPDATES_SQL = """
+SELECT
+    updates.time_changed, updates.username, updates.mode, updates.data_count,
+    coalesce(loc.uuid, ''),
+    coalesce((
+        SELECT val.data
+        FROM {value} AS val
+        JOIN {specification} AS spec ON spec.id = val.specification_id
+        JOIN {attribute} AS attr ON attr.id = spec.attribute_id
+        WHERE val.locality_id = loc.id AND attr.key = 'name'
+        ORDER BY val.id
+        LIMIT 1
+    ), '')
+FROM (
+    SELECT
+        hist.time_changed, usr.username, hist.mode,
+        count(*) AS data_count, min(hist.locality_id) AS locality_id
+    FROM {history} AS hist
+    JOIN {user} AS usr ON usr.id = hist.author_id
+    WHERE hist.locality_id IN ({query})
+    GROUP BY hist.time_changed, usr.username, hist.mode
+    ORDER BY hist.time_changed DESC
+    LIMIT %s
+) AS updates
+LEFT JOIN {locality} AS loc
+    ON loc.id = updates.locality_id AND updates.data_count = 1
+ORDER BY updates.time_changed DESC
+"""
+
+TABLES = {
+    'locality': Locality._meta.db_table,
+    'value': Value._meta.db_table,
+    'specification': Specification._meta.db_table,
+    'attribute': Attribute._meta.db_table,
+    'history': DataHistory._meta.db_table,
+    'user': User._meta.db_table
+}
+
+
+def _counts(cursor, query, query_params):
+    sql = COUNTS_SQL.format(
+        type_counts=', '.join([TYPE_COUNT_SQL] * len(FACILITY_TYPES)),
+        query=query, **TABLES
+    )
+    params = [type_value for _, type_value in FACILITY_TYPES] + [
+        COMPLETE_SCORE,
+        PARTIAL_SCORE, COMPLETE_SCORE,
+        PARTIAL_SCORE
+    ] + list(query_params)
+
+    cursor.execute(sql, params)
+    row = cursor.fetchone()
+
+    type_count = len(FACILITY_TYPES)
+
+    return {
+        'localities': row[0],
+        'numbers': {
+            key: row[1 + pos] for pos, (key, _) in enumerate(FACILITY_TYPES)
+        },
+        'completeness': dict(zip(
+            ('complete', 'partial', 'basic'), row[1 + type_count:]
+        ))
+    }
+
+
+def _last_updates(cursor, query, query_params, limit):
+    sql = LAST_UPDATES_SQL.format(query=query, **TABLES)
+
+    cursor.execute(sql, list(query_params) + [limit])
+
+    return [{
+        'author': author,
+        'date_applied': time_changed,
+        'mode': mode,
+        'locality': locality_name,
+        'locality_uuid': locality_uuid,
+        'data_count': data_count
+    } for (
+        time_changed, author, mode, data_count, locality_uuid, locality_name
+    ) in cursor.fetchall()]
+
+
+def get_statistic(healthsites, last_updates=5):
+    """
+    Statistics of a set of Localities (*healthsites*): number of Localities,
+    numbers of facility types, completeness and last updates
+
+    Statistics are computed using two aggregate queries
+    """
+
+    query, query_params = healthsites.values('id').query.sql_with_params()
+    cursor = connections[healthsites.db].cursor()
+
+    output = _counts(cursor, query, query_params)
+    output['last_update'] = _last_updates(
+        cursor, query, query_params, last_updates
+    )
+
+    return output
+
+
+def _store_statistic(country_id, output):
+    data = json.dumps(output, cls=DjangoJSONEncoder)
+
+    statistics = LocalityStatistic.objects.filter(country_id=country_id)
+
+    if statistics.update(data=data, updated=timezone.now()):
+        return
+
+    try:
+        with transaction.atomic():
+            LocalityStatistic.objects.create(country_id=country_id, data=data)
+    except IntegrityError:
+        # another process stored the statistic in the meantime (statistic of
+        # all Localities is unique by a partial index)
+        statistics.update(data=data, updated=timezone.now())
+
+
+def _load_statistic(data):
+    output = json.loads(data)
+
+    for update in output['last_update']:
+        update['date_applied'] = parse_datetime(update['date_applied'])
+
+    return output
+
+
+def refresh_statistics(country_ids=(None,)):
+    """
+    Recompute stored statistics of Countries, and of all Localities if
+    *country_ids* contain None
+
+    Pending refreshes of the statistics are cleared first, so changes made
+    while they are computed are refreshed again
+    """
+
+    shared_cache().delete_many([
+        STATISTICS_PENDING_KEY.format(country_id) for country_id in country_ids
+    ])
+
+    if None in country_ids:
+        _store_statistic(None, get_statistic(Locality.objects.all()))
+
+    # skip Countries deleted in the meantime
+    for country_id in Country.objects.filter(pk__in=[
+            country_id for country_id in country_ids
+            if country_id is not None]).values_list('pk', flat=True):
+        _store_statistic(
+            country_id, get_statistic(Locality.objects.in_country(country_id))
+        )
+
+    LOG.info('Refreshed statistics of countries %s', country_ids)
+
+
+def get_stored_statistic(country_id=None):
+    """
+    Stored statistics of Localities in a Country, or of all Localities if
+    *country_id* is None, statistics are computed on the first request
+    """
+
+    try:
+        data = LocalityStatistic.objects.get(country_id=country_id).data
+    except LocalityStatistic.DoesNotExist:
+        if country_id is None:
+            healthsites = Locality.objects.all()
+        else:
+            healthsites = Locality.objects.in_country(country_id)
+
+        output = get_statistic(healthsites)
+        _store_statistic(country_id, output)
+
+        return output
+
+    return _load_statistic(data)
@@ -11,17 +11,21 @@ __doc__ = ''
 
 from datetime import datetime
 
+from django.conf import settings
+from django.core.files.base import ContentFile
 from django.core.mail import send_mail
 
+from celery import chord
 from celery.utils.log import get_task_logger
 from .celery import app
 
 logger = get_task_logger(__name__)
 
-from .importers import CSVImporter
+from .exceptions import LocalityImportError
+from .importers import BulkCSVImporter, generate_report
 
 
-def send_email(data_loader, csv_importer):
+def send_email(data_loader, report):
     """Send email for data loader."""
     logger.info('Send email report.')
     recipient_list = [
@@ -37,7 +41,7 @@ def send_email(data_loader, csv_importer):
     email_message += 'Uploaded on: %s\n' % data_loader.date_time_uploaded
     email_message += 'Finished loading on: %s\n\n' % data_loader.date_time_applied
 
-    email_message += csv_importer.generate_report() + '\n\n'
+    email_message += report + '\n\n'
 
     email_message += "You receive this email because you are the admin of Healthsites.io"
 
@@ -50,15 +54,8 @@ def send_email(data_loader, csv_importer):
     )
 
 
-@app.task
-def load_data_task(data_loader_pk):
-    # Put here to avoid circular import
-    from .models import DataLoader
-
-    data_loader = DataLoader.objects.get(pk=data_loader_pk)
-    logger.info('Start loading data')
-    # Process data
-    csv_importer = CSVImporter(
+def _import_data(data_loader, **kwargs):
+    return BulkCSVImporter(
         data_loader,
         'Health',
         data_loader.organisation_name,
@@ -66,21 +63,203 @@ def load_data_task(data_loader_pk):
         data_loader.json_concept_mapping.path,
         use_tabs=False,
         user=data_loader.author,
-        mode=data_loader.data_loader_mode
+        mode=data_loader.data_loader_mode,
+        chunk_size=settings.CSV_IMPORT_CHUNK_SIZE,
+        detect_duplicates=settings.CSV_IMPORT_DETECT_DUPLICATES,
+        name_similarity=settings.CSV_IMPORT_DUPLICATE_NAME_SIMILARITY,
+        **kwargs
     )
-    logger.info('Finish loading data')
 
+
+def _finish_loading(data_loader, report):
     # update data_loader
     data_loader.applied = True
     data_loader.date_time_applied = datetime.utcnow()
-    data_loader.notes = csv_importer.generate_report()
+    data_loader.notes = report
     logger.info('date_time_applied: %s' % data_loader.date_time_applied)
-    data_loader.save()
+    # keep the checkpoint stored by the importer
+    data_loader.save(update_fields=['applied', 'date_time_applied', 'notes'])
 
     # send email
-    logger.info(csv_importer.generate_report())
+    logger.info(report)
+
+    send_email(data_loader, report)
+
+
+def _diff_data(data_loader):
+    # Put here to avoid circular import
+    from .models import DataLoader
+
+    logger.info('Start dry run')
+    csv_importer = _import_data(data_loader, dry_run=True)
+    logger.info('Finish dry run')
+
+    field = DataLoader._meta.get_field('diff_report')
+    diff_report = field.storage.save(
+        field.generate_filename(
+            data_loader, 'diff_report_{}.csv'.format(data_loader.pk)
+        ),
+        ContentFile(csv_importer.diff.to_csv())
+    )
+    report = generate_report(csv_importer.diff.counts, csv_importer.exception)
+    logger.info(report)
+
+    # update, as saving a DataLoader triggers loading of its data
+    DataLoader.objects.filter(pk=data_loader.pk).update(
+        diff_report=diff_report, notes=report
+    )
+
+
+@app.task(bind=True, acks_late=True, max_retries=3, default_retry_delay=60)
+def load_data_task(self, data_loader_pk):
+    # Put here to avoid circular import
+    from .models import Changeset, DataLoader
+
+    data_loader = DataLoader.objects.get(pk=data_loader_pk)
+    if data_loader.applied:
+        logger.info('Data is already loaded')
+        return
+
+    if data_loader.dry_run:
+        if data_loader.diff_report:
+            logger.info('Dry run is already done')
+        else:
+            _diff_data(data_loader)
+        return
+
+    partitions = settings.CSV_IMPORT_PARTITIONS
+    if partitions > 1:
+        logger.info('Start loading data in %s partitions' % partitions)
+        # all partitions share a changeset
+        changeset = Changeset.objects.create(social_user=data_loader.author)
+        chord(
+            load_data_partition_task.s(
+                data_loader_pk, partition, partitions, changeset.pk
+            )
+            for partition in range(partitions)
+        )(finish_load_data_task.s(data_loader_pk))
+        return
+
+    logger.info('Start loading data')
+    # Process data, a retried (or redelivered) task continues after the last
+    # imported chunk of rows
+    try:
+        csv_importer = _import_data(data_loader, checkpoint=True)
+    except LocalityImportError:
+        raise
+    except Exception as exc:
+        logger.exception('Loading data failed, retrying')
+        raise self.retry(exc=exc)
+    logger.info('Finish loading data')
+
+    _finish_loading(data_loader, csv_importer.generate_report())
+
+
+@app.task(bind=True, acks_late=True, max_retries=3, default_retry_delay=60)
+def load_data_partition_task(
+        self, data_loader_pk, partition, partitions, changeset_pk):
+    # Put here to avoid circular import
+    from .models import Changeset, DataLoader
+
+    data_loader = DataLoader.objects.get(pk=data_loader_pk)
+    logger.info('Start loading data partition %s' % partition)
+    # a retried partition is imported again, its rows are matched to already
+    # imported Localities
+    try:
+        csv_importer = _import_data(
+            data_loader, partition=(partition, partitions),
+            changeset=Changeset.objects.get(pk=changeset_pk)
+        )
+    except LocalityImportError as exc:
+        # a failed partition is reported by finish_load_data_task, which
+        # would not run if a partition of the chord failed
+        logger.exception('Loading data partition %s failed' % partition)
+        return {'report': {}, 'exception': str(exc)}
+    except Exception as exc:
+        logger.exception('Loading data partition failed, retrying')
+        raise self.retry(exc=exc)
+    logger.info('Finish loading data partition %s' % partition)
+
+    return {
+        'report': csv_importer.report,
+        'exception': (
+            str(csv_importer.exception) if csv_importer.exception else None
+        )
+    }
+
+
+@app.task
+def finish_load_data_task(results, data_loader_pk):
+    # Put here to avoid circular import
+    from .models import DataLoader
+
+    data_loader = DataLoader.objects.get(pk=data_loader_pk)
+
+    counts = {}
+    for result in results:
+        for key, count in result['report'].iteritems():
+            counts[key] = counts.get(key, 0) + count
+
+    exceptions = sorted(set(
+        result['exception'] for result in results if result['exception']
+    ))
+
+    logger.info('Finish loading data')
+
+    _finish_loading(
+        data_loader, generate_report(counts, '\n'.join(exceptions))
+    )
+
+
+@app.task
+def build_cluster_pyramid_task(zoom_levels=None, icon_sizes=None):
+    # Put here to avoid circular import
+    from .pyramid import build_cluster_pyramid
+
+    logger.info('Start building cluster pyramid')
+    build_cluster_pyramid(zoom_levels, icon_sizes)
+    logger.info('Finish building cluster pyramid')
+
+
+@app.task
+def invalidate_clusters_task(points):
+    # Put here to avoid circular import
+    from .invalidation import invalidate_clusters
+
+    logger.info('Start invalidating clusters of %s points' % len(points))
+    # points are serialized as lists
+    invalidate_clusters([tuple(point) for point in points])
+    logger.info('Finish invalidating clusters')
+
+
+@app.task
+def refresh_statistics_task(country_ids=(None,)):
+    # Put here to avoid circular import
+    from .statistics import refresh_statistics
+
+    logger.info('Start refreshing statistics')
+    refresh_statistics(country_ids)
+    logger.info('Finish refreshing statistics')
+
+
+@app.task
+def rebuild_locality_index_task(locality_ids):
+    # Put here to avoid circular import
+    from .indexing import rebuild_locality_index
+
+    logger.info('Start rebuilding index of %s localities' % len(locality_ids))
+    rebuild_locality_index(locality_ids)
+    logger.info('Finish rebuilding index')
+
+
+@app.task
+def update_domain_completeness_task(domain_ids):
+    # Put here to avoid circular import
+    from .invalidation import update_domain_completeness
 
-    send_email(data_loader, csv_importer)
+    logger.info('Start updating completeness of %s domains' % len(domain_ids))
+    update_domain_completeness(domain_ids)
+    logger.info('Finish updating completeness')
 
 
 @app.task
@@ -7,7 +7,8 @@ from ..models import (
     Value,
     Attribute,
     Specification,
-    Changeset
+    Changeset,
+    Country
 )
 
 
@@ -162,3 +163,11 @@ class ChangesetF(factory.django.DjangoModelFactory):
 
     class Meta:
         model = Changeset
+
+
+class CountryF(factory.django.DjangoModelFactory):
+    name = factory.Sequence(lambda n: "country_{}".format(n))
+    polygon_geometry = 'MULTIPOLYGON (((0 0, 0 10, 10 10, 10 0, 0 0)))'
+
+    class Meta:
+        model = Country
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .model_factories import AttributeF, LocalityF, ValueF
+
+from ..archive import archive_queue
+from ..batching import batch
+from ..models import AttributeArchive, LocalityArchive, ValueArchive
+
+
+class TestArchive(TestCase):
+    def test_archive_batch(self):
+        with CaptureQueriesContext(connection) as queries:
+            with batch(archive_queue):
+                locality = LocalityF.create()
+                value = ValueF.create(locality=locality, data='test')
+                value.data = 'new data'
+                value.save()
+
+                # nothing is archived until the batch is closed
+                self.assertEqual(ValueArchive.objects.count(), 0)
+
+        self.assertEqual(LocalityArchive.objects.count(), 1)
+        self.assertListEqual(
+            [(val.object_id, val.data, val.version)
+             for val in ValueArchive.objects.all()],
+            [(value.pk, u'test', 1), (value.pk, u'new data', 2)]
+        )
+
+        # a single insert per archive model
+        self.assertEqual(len([
+            query for query in queries
+            if query['sql'].startswith(
+                'INSERT INTO "{}"'.format(ValueArchive._meta.db_table))
+        ]), 1)
+
+    def test_archive_batch_exception(self):
+        with self.assertRaises(ValueError):
+            with batch(archive_queue):
+                AttributeF.create()
+                raise ValueError
+
+        self.assertEqual(AttributeArchive.objects.count(), 0)
+
+    def test_archive_outside_batch(self):
+        # batches which don't name the queue don't defer archival
+        with batch():
+            AttributeF.create()
+
+            self.assertEqual(AttributeArchive.objects.count(), 1)
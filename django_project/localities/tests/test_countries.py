@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from django.contrib.gis.geos import Point
+from django.test import TestCase
+
+from .model_factories import CountryF, LocalityF
+
+from ..countries import get_country, get_country_geometry
+from ..models import Country, Locality
+
+
+class TestCountries(TestCase):
+    def setUp(self):
+        self.country = CountryF.create(
+            name='Croatia', polygon_geometry=(
+                'MULTIPOLYGON (((0 0, 0 10, 5 10.001, 10 10, 10 0, 0 0)))'
+            )
+        )
+
+    def test_get_country(self):
+        country = get_country('croatia')
+
+        self.assertEqual(country.pk, self.country.pk)
+        self.assertEqual(country.name, 'Croatia')
+
+        # country is cached in-process, only its version is checked
+        with self.assertNumQueries(1):
+            self.assertIs(get_country('CROATIA'), country)
+
+        self.assertRaises(Country.DoesNotExist, get_country, 'Bosnia')
+
+    def test_get_country_invalidation(self):
+        get_country('Croatia')
+
+        self.country.name = 'Hrvatska'
+        self.country.save()
+
+        self.assertRaises(Country.DoesNotExist, get_country, 'Croatia')
+        self.assertEqual(get_country('hrvatska').pk, self.country.pk)
+
+    def test_get_country_geometry(self):
+        geometry = get_country_geometry(self.country.pk)
+
+        self.assertTrue(geometry.contains(Point(5, 5, srid=4326)))
+        self.assertFalse(geometry.contains(Point(5, 11, srid=4326)))
+
+        # geometry is cached in-process, only its version is checked
+        with self.assertNumQueries(1):
+            self.assertIs(get_country_geometry(self.country.pk), geometry)
+
+        self.assertRaises(Country.DoesNotExist, get_country_geometry, -1)
+
+    def test_get_country_geometry_invalidation(self):
+        get_country_geometry(self.country.pk)
+
+        self.country.polygon_geometry = (
+            'MULTIPOLYGON (((0 0, 0 20, 20 20, 20 0, 0 0)))'
+        )
+        self.country.save()
+
+        self.assertTrue(get_country_geometry(self.country.pk).contains(
+            Point(15, 15, srid=4326)
+        ))
+
+    def test_country_save(self):
+        inside = LocalityF.create(geom='POINT (0.5 0.5)')
+        outside = LocalityF.create(geom='POINT (5 5)')
+
+        self.country.polygon_geometry = (
+            'MULTIPOLYGON (((0 0, 0 1, 1 1, 1 0, 0 0)))'
+        )
+        self.country.save()
+
+        # Localities are reassigned when a Country changes
+        self.assertEqual(
+            Locality.objects.get(pk=inside.pk).country_id, self.country.pk
+        )
+        self.assertIsNone(Locality.objects.get(pk=outside.pk).country_id)
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import bz2
+import codecs
+import gzip
+import os
+import shutil
+import tempfile
+import zipfile
+
+from django.test import TestCase
+
+from .._csv_unicode import UnicodeDictReader
+from ..csv_reader import DictReader, detect_encoding, open_data
+
+CSV_FILENAME = './localities/tests/test_data/test_csv_import_ok.csv'
+
+
+class TestCSVReader(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+        with open(CSV_FILENAME, 'rb') as csv_file:
+            self.data = csv_file.read()
+        with open(CSV_FILENAME, 'rb') as csv_file:
+            self.rows = list(UnicodeDictReader(csv_file))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _read(self, filename):
+        encoding = detect_encoding(filename)
+        with open_data(filename) as data_file:
+            return encoding, list(DictReader(data_file, encoding=encoding))
+
+    def _write(self, name, data):
+        filename = os.path.join(self.tmp_dir, name)
+        with open(filename, 'wb') as data_file:
+            data_file.write(data)
+
+        return filename
+
+    def test_read(self):
+        self.assertEqual(self._read(CSV_FILENAME), ('utf-8', self.rows))
+
+    def test_read_compressed(self):
+        gzip_filename = os.path.join(self.tmp_dir, 'data.csv.gz')
+        with gzip.open(gzip_filename, 'wb') as gzip_file:
+            gzip_file.write(self.data)
+
+        bz2_filename = self._write('data.csv.bz2', bz2.compress(self.data))
+
+        zip_filename = os.path.join(self.tmp_dir, 'data.zip')
+        archive = zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED)
+        archive.writestr('data.csv', self.data)
+        archive.close()
+
+        self.assertEqual(self._read(gzip_filename), ('utf-8', self.rows))
+        self.assertEqual(self._read(bz2_filename), ('utf-8', self.rows))
+        self.assertEqual(self._read(zip_filename), ('utf-8', self.rows))
+
+    def test_position(self):
+        bz2_filename = self._write('data.csv.bz2', bz2.compress(self.data))
+
+        for filename in (CSV_FILENAME, bz2_filename):
+            with open_data(filename) as data_file:
+                self.assertEqual(data_file.position(), 0)
+                data_file.read()
+                # position in the compressed file
+                self.assertEqual(
+                    data_file.position(), os.path.getsize(filename)
+                )
+
+    def test_read_zip_many_files(self):
+        zip_filename = os.path.join(self.tmp_dir, 'data.zip')
+        archive = zipfile.ZipFile(zip_filename, 'w')
+        archive.writestr('data1.csv', self.data)
+        archive.writestr('data2.csv', self.data)
+        archive.close()
+
+        self.assertRaises(IOError, open_data, zip_filename)
+
+    def test_detect_encoding(self):
+        text = self.data.decode('utf-8')
+
+        self.assertEqual(self._read(self._write(
+            'bom.csv', codecs.BOM_UTF8 + self.data
+        )), ('utf-8-sig', self.rows))
+        self.assertEqual(self._read(self._write(
+            'utf16.csv', text.encode('utf-16')
+        )), ('utf-16', self.rows))
+
+        self.assertEqual(self._read(self._write(
+            'cp1252.csv', u'name,url\nSant\xe9 €,\n'.encode('cp1252')
+        )), ('cp1252', [{u'name': u'Sant\xe9 €', u'url': u''}]))
+
+    def test_batches(self):
+        filename = self._write(
+            'data.txt', 'name\tnum\n\xc3\xa9,1\t1\n\n"a\nb"\t2\nc\t3\n'
+        )
+
+        with open(filename, 'rb') as data_file:
+            batches = list(
+                DictReader(data_file, delimiter='\t', batch_size=2).batches()
+            )
+
+        # empty rows are skipped
+        self.assertEqual(batches, [
+            [{u'name': u'\xe9,1', u'num': u'1'}],
+            [{u'name': u'a\nb', u'num': u'2'}, {u'name': u'c', u'num': u'3'}]
+        ])
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase
+
+from .model_factories import (
+    AttributeF,
+    DomainSpecification1AF,
+    LocalityF,
+    ValueF
+)
+
+from ..duplicates import DuplicateDetector, GridIndex
+
+
+class TestDuplicates(TestCase):
+    def test_grid_index(self):
+        index = GridIndex(0.01)
+        index.add(10.0, 10.0, 'a')
+        index.add(10.009, 9.991, 'b')
+        index.add(10.02, 10.0, 'c')
+
+        self.assertEqual(sorted(index.nearby(10.0, 10.0)), ['a', 'b'])
+        # points in neighbouring cells
+        self.assertEqual(sorted(index.nearby(10.011, 10.0)), ['a', 'b', 'c'])
+        self.assertEqual(list(index.nearby(-10.0, -10.0)), [])
+
+    def test_duplicate_detector(self):
+        attr = AttributeF.create(key='name')
+        dom = DomainSpecification1AF.create(spec1__attribute=attr)
+        loc = LocalityF.create(domain=dom, geom='POINT (30.9227 -26.9877)')
+        ValueF.create(
+            locality=loc, specification=dom.specification_set.get(),
+            data='Athalia Satellite Clinic'
+        )
+
+        detector = DuplicateDetector(0.01)
+
+        self.assertTrue(detector.is_duplicate(30.925, -26.985))
+        self.assertFalse(detector.is_duplicate(30.935, -26.985))
+
+        # new localities are duplicates of later localities
+        detector.add(30.935, -26.985)
+        self.assertTrue(detector.is_duplicate(30.936, -26.984))
+
+    def test_duplicate_detector_name_similarity(self):
+        attr = AttributeF.create(key='name')
+        dom = DomainSpecification1AF.create(spec1__attribute=attr)
+        loc = LocalityF.create(domain=dom, geom='POINT (30.9227 -26.9877)')
+        ValueF.create(
+            locality=loc, specification=dom.specification_set.get(),
+            data='Athalia Satellite Clinic'
+        )
+
+        detector = DuplicateDetector(0.01, name_similarity=0.8)
+
+        self.assertTrue(detector.is_duplicate(
+            30.925, -26.985, 'Athalia satellite clinic'
+        ))
+        self.assertFalse(detector.is_duplicate(
+            30.925, -26.985, 'Amsterdam CHC'
+        ))
+        # localities without names are not duplicates
+        self.assertFalse(detector.is_duplicate(30.925, -26.985))
@@ -1,4 +1,9 @@
 # -*- coding: utf-8 -*-
+import gzip
+import zipfile
+from cStringIO import StringIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
 
 from .model_factories import (
@@ -9,7 +14,12 @@ from .model_factories import (
     DomainSpecification1AF
 )
 
-from ..forms import LocalityForm, DomainForm, DomainModelForm
+from ..forms import (
+    DataLoaderForm,
+    LocalityForm,
+    DomainForm,
+    DomainModelForm
+)
 
 
 class TestLocalityForms(TestCase):
@@ -85,3 +95,31 @@ class TestLocalityForms(TestCase):
             {'name': 'Test', 'template_fragment': '{{ test }}'}
         )
         self.assertTrue(frm.is_valid())
+
+    def _data_loader_form(self, csv_name, csv_data):
+        return DataLoaderForm({
+            'organisation_name': 'test',
+            'data_loader_mode': 1
+        }, files={
+            'json_concept_mapping': SimpleUploadedFile('map.json', '{}'),
+            'csv_data': SimpleUploadedFile(csv_name, csv_data)
+        })
+
+    def test_DataLoaderForm_compressed_data(self):
+        data = StringIO()
+        with gzip.GzipFile(fileobj=data, mode='wb') as gzip_file:
+            gzip_file.write('name,lat,lon\n')
+
+        frm = self._data_loader_form('data.csv.gz', data.getvalue())
+        self.assertTrue(frm.is_valid())
+
+    def test_DataLoaderForm_bad_zip_data(self):
+        data = StringIO()
+        archive = zipfile.ZipFile(data, 'w')
+        archive.writestr('data1.csv', 'name,lat,lon\n')
+        archive.writestr('data2.csv', 'name,lat,lon\n')
+        archive.close()
+
+        frm = self._data_loader_form('data.zip', data.getvalue())
+        self.assertFalse(frm.is_valid())
+        self.assertIn('csv_data', frm.errors)
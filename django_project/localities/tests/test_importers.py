@@ -1,16 +1,34 @@
 # -*- coding: utf-8 -*-
+import json
+import os
+import tempfile
+
 from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from social_users.tests.model_factories import UserF
 
 from .model_factories import (
     AttributeF,
+    ChangesetF,
     LocalityF,
     DomainSpecification2AF,
     DomainSpecification3AF
 )
 
-from ..importers import CSVImporter
-from ..models import Locality, Value
+from ..importers import BulkCSVImporter, CSVImporter
+from ..invalidation import cluster_queue, index_queue, statistics_queue
+from ..models import (
+    DataHistory,
+    DataLoader,
+    Locality,
+    LocalityArchive,
+    Value,
+    ValueArchive
+)
 from ..exceptions import LocalityImportError
+from ..tasks import finish_load_data_task, load_data_partition_task
 
 
 class TestImporters(TestCase):
@@ -140,3 +158,447 @@ class TestImporters(TestCase):
                 u'HIV Treatment; HIV Counseling; HIV Testing',
                 u'Andrieskraal Satellite Clinic'
             ])
+
+    def test_chunks(self):
+        attr1 = AttributeF.create(key='name')
+        attr2 = AttributeF.create(key='url')
+        attr3 = AttributeF.create(key='services')
+
+        DomainSpecification3AF.create(
+            name='Test', spec1__attribute=attr1, spec2__attribute=attr2,
+            spec3__attribute=attr3
+        )
+
+        user = UserF.create(username='test')
+        data_loader = DataLoader(
+            date_time_uploaded=timezone.now(), data_loader_mode=1
+        )
+
+        # the duplicated row is in the second chunk
+        importer = CSVImporter(
+            data_loader, 'Test', 'test_imp',
+            './localities/tests/test_data/test_csv_import_ok.csv',
+            './localities/tests/test_data/test_csv_import_map.json',
+            user=user, chunk_size=3
+        )
+
+        self.assertEqual(Locality.objects.count(), 3)
+        self.assertEqual(Value.objects.count(), 8)
+        self.assertDictEqual(importer.report, {
+            'created': 3, 'modified': 0, 'duplicated': 0, 'skipped': 1
+        })
+        # every chunk is saved in the same changeset
+        self.assertEqual(
+            Locality.objects.values('changeset').distinct().count(), 1
+        )
+        self.assertEqual(importer.parsed_data, {})
+
+        importer = CSVImporter(
+            data_loader, 'Test', 'test_imp',
+            './localities/tests/test_data/test_csv_import_ok.csv',
+            './localities/tests/test_data/test_csv_import_map.json',
+            user=user, chunk_size=1
+        )
+
+        self.assertEqual(Locality.objects.count(), 3)
+        self.assertDictEqual(importer.report, {
+            'created': 0, 'modified': 3, 'duplicated': 0, 'skipped': 1
+        })
+
+    def test_chunks_flush_once(self):
+        attr1 = AttributeF.create(key='name')
+        attr2 = AttributeF.create(key='url')
+        attr3 = AttributeF.create(key='services')
+
+        DomainSpecification3AF.create(
+            name='Test', spec1__attribute=attr1, spec2__attribute=attr2,
+            spec3__attribute=attr3
+        )
+        user = UserF.create(username='test')
+
+        flushed = []
+        queues = (cluster_queue, index_queue, statistics_queue)
+        flushes = [queue.flush for queue in queues]
+        for queue in queues:
+            queue.flush = flushed.append
+        try:
+            CSVImporter(
+                DataLoader(date_time_uploaded=timezone.now()), 'Test',
+                'test_imp',
+                './localities/tests/test_data/test_csv_import_ok.csv',
+                './localities/tests/test_data/test_csv_import_map.json',
+                user=user, chunk_size=1
+            )
+        finally:
+            for queue, flush in zip(queues, flushes):
+                queue.flush = flush
+
+        # clusters, index and statistics are refreshed after the last chunk
+        self.assertEqual(len(flushed), 3)
+        self.assertEqual(len(flushed[0]), 3)
+        self.assertEqual(sorted(set(flushed[1])), sorted(
+            Locality.objects.values_list('id', flat=True)
+        ))
+
+    def _import(self, importer_class, source_name, mode):
+        data_loader = DataLoader(
+            date_time_uploaded=timezone.now(), data_loader_mode=mode
+        )
+
+        return importer_class(
+            data_loader, 'Test', source_name,
+            './localities/tests/test_data/test_csv_import_ok.csv',
+            './localities/tests/test_data/test_csv_import_map.json',
+            user=self.user, mode=mode
+        )
+
+    def _imported(self, source_name):
+        localities = Locality.objects.filter(
+            upstream_id__startswith=source_name
+        ).order_by('upstream_id')
+
+        return [(
+            loc.upstream_id.split(u'¶')[1], loc.version, loc.completeness,
+            loc.repr_dict()['values'],
+            sorted(loc.value_set.values_list('version', flat=True)),
+            LocalityArchive.objects.filter(object_id=loc.pk).count(),
+            ValueArchive.objects.filter(locality_id=loc.pk).count(),
+            DataHistory.objects.filter(locality=loc).count()
+        ) for loc in localities]
+
+    def test_bulk_import(self):
+        attr1 = AttributeF.create(key='name')
+        attr2 = AttributeF.create(key='url')
+        attr3 = AttributeF.create(key='services')
+
+        DomainSpecification3AF.create(
+            name='Test', spec1__attribute=attr1, spec2__attribute=attr2,
+            spec3__attribute=attr3
+        )
+        self.user = UserF.create(username='test')
+
+        reports = []
+        for importer_class, source_name in (
+                (CSVImporter, 'rows'), (BulkCSVImporter, 'bulk')):
+            reports.append(
+                self._import(importer_class, source_name, 1).report
+            )
+
+            # the first Locality has no name in the file
+            loc = Locality.objects.get(upstream_id=source_name + u'¶1')
+            loc.set_values({'name': 'old name'}, social_user=self.user)
+
+            # update mode keeps the name, replace mode empties it
+            reports.append(
+                self._import(importer_class, source_name, 2).report
+            )
+            reports.append(
+                self._import(importer_class, source_name, 1).report
+            )
+
+        self.assertEqual(reports[:3], reports[3:])
+        self.assertEqual(self._imported('rows'), self._imported('bulk'))
+        self.assertEqual(Locality.objects.count(), 6)
+
+    def test_bulk_import_matched_twice(self):
+        attr1 = AttributeF.create(key='name')
+        attr2 = AttributeF.create(key='services')
+
+        dom = DomainSpecification2AF.create(
+            name='Test', spec1__attribute=attr1, spec2__attribute=attr2
+        )
+        user = UserF.create(username='test')
+
+        # matched by uuid of the first row, and upstream_id of the second
+        loc = LocalityF.create(
+            uuid='93b7e8c4621a4597938dfd3d27659162', upstream_id=u'bulk¶2',
+            domain=dom
+        )
+
+        importer = BulkCSVImporter(
+            DataLoader(
+                date_time_uploaded=timezone.now(), data_loader_mode=1
+            ), 'Test', 'bulk',
+            './localities/tests/test_data/test_csv_import_bad.csv',
+            './localities/tests/test_data/test_csv_import_map.json',
+            user=user
+        )
+
+        # the Locality is updated once, by the row matched by uuid
+        self.assertEqual(importer.report['duplicated'], 1)
+        self.assertEqual(Locality.objects.get(pk=loc.pk).version, 2)
+        self.assertEqual(DataHistory.objects.filter(locality=loc).count(), 1)
+        self.assertEqual(
+            loc.value_set.get(specification__attribute=attr1).data,
+            u'Andrieskraal Satellite Clinic'
+        )
+
+    def test_bulk_import_same_new_uuid(self):
+        attr1 = AttributeF.create(key='name')
+        attr2 = AttributeF.create(key='services')
+
+        DomainSpecification2AF.create(
+            name='Test', spec1__attribute=attr1, spec2__attribute=attr2
+        )
+        user = UserF.create(username='test')
+
+        csv_file = tempfile.NamedTemporaryFile(suffix='.csv', delete=False)
+        with csv_file:
+            csv_file.write(
+                '_num,name,lat,lon,uuid\n'
+                '1,First,-33.7,24.6,0bb0c4e0d4b44b3aa1b16a9f1e4c3a11\n'
+                '2,Second,-26.9,30.9,0bb0c4e0d4b44b3aa1b16a9f1e4c3a11\n'
+            )
+
+        try:
+            importer = BulkCSVImporter(
+                DataLoader(
+                    date_time_uploaded=timezone.now(), data_loader_mode=1
+                ), 'Test', 'bulk', csv_file.name,
+                './localities/tests/test_data/test_csv_import_map.json',
+                user=user
+            )
+        finally:
+            os.remove(csv_file.name)
+
+        # only the first of the rows with the same uuid is created
+        self.assertIsNone(importer.exception)
+        self.assertEqual(importer.report['created'], 1)
+        self.assertEqual(importer.report['duplicated'], 1)
+        self.assertEqual(
+            Locality.objects.get(
+                uuid='0bb0c4e0d4b44b3aa1b16a9f1e4c3a11'
+            ).upstream_id,
+            u'bulk¶1'
+        )
+
+    def test_checkpoint(self):
+        attr1 = AttributeF.create(key='name')
+        attr2 = AttributeF.create(key='url')
+        attr3 = AttributeF.create(key='services')
+
+        DomainSpecification3AF.create(
+            name='Test', spec1__attribute=attr1, spec2__attribute=attr2,
+            spec3__attribute=attr3
+        )
+        user = UserF.create(username='test')
+
+        # bypass loading of data on save
+        DataLoader.objects.bulk_create([DataLoader(
+            organisation_name='test', data_loader_mode=1, author=user,
+            date_time_uploaded=timezone.now()
+        )])
+        data_loader = DataLoader.objects.get()
+
+        # an interrupted import, which saved the first two rows
+        changeset = ChangesetF.create(social_user=user)
+        DataLoader.objects.update(
+            checkpoint_row=2, checkpoint_changeset=changeset,
+            checkpoint_report=json.dumps({
+                'created': 2, 'modified': 0, 'duplicated': 0, 'skipped': 0
+            })
+        )
+
+        importer = CSVImporter(
+            data_loader, 'Test', 'test_imp',
+            './localities/tests/test_data/test_csv_import_ok.csv',
+            './localities/tests/test_data/test_csv_import_map.json',
+            user=user, chunk_size=1, checkpoint=True
+        )
+
+        # only the third row is imported, the fourth is its duplicate
+        self.assertEqual(
+            list(Locality.objects.values_list('upstream_id', 'changeset')),
+            [(u'test_imp¶3', changeset.pk)]
+        )
+        self.assertDictEqual(importer.report, {
+            'created': 3, 'modified': 0, 'duplicated': 0, 'skipped': 1
+        })
+
+        data_loader = DataLoader.objects.get()
+        self.assertEqual(data_loader.checkpoint_row, 4)
+        self.assertDictEqual(
+            json.loads(data_loader.checkpoint_report), importer.report
+        )
+        self.assertEqual(data_loader.checkpoint_changeset, changeset)
+
+    def test_partitions(self):
+        attr1 = AttributeF.create(key='name')
+        attr2 = AttributeF.create(key='url')
+        attr3 = AttributeF.create(key='services')
+
+        DomainSpecification3AF.create(
+            name='Test', spec1__attribute=attr1, spec2__attribute=attr2,
+            spec3__attribute=attr3
+        )
+        self.user = UserF.create(username='test')
+        changeset = ChangesetF.create(social_user=self.user)
+
+        report = {}
+        for partition in range(2):
+            importer = BulkCSVImporter(
+                DataLoader(date_time_uploaded=timezone.now()), 'Test',
+                'test_imp',
+                './localities/tests/test_data/test_csv_import_ok.csv',
+                './localities/tests/test_data/test_csv_import_map.json',
+                user=self.user, partition=(partition, 2), changeset=changeset
+            )
+            for key, count in importer.report.iteritems():
+                report[key] = report.get(key, 0) + count
+
+        # every row is imported by exactly one of the partitions
+        self.assertDictEqual(report, {
+            'created': 3, 'modified': 0, 'duplicated': 0, 'skipped': 1
+        })
+        self.assertEqual(
+            sorted(Locality.objects.values_list('upstream_id', 'changeset')),
+            [(u'test_imp¶{}'.format(num), changeset.pk) for num in (1, 2, 3)]
+        )
+
+    @override_settings(MEDIA_ROOT=os.path.abspath(
+        './localities/tests/test_data'
+    ))
+    def test_partitions_failed(self):
+        user = UserF.create(username='test')
+        changeset = ChangesetF.create(social_user=user)
+
+        # bypass loading of data on save
+        DataLoader.objects.bulk_create([DataLoader(
+            organisation_name='test', data_loader_mode=1, author=user,
+            date_time_uploaded=timezone.now(),
+            csv_data='test_csv_import_ok.csv',
+            json_concept_mapping='test_csv_import_map.json'
+        )])
+        data_loader = DataLoader.objects.get()
+
+        # the 'Health' domain doesn't exist
+        failed = load_data_partition_task(data_loader.pk, 0, 2, changeset.pk)
+        self.assertEqual(failed, {
+            'report': {}, 'exception': 'Domain "Health" does not exist'
+        })
+
+        # the import is finished, and the failure is reported
+        finish_load_data_task([{
+            'report': {'created': 2, 'modified': 0}, 'exception': None
+        }, failed], data_loader.pk)
+
+        data_loader = DataLoader.objects.get()
+        self.assertTrue(data_loader.applied)
+        self.assertIn('Number of created locality is 2', data_loader.notes)
+        self.assertIn('Domain "Health" does not exist', data_loader.notes)
+
+    def test_duplicates(self):
+        attr1 = AttributeF.create(key='name')
+        attr2 = AttributeF.create(key='url')
+        attr3 = AttributeF.create(key='services')
+
+        DomainSpecification3AF.create(
+            name='Test', spec1__attribute=attr1, spec2__attribute=attr2,
+            spec3__attribute=attr3
+        )
+        user = UserF.create(username='test')
+
+        # near the second row
+        LocalityF.create(geom='POINT (30.925 -26.985)')
+
+        reports = []
+        for importer_class, source_name in (
+                (CSVImporter, 'rows'), (BulkCSVImporter, 'bulk')):
+            reports.append(importer_class(
+                DataLoader(date_time_uploaded=timezone.now()), 'Test',
+                source_name,
+                './localities/tests/test_data/test_csv_import_ok.csv',
+                './localities/tests/test_data/test_csv_import_map.json',
+                user=user, detect_duplicates=True
+            ).report)
+
+        self.assertEqual(reports, [{
+            'created': 2, 'modified': 0, 'duplicated': 1, 'skipped': 1
+        }, {
+            # every row is a duplicate of a row of the first import
+            'created': 0, 'modified': 0, 'duplicated': 3, 'skipped': 1
+        }])
+        self.assertEqual(Locality.objects.count(), 3)
+
+    def test_dry_run(self):
+        attr1 = AttributeF.create(key='name')
+        attr2 = AttributeF.create(key='url')
+        attr3 = AttributeF.create(key='services')
+
+        DomainSpecification3AF.create(
+            name='Test', spec1__attribute=attr1, spec2__attribute=attr2,
+            spec3__attribute=attr3
+        )
+        self.user = UserF.create(username='test')
+
+        self._import(CSVImporter, 'test_imp', 1)
+        # the first Locality has no name in the file
+        loc = Locality.objects.get(upstream_id=u'test_imp¶1')
+        loc.set_values({'name': 'old name'}, social_user=self.user)
+
+        imported = self._imported('test_imp')
+        archives = (
+            LocalityArchive.objects.count(), ValueArchive.objects.count()
+        )
+
+        diffs = []
+        for importer_class, mode in (
+                (CSVImporter, 1), (BulkCSVImporter, 1), (BulkCSVImporter, 2)):
+            importer = importer_class(
+                DataLoader(date_time_uploaded=timezone.now()), 'Test',
+                'test_imp',
+                './localities/tests/test_data/test_csv_import_ok.csv',
+                './localities/tests/test_data/test_csv_import_map.json',
+                user=self.user, mode=mode, dry_run=True
+            )
+            self.assertDictEqual(importer.report, {
+                'created': 0, 'modified': 3, 'duplicated': 0, 'skipped': 1
+            })
+            diffs.append((importer.diff.counts, importer.diff.rows))
+
+        # replace mode blanks the name, update mode keeps it
+        self.assertEqual(diffs[0], (
+            {'created': 0, 'modified': 0, 'blanked': 1, 'untouched': 2},
+            [(u'test_imp¶1', 'blanked', 'name', 'old name', '')]
+        ))
+        self.assertEqual(diffs[0], diffs[1])
+        self.assertEqual(diffs[2], (
+            {'created': 0, 'modified': 0, 'blanked': 0, 'untouched': 3}, []
+        ))
+
+        # nothing is changed
+        self.assertEqual(self._imported('test_imp'), imported)
+        self.assertEqual(
+            (LocalityArchive.objects.count(), ValueArchive.objects.count()),
+            archives
+        )
+
+    def test_dry_run_created(self):
+        attr1 = AttributeF.create(key='name')
+        attr2 = AttributeF.create(key='services')
+
+        DomainSpecification2AF.create(
+            name='Test', spec1__attribute=attr1, spec2__attribute=attr2
+        )
+        user = UserF.create(username='test')
+
+        importer = BulkCSVImporter(
+            DataLoader(date_time_uploaded=timezone.now()), 'Test', 'test_imp',
+            './localities/tests/test_data/test_csv_import_ok.csv',
+            './localities/tests/test_data/test_csv_import_map.json',
+            user=user, dry_run=True
+        )
+
+        self.assertEqual(Locality.objects.count(), 0)
+        self.assertDictEqual(importer.diff.counts, {
+            'created': 3, 'modified': 0, 'blanked': 0, 'untouched': 0
+        })
+        self.assertEqual(importer.diff.rows[:2], [
+            (u'test_imp¶1', 'created', 'services', '',
+             'HIV Treatment; HIV Counseling; HIV Testing'),
+            (u'test_imp¶2', 'created', 'name', '', 'Athalia Satellite Clinic')
+        ])
+        self.assertEqual(
+            importer.diff.to_csv().splitlines()[0],
+            'upstream_id,status,attribute,old,new'
+        )
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase
+
+from social_users.tests.model_factories import UserF
+
+from .model_factories import AttributeF, DomainSpecification2AF, LocalityF
+
+from ..batching import batch
+from ..indexing import locality_id_chunks, rebuild_locality_index
+from ..models import LocalityIndex
+
+
+class TestIndexing(TestCase):
+    def setUp(self):
+        self.user = UserF.create(username='test')
+
+        self.domain = DomainSpecification2AF.create(
+            spec1__attribute=AttributeF.create(key='name'),
+            spec1__fts_rank='A',
+            spec2__attribute=AttributeF.create(key='services')
+        )
+
+    def test_set_values(self):
+        locality = LocalityF.create(domain=self.domain)
+        locality.set_values({
+            'name': 'General hospital', 'services': 'surgery'
+        }, social_user=self.user)
+
+        index = LocalityIndex.objects.get(locality=locality)
+        self.assertEqual(
+            (index.ranka, index.rankb, index.rankc, index.rankd),
+            (u'General hospital', u'', u'', u'surgery')
+        )
+
+        # the search vector is rebuilt with the index
+        self.assertEqual(
+            list(LocalityIndex.objects.filter(fts_index__search='surgery')),
+            [index]
+        )
+
+        locality.set_values({'services': 'dentistry'}, social_user=self.user)
+
+        self.assertEqual(LocalityIndex.objects.count(), 1)
+        self.assertFalse(
+            LocalityIndex.objects.filter(fts_index__search='surgery').exists()
+        )
+
+    def test_batch(self):
+        with batch():
+            for name in ('first', 'second'):
+                locality = LocalityF.create(domain=self.domain)
+                locality.set_values({'name': name}, social_user=self.user)
+
+            # nothing is indexed until the batch is closed
+            self.assertEqual(LocalityIndex.objects.count(), 0)
+
+        self.assertEqual(
+            sorted(LocalityIndex.objects.values_list('ranka', flat=True)),
+            [u'first', u'second']
+        )
+
+    def test_rebuild_locality_index(self):
+        locality = LocalityF.create(domain=self.domain)
+
+        rebuild_locality_index([locality.pk])
+
+        index = LocalityIndex.objects.get(locality=locality)
+        self.assertEqual(index.ranka, u'')
+
+    def test_locality_id_chunks(self):
+        ids = [LocalityF.create().pk for _ in range(5)]
+
+        self.assertEqual(
+            list(locality_id_chunks(2)), [ids[0:2], ids[2:4], ids[4:]]
+        )
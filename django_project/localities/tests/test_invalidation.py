@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.contrib.gis.geos import Point
+
+from .model_factories import LocalityF
+
+from ..batching import DeferredQueue, batch
+from ..models import LocalityCluster
+from ..pyramid import build_cluster_pyramid
+from ..tiles import tile_cache, tile_cache_key
+
+
+class TestDeferredQueue(TestCase):
+    def setUp(self):
+        self.flushed = []
+        self.queue = DeferredQueue(self.flushed.append)
+
+    def test_add(self):
+        self.queue.add(1, 2)
+
+        self.assertListEqual(self.flushed, [[1, 2]])
+
+    def test_batch(self):
+        with batch():
+            self.queue.add(1)
+            with batch():
+                self.queue.add(2)
+            self.queue.add(3)
+
+            self.assertListEqual(self.flushed, [])
+
+        self.assertListEqual(self.flushed, [[1, 2, 3]])
+
+    def test_batch_exception(self):
+        with self.assertRaises(ValueError):
+            with batch():
+                self.queue.add(1)
+                raise ValueError
+
+        self.assertListEqual(self.flushed, [])
+
+        self.queue.add(2)
+
+        self.assertListEqual(self.flushed, [[2]])
+
+
+@override_settings(
+    CLUSTER_PYRAMID_ZOOM_LEVELS=[1, 18],
+    CLUSTER_PYRAMID_ICON_SIZES=((40, 40),)
+)
+class TestInvalidation(TestCase):
+    def setUp(self):
+        tile_cache().clear()
+
+        self.locality = LocalityF.create(
+            uuid='93b7e8c4621a4597938dfd3d27659160', geom='POINT(16 45)'
+        )
+        LocalityF.create(
+            uuid='93b7e8c4621a4597938dfd3d27659161', geom='POINT(17 46)'
+        )
+
+        build_cluster_pyramid()
+
+    def _counts(self, zoom):
+        return sorted(
+            LocalityCluster.objects.filter(zoom=zoom).values_list(
+                'count', flat=True)
+        )
+
+    def test_move_locality(self):
+        tile_cache().set(tile_cache_key(1, 1, 0, 40, 40), '[]')
+        tile_cache().set(tile_cache_key(1, 0, 1, 40, 40), '[]')
+
+        self.locality.geom = Point(-100, 10)
+        self.locality.save()
+
+        # both the old and the new cell are reclustered
+        self.assertListEqual(self._counts(1), [1, 1])
+        self.assertListEqual(self._counts(18), [1, 1])
+
+        # tiles of the old and the new cell are removed from the cache
+        self.assertIsNone(tile_cache().get(tile_cache_key(1, 1, 0, 40, 40)))
+        self.assertIsNone(tile_cache().get(tile_cache_key(1, 0, 1, 40, 40)))
+
+    def test_single_edit_keeps_other_tiles(self):
+        tile_cache().set(tile_cache_key(1, 0, 1, 40, 40), '[]')
+
+        LocalityF.create(geom='POINT(16.5 45.5)')
+
+        self.assertListEqual(self._counts(1), [3])
+        self.assertEqual(
+            tile_cache().get(tile_cache_key(1, 0, 1, 40, 40)), '[]'
+        )
+
+    def test_batch(self):
+        with batch():
+            LocalityF.create(geom='POINT(-100 10)')
+            LocalityF.create(geom='POINT(-101 11)')
+
+            # nothing is refreshed until the batch is closed
+            self.assertListEqual(self._counts(1), [2])
+
+        self.assertListEqual(self._counts(1), [2, 2])
+        self.assertListEqual(self._counts(18), [1, 1, 1, 1])
+
+    @override_settings(CLUSTER_INVALIDATION_MAX_CELLS=1)
+    def test_rebuild_level(self):
+        tile_cache().set(tile_cache_key(1, 0, 1, 40, 40), '[]')
+
+        with batch():
+            LocalityF.create(geom='POINT(-100 10)')
+            LocalityF.create(geom='POINT(100 -10)')
+
+        self.assertListEqual(self._counts(1), [1, 1, 2])
+        self.assertIsNone(tile_cache().get(tile_cache_key(1, 0, 1, 40, 40)))
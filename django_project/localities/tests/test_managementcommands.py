@@ -1,11 +1,18 @@
 # -*- coding: utf-8 -*-
+from StringIO import StringIO
+
 from django.test import TestCase
 from django.core.management import call_command
 from django.core.management.base import CommandError
 
-from .model_factories import AttributeF, DomainSpecification3AF
+from .model_factories import (
+    AttributeF,
+    CountryF,
+    DomainSpecification3AF,
+    LocalityF
+)
 
-from ..models import Locality, Value
+from ..models import Country, Locality, LocalityIndex, Value
 
 
 class TestManagementCommands(TestCase):
@@ -35,3 +42,49 @@ class TestManagementCommands(TestCase):
         self.assertRaises(
             CommandError, call_command, 'import_csv', 'Test', 'test_imp'
         )
+
+    def test_benchmark_clustering(self):
+        out = StringIO()
+
+        call_command(
+            'benchmark_clustering', points=100, max_zoom=2, linear=True,
+            stdout=out
+        )
+
+        # header and a line per zoom level
+        self.assertEqual(len(out.getvalue().splitlines()), 4)
+
+    def test_assign_countries(self):
+        LocalityF.create(geom='POINT (5 5)')
+        LocalityF.create(geom='POINT (20 20)')
+        # bypass the assignment on save
+        country = CountryF.build()
+        Country.objects.bulk_create([country])
+        country = Country.objects.get()
+
+        out = StringIO()
+        call_command('assign_countries', stdout=out)
+
+        self.assertEqual(out.getvalue().strip(), 'Assigned 2 localities')
+        self.assertEqual(
+            list(Locality.objects.values_list('country', flat=True)
+                 .order_by('id')),
+            [country.pk, None]
+        )
+
+        out = StringIO()
+        call_command('assign_countries', missing=True, stdout=out)
+
+        self.assertEqual(out.getvalue().strip(), 'Assigned 1 localities')
+
+    def test_rebuild_locality_index(self):
+        for _ in range(3):
+            LocalityF.create()
+
+        out = StringIO()
+        call_command('rebuild_locality_index', chunk_size=2, stdout=out)
+
+        self.assertEqual(
+            out.getvalue().strip(), 'Rebuilt index of 3 localities'
+        )
+        self.assertEqual(LocalityIndex.objects.count(), 3)
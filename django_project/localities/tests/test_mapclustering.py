@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import random
+
 from django.test import TestCase
 
 
@@ -8,7 +10,20 @@ from ..map_clustering import (
     within_bbox,
     cluster,
     overlapping_area,
-    update_minbbox
+    update_minbbox,
+    catchment_cell_size,
+    grid_cell,
+    grid_cluster,
+    linear_cluster,
+    lnglat_to_pixel,
+    pixel_to_lnglat,
+    cell_index,
+    cell_cluster,
+    tile_index,
+    tile_bbox,
+    tile_cells_bbox,
+    cell_points_bbox,
+    cell_tiles
 )
 
 from ..models import Locality
@@ -49,6 +64,30 @@ class TestMapClustering(TestCase):
         self.assertListEqual(update_minbbox((1, -1), minbbox), [0, -1, 1, 0])
         self.assertListEqual(update_minbbox((1, 1), minbbox), [0, 0, 1, 1])
 
+    def test_catchment_cell_size(self):
+        self.assertEqual(
+            catchment_cell_size(zoom=0, pix_x=10, pix_y=10),
+            (42.1875, 42.1875)
+        )
+
+    def test_grid_cell(self):
+        self.assertEqual(grid_cell(10, 10, (20, 20)), (0, 0))
+        self.assertEqual(grid_cell(-10, 10, (20, 20)), (-1, 0))
+        self.assertEqual(grid_cell(45, -45, (20, 20)), (2, -3))
+
+    def test_grid_cluster(self):
+        random.seed(0)
+        points = [
+            (str(i), random.uniform(-180, 180), random.uniform(-85, 85))
+            for i in range(2000)
+        ]
+
+        for zoom in range(6):
+            self.assertListEqual(
+                grid_cluster(points, zoom, 48, 46),
+                linear_cluster(points, zoom, 48, 46)
+            )
+
     def test_cluster(self):
 
         LocalityF.create(uuid='93b7e8c4621a4597938dfd3d27659160')
@@ -92,3 +131,124 @@ class TestMapClustering(TestCase):
                     37.54223316717313, 37.54223316717313,
                     52.45776683282687, 52.45776683282687)}
         ])
+
+    def test_lnglat_to_pixel(self):
+        self.assertEqual(lnglat_to_pixel(0, 0, 0), (128.0, 128.0))
+        self.assertEqual(lnglat_to_pixel(-180, 0, 1), (0.0, 256.0))
+
+    def test_pixel_to_lnglat(self):
+        self.assertEqual(pixel_to_lnglat(128, 128, 0), (0.0, 0.0))
+        self.assertEqual(
+            pixel_to_lnglat(0, 0, 0), (-180.0, 85.0511287798066)
+        )
+
+    def test_cell_index(self):
+        self.assertEqual(cell_index(16, 45, 1, 40, 40), (2, 1))
+        self.assertEqual(cell_index(-100, 10, 1, 40, 40), (0, 2))
+
+    def test_cell_cluster(self):
+        points = [('a', 16, 45), ('b', 17, 46), ('c', -100, 10)]
+
+        self.assertDictEqual(cell_cluster(points, 1, 40, 40), {
+            (2, 1): {
+                'count': 2, 'minbbox': [16, 45, 17, 46], 'geom': (16, 45),
+                'uuid': 'a', 'bbox': (
+                    -11.25, 11.178401873711781, 73.125, 68.65655498475736
+                )
+            },
+            (0, 2): {
+                'count': 1, 'minbbox': (-100, 10, -100, 10),
+                'geom': (-100, 10), 'uuid': 'c', 'bbox': (
+                    -180.0, -58.81374171570782, -95.625, 11.178401873711781
+                )
+            }
+        })
+
+    def test_tile_index(self):
+        self.assertEqual(tile_index(16, 45, 1), (1, 0))
+        self.assertEqual(tile_index(-100, -10, 1), (0, 1))
+
+    def test_tile_bbox(self):
+        self.assertEqual(
+            tile_bbox(1, 1, 0), (0.0, 0.0, 180.0, 85.0511287798066)
+        )
+
+    def test_tile_cells_bbox(self):
+        self.assertEqual(
+            tile_cells_bbox(1, 1, 0, 40, 40),
+            (-11.25, -58.81374171570782, 241.875, 90.0)
+        )
+
+    def test_cell_points_bbox(self):
+        self.assertEqual(
+            cell_points_bbox((0, 2), 1, 40, 40),
+            (-180.0, -58.81374171570782, -95.625, 11.178401873711781)
+        )
+        # cells on world edges are extended to the poles
+        self.assertEqual(
+            cell_points_bbox((0, 0), 1, 40, 40),
+            (-180.0, 68.65655498475736, -95.625, 90.0)
+        )
+
+    def test_cell_tiles(self):
+        self.assertListEqual(cell_tiles((0, 0), 1, 40, 40), [(0, 0)])
+        self.assertListEqual(
+            cell_tiles((0, 2), 1, 40, 40), [(0, 0), (0, 1)]
+        )
+        # tiles outside of the world are skipped
+        self.assertListEqual(cell_tiles((4, 4), 1, 40, 40), [(1, 1)])
+
+    def test_cluster_postgis(self):
+        LocalityF.create(
+            uuid='93b7e8c4621a4597938dfd3d27659160', geom='POINT(16 45)'
+        )
+        LocalityF.create(
+            uuid='93b7e8c4621a4597938dfd3d27659161', geom='POINT(17 46)'
+        )
+        LocalityF.create(
+            uuid='93b7e8c4621a4597938dfd3d27659162', geom='POINT(-100 10)'
+        )
+
+        queryset = Locality.objects.order_by('id')
+
+        dict_cluster = sorted(
+            cluster(queryset, 1, 40, 40, backend='postgis'),
+            key=lambda clu: clu['uuid']
+        )
+
+        self.assertListEqual(dict_cluster, [
+            {'count': 2, 'minbbox': (16.0, 45.0, 17.0, 46.0),
+                'geom': (16.0, 45.0),
+                'uuid': '93b7e8c4621a4597938dfd3d27659160',
+                'bbox': (
+                    -11.25, 11.178401873711781, 73.125, 68.65655498475736)},
+            {'count': 1, 'minbbox': (-100.0, 10.0, -100.0, 10.0),
+                'geom': (-100.0, 10.0),
+                'uuid': '93b7e8c4621a4597938dfd3d27659162',
+                'bbox': (
+                    -180.0, -58.81374171570782, -95.625, 11.178401873711781)}
+        ])
+
+        # clusters are the same as the ones created by cell clustering
+        cells = cell_cluster(queryset.iter_points(), 1, 40, 40)
+
+        self.assertListEqual(dict_cluster, sorted(
+            (dict(clu, minbbox=tuple(clu['minbbox']))
+                for clu in cells.itervalues()),
+            key=lambda clu: clu['uuid']
+        ))
+
+        # and on the same data, clusters of the python backend are
+        # represented by the same Localities, only their 'catchment' areas
+        # are not fixed cells
+        python_cluster = sorted(
+            cluster(queryset, 1, 40, 40, backend='python'),
+            key=lambda clu: clu['uuid']
+        )
+
+        self.assertListEqual(
+            [(clu['uuid'], clu['count'], clu['geom'], clu['minbbox'])
+                for clu in dict_cluster],
+            [(clu['uuid'], clu['count'], clu['geom'], tuple(clu['minbbox']))
+                for clu in python_cluster]
+        )
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 from django.test import TestCase
 
-from django.db import IntegrityError
+from django.contrib.contenttypes.models import ContentType
+
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
 
 from social_users.tests.model_factories import UserF
 
@@ -13,10 +16,13 @@ from .model_factories import (
     DomainSpecification1AF,
     DomainSpecification2AF,
     DomainSpecification4AF,
-    ChangesetF
+    ChangesetF,
+    CountryF,
+    DomainF,
+    SpecificationF
 )
 
-from ..models import Locality
+from ..models import Locality, LocalityIndex, Value, ValueArchive
 
 
 class TestModelLocality(TestCase):
@@ -24,7 +30,7 @@ class TestModelLocality(TestCase):
         self.assertListEqual(
             [fld.name for fld in Locality._meta.fields], [
                 u'id', 'changeset', 'version', 'domain', 'uuid',
-                'upstream_id', 'geom'
+                'upstream_id', 'geom', 'country', 'completeness'
             ]
         )
 
@@ -53,30 +59,6 @@ class TestModelLocality(TestCase):
 
         self.assertEqual(locality.uuid, 'uuid_original')
 
-    def test_get_attr_map(self):
-        attr1 = AttributeF.create(key='test')
-        attr2 = AttributeF.create(key='osm')
-
-        dom = DomainSpecification2AF.create(
-            name='a domain', spec1__id=1, spec1__attribute=attr1,
-            spec2__id=2, spec2__attribute=attr2
-        )
-
-        # this domain should not be in results
-        attr3 = AttributeF.create(key='osm2')
-        DomainSpecification1AF.create(
-            name='a new domain', spec1__attribute=attr3, spec1__id=-1
-        )
-
-        locality = LocalityF.create(domain=dom)
-
-        self.assertEqual(
-            list(locality._get_attr_map()), [
-                {'id': 1, 'attribute__key': u'test'},
-                {'id': 2, 'attribute__key': u'osm'}
-            ]
-        )
-
     def test_set_values(self):
         user = UserF(username='test', password='test')
         attr1 = AttributeF.create(id=1, key='test')
@@ -128,6 +110,73 @@ class TestModelLocality(TestCase):
         # is attribute created
         self.assertEqual([val[1] for val in chg_values], [True])
 
+    def test_set_values_completeness(self):
+        user = UserF(username='test', password='test')
+        attr1 = AttributeF.create(id=1, key='test')
+        attr2 = AttributeF.create(id=2, key='osm')
+
+        dom = DomainSpecification2AF.create(
+            name='a domain', spec1__attribute=attr1, spec2__attribute=attr2
+        )
+
+        locality = LocalityF.create(pk=1, domain=dom)
+
+        locality.set_values({'osm': 'osm val', 'test': ''}, social_user=user)
+
+        # geometry and one of two values are set
+        self.assertAlmostEqual(locality.completeness, 200.0 / 3)
+        self.assertAlmostEqual(
+            Locality.objects.get(pk=1).completeness, 200.0 / 3
+        )
+
+        locality.set_values({'test': 'test val'}, social_user=user)
+
+        self.assertEqual(Locality.objects.get(pk=1).completeness, 100.0)
+
+        # completeness is not a new version of the Locality
+        self.assertEqual(Locality.objects.get(pk=1).version, 1)
+        self.assertFalse(locality.tracker.changed())
+
+    def test_create_completeness(self):
+        attr1 = AttributeF.create(id=1, key='test')
+        attr2 = AttributeF.create(id=2, key='osm')
+
+        dom = DomainSpecification2AF.create(
+            name='a domain', spec1__attribute=attr1, spec2__attribute=attr2
+        )
+
+        LocalityF.create(pk=1, domain=dom)
+
+        # only geometry is set, same as calculated for existing Localities
+        locality = Locality.objects.get(pk=1)
+        self.assertAlmostEqual(locality.completeness, 100.0 / 3)
+        self.assertAlmostEqual(
+            locality.completeness, locality.calculate_completeness()
+        )
+
+    def test_completeness_specification_changes(self):
+        user = UserF(username='test', password='test')
+        attr1 = AttributeF.create(id=1, key='test')
+        attr2 = AttributeF.create(id=2, key='osm')
+
+        dom = DomainSpecification2AF.create(
+            name='a domain', spec1__attribute=attr1, spec2__attribute=attr2
+        )
+
+        locality = LocalityF.create(pk=1, domain=dom)
+        locality.set_values({'osm': 'osm val', 'test': 'test val'}, user)
+
+        self.assertEqual(Locality.objects.get(pk=1).completeness, 100.0)
+
+        # a new Specification of the Domain isn't set for its Localities
+        spec = SpecificationF.create(
+            domain=dom, attribute=AttributeF.create(key='new')
+        )
+        self.assertEqual(Locality.objects.get(pk=1).completeness, 75.0)
+
+        spec.delete()
+        self.assertEqual(Locality.objects.get(pk=1).completeness, 100.0)
+
     def test_set_values_bad_key(self):
         user = UserF(username='test', password='test')
         attr1 = AttributeF.create(id=1, key='test')
@@ -146,6 +195,73 @@ class TestModelLocality(TestCase):
 
         self.assertEqual(len(chg_values), 1)
 
+    def test_set_values_archive(self):
+        user = UserF(username='test', password='test')
+        attr1 = AttributeF.create(id=1, key='test')
+        attr2 = AttributeF.create(id=2, key='osm')
+
+        dom = DomainSpecification2AF.create(
+            name='a domain', spec1__attribute=attr1, spec2__attribute=attr2
+        )
+
+        locality = LocalityF.create(pk=1, domain=dom)
+
+        osm_val = locality.set_values(
+            {'osm': 'osm val'}, social_user=user
+        )[0][0]
+        chg_values = locality.set_values(
+            {'osm': 'new osm val', 'test': 'test val'}, social_user=user
+        )
+
+        self.assertEqual(
+            sorted(
+                (val.specification.attribute.key, val.data, val.version)
+                for val in Value.objects.all()
+            ), [(u'osm', u'new osm val', 2), (u'test', u'test val', 1)]
+        )
+        self.assertEqual(
+            sorted(
+                (val.object_id, val.data, val.version)
+                for val in ValueArchive.objects.all()
+            ), sorted(
+                [(osm_val.pk, u'osm val', 1)] +
+                [(obj.pk, obj.data, obj.version) for obj, _ in chg_values]
+            )
+        )
+        self.assertFalse(any(obj.tracker.changed() for obj, _ in chg_values))
+
+        self.assertEqual(
+            sorted(LocalityIndex.objects.get(locality=locality).rankd.split()),
+            [u'new', u'osm', u'test', u'val', u'val']
+        )
+
+    def test_set_values_constant_queries(self):
+        user = UserF(username='test', password='test')
+        # content types are cached per process
+        ContentType.objects.get_for_model(Value)
+
+        def query_count(attr_count):
+            domain = DomainF.create()
+            for pos in range(attr_count):
+                SpecificationF.create(
+                    domain=domain,
+                    attribute=AttributeF.create(key='a{}'.format(pos))
+                )
+            locality = LocalityF.create(domain=domain)
+
+            counts = []
+            for value in ('x', 'y'):
+                with CaptureQueriesContext(connection) as queries:
+                    locality.set_values({
+                        'a{}'.format(pos): value for pos in range(attr_count)
+                    }, social_user=user)
+                counts.append(len(queries))
+
+            return counts
+
+        # creating and updating values of 2 and of 18 attributes
+        self.assertEqual(query_count(2), query_count(18))
+
     def test_uuid_uniqueness(self):
         LocalityF.create(uuid='test_uuid')
 
@@ -197,6 +313,23 @@ class TestModelLocality(TestCase):
             loc.geom.wkt, 'POINT (10.0000000000000000 35.0000000000000000)'
         )
 
+    def test_country_assignment(self):
+        country = CountryF.create()
+        loc = LocalityF.create(geom='POINT (5 5)')
+
+        self.assertEqual(loc.country, country)
+
+        # moved within the Country
+        loc.set_geom(6.0, 6.0)
+        loc.save()
+
+        self.assertEqual(Locality.objects.get(pk=loc.pk).country, country)
+
+        loc.set_geom(20.0, 20.0)
+        loc.save()
+
+        self.assertIsNone(Locality.objects.get(pk=loc.pk).country)
+
     def test_prepare_for_fts(self):
         attr1 = AttributeF.create(id=1, key='test1')
         attr2 = AttributeF.create(id=2, key='test2')
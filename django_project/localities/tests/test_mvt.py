@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from django.test import SimpleTestCase
+
+from ..mvt import encode_tile, tile_point, _value, _varint, _zigzag
+
+
+class TestMVT(SimpleTestCase):
+    def test_varint(self):
+        self.assertEqual(str(_varint(1)), '\x01')
+        self.assertEqual(str(_varint(300)), '\xac\x02')
+        self.assertEqual(str(_varint(4096)), '\x80\x20')
+
+    def test_zigzag(self):
+        self.assertListEqual(
+            [_zigzag(value) for value in (0, -1, 1, -2, 2)], [0, 1, 2, 3, 4]
+        )
+
+    def test_value(self):
+        self.assertEqual(str(_value(u'ab')), '\x0a\x02ab')
+        self.assertEqual(str(_value(2)), '\x28\x02')
+        self.assertEqual(str(_value(-3)), '\x30\x05')
+        self.assertEqual(str(_value(True)), '\x38\x01')
+        self.assertEqual(
+            str(_value(1.5)), '\x19\x00\x00\x00\x00\x00\x00\xf8\x3f'
+        )
+
+    def test_tile_point(self):
+        self.assertTupleEqual(tile_point(0, 0, 0, 0, 0), (2048, 2048))
+        self.assertTupleEqual(tile_point(0, 0, 1, 1, 1), (0, 0))
+        self.assertTupleEqual(tile_point(-180, 0, 1, 1, 1), (-4096, 0))
+
+    def test_encode_tile(self):
+        tile = encode_tile([
+            ('clusters', [(1, (10, 20), {'count': 2, 'uuid': u'ab'})]),
+            ('localities', [])
+        ])
+
+        self.assertEqual(tile, (
+            # clusters layer, version 2
+            '\x1a\x37\x78\x02\x0a\x08clusters'
+            # feature, id 1, tags (0, 0, 1, 1), point, MoveTo(10, 20)
+            '\x12\x0f\x08\x01\x12\x04\x00\x00\x01\x01\x18\x01'
+            '\x22\x03\x09\x14\x28'
+            # keys, values and extent
+            '\x1a\x05count\x1a\x04uuid\x22\x02\x28\x02\x22\x04\x0a\x02ab'
+            '\x28\x80\x20'
+            # localities layer, version 2, no features
+            '\x1a\x11\x78\x02\x0a\x0alocalities\x28\x80\x20'
+        ))
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase, Client
+from django.utils import timezone
+
+from social_users.tests.model_factories import UserF
+
+from .model_factories import AttributeF, DomainSpecification3AF
+
+from ..importers import CSVImporter
+from ..models import DataLoader
+from ..progress import (
+    ImportProgress,
+    PROGRESS_KEY,
+    get_progress
+)
+from ..utils import shared_cache
+
+
+class TestProgress(TestCase):
+    def setUp(self):
+        shared_cache().clear()
+
+    def test_get_progress(self):
+        self.assertIsNone(get_progress(1, partitions=2))
+
+        ImportProgress(1, 1000, partition=0).update(
+            rows_parsed=8, rows_saved=6, bytes_read=800
+        )
+        ImportProgress(1, 1000, partition=1).update(
+            rows_parsed=4, rows_saved=2, bytes_read=400
+        )
+
+        progress = get_progress(1, partitions=2)
+
+        # the import is as far as its slowest partition, total number of rows
+        # is estimated from the read part of the file
+        self.assertEqual(progress['bytes_total'], 1000)
+        self.assertEqual(progress['bytes_read'], 400)
+        self.assertEqual(progress['rows_total'], 10)
+        self.assertEqual(progress['rows_parsed'], 4)
+        self.assertEqual(progress['rows_saved'], 2)
+        self.assertGreater(progress['rate'], 0)
+        self.assertIsNotNone(progress['eta'])
+
+    def test_get_progress_not_started(self):
+        ImportProgress(1, 1000, partition=0).update(
+            rows_parsed=8, rows_saved=6, bytes_read=800
+        )
+
+        progress = get_progress(1, partitions=2)
+
+        self.assertEqual(progress['rows_saved'], 0)
+        self.assertIsNone(progress['rows_total'])
+        self.assertIsNone(progress['eta'])
+
+    def test_import_progress(self):
+        attr1 = AttributeF.create(key='name')
+        attr2 = AttributeF.create(key='url')
+        attr3 = AttributeF.create(key='services')
+
+        DomainSpecification3AF.create(
+            name='Test', spec1__attribute=attr1, spec2__attribute=attr2,
+            spec3__attribute=attr3
+        )
+        user = UserF.create(username='test', password='test')
+
+        # bypass loading of data on save
+        DataLoader.objects.bulk_create([DataLoader(
+            organisation_name='test', data_loader_mode=1, author=user,
+            date_time_uploaded=timezone.now()
+        )])
+        data_loader = DataLoader.objects.get()
+
+        CSVImporter(
+            data_loader, 'Test', 'test_imp',
+            './localities/tests/test_data/test_csv_import_ok.csv',
+            './localities/tests/test_data/test_csv_import_map.json',
+            user=user, chunk_size=2
+        )
+
+        bytes_total = os.path.getsize(
+            './localities/tests/test_data/test_csv_import_ok.csv'
+        )
+        progress = shared_cache().get(PROGRESS_KEY.format(data_loader.pk, 0))
+        self.assertEqual(progress['bytes_total'], bytes_total)
+        self.assertEqual(progress['bytes_read'], bytes_total)
+        self.assertEqual(progress['rows_parsed'], 4)
+        self.assertEqual(progress['rows_saved'], 4)
+
+        client = Client()
+        url = reverse('load-data-progress', kwargs={'pk': data_loader.pk})
+
+        # only the author can see the progress
+        self.assertEqual(client.get(url).status_code, 302)
+        UserF.create(username='other', password='other')
+        client.login(username='other', password='other')
+        self.assertEqual(client.get(url).status_code, 403)
+
+        client.login(username='test', password='test')
+        resp = client.get(url)
+
+        self.assertEqual(resp.status_code, 200)
+        response = json.loads(resp.content)
+        self.assertEqual(response['status'], 'loading')
+        self.assertEqual(response['progress']['rows_total'], 4)
+        self.assertEqual(response['progress']['rows_saved'], 4)
+
+    def test_import_progress_view_not_found(self):
+        UserF.create(username='test', password='test')
+        client = Client()
+        client.login(username='test', password='test')
+
+        resp = client.get(reverse('load-data-progress', kwargs={'pk': 1}))
+
+        self.assertEqual(resp.status_code, 404)
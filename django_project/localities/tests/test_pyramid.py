@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase
+
+from .model_factories import LocalityF
+
+from ..models import LocalityCluster
+from ..pyramid import build_cluster_pyramid, get_pyramid_clusters
+from ..utils import parse_bbox
+
+
+class TestPyramid(TestCase):
+    def setUp(self):
+        LocalityF.create(
+            uuid='93b7e8c4621a4597938dfd3d27659160', geom='POINT(16 45)'
+        )
+        LocalityF.create(
+            uuid='93b7e8c4621a4597938dfd3d27659161', geom='POINT(17 46)'
+        )
+        LocalityF.create(
+            uuid='93b7e8c4621a4597938dfd3d27659162', geom='POINT(-100 10)'
+        )
+
+    def test_build_cluster_pyramid(self):
+        build_cluster_pyramid(zoom_levels=[1, 18], icon_sizes=[(40, 40)])
+
+        self.assertEqual(
+            LocalityCluster.objects.filter(zoom=1).count(), 2
+        )
+        self.assertEqual(
+            LocalityCluster.objects.filter(zoom=18).count(), 3
+        )
+
+        # rebuilding a level replaces existing clusters
+        build_cluster_pyramid(zoom_levels=[1], icon_sizes=[(40, 40)])
+
+        self.assertEqual(
+            LocalityCluster.objects.filter(zoom=1).count(), 2
+        )
+
+    def test_get_pyramid_clusters(self):
+        build_cluster_pyramid(zoom_levels=[1], icon_sizes=[(40, 40)])
+
+        self.assertListEqual(
+            get_pyramid_clusters(parse_bbox('0,0,180,90'), 1, 40, 40), [{
+                'count': 2, 'minbbox': (16.0, 45.0, 17.0, 46.0),
+                'geom': (16.0, 45.0),
+                'uuid': '93b7e8c4621a4597938dfd3d27659160',
+                'bbox': (
+                    -11.25, 11.178401873711781, 73.125, 68.65655498475736
+                )
+            }]
+        )
+
+        # pyramid level exists, but there are no clusters in the bbox
+        self.assertListEqual(
+            get_pyramid_clusters(parse_bbox('0,-90,10,0'), 1, 40, 40), []
+        )
+
+    def test_get_pyramid_clusters_not_built(self):
+        self.assertIsNone(
+            get_pyramid_clusters(parse_bbox('-180,-90,180,90'), 1, 40, 40)
+        )
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from .model_factories import (
+    AttributeF,
+    DomainSpecification2AF,
+    SpecificationF
+)
+
+from .. import registry
+from ..models import Domain, Specification
+from ..registry import get_schema
+from ..utils import shared_cache
+
+
+class TestRegistry(TestCase):
+    def setUp(self):
+        self.attr1 = AttributeF.create(key='test')
+        self.attr2 = AttributeF.create(key='osm')
+
+        self.domain = DomainSpecification2AF.create(
+            name='a domain', spec1__attribute=self.attr1,
+            spec1__required=True, spec1__fts_rank='A',
+            spec2__attribute=self.attr2
+        )
+        self.spec1 = self.attr1.specification_set.get()
+        self.spec2 = self.attr2.specification_set.get()
+
+    def test_get_schema(self):
+        schema = get_schema()
+
+        domain = schema.domain(self.domain.pk)
+
+        self.assertIs(schema.domain_by_name('a domain'), domain)
+        self.assertEqual(domain.spec_ids, {
+            'test': self.spec1.pk, 'osm': self.spec2.pk
+        })
+        self.assertEqual([spec.key for spec in domain.required], ['test'])
+
+        spec = schema.specification(self.spec1.pk)
+        self.assertEqual(spec.fts_rank, 'A')
+        self.assertEqual(spec.domain_id, self.domain.pk)
+
+        self.assertTrue(schema.has_attribute('osm'))
+        self.assertFalse(schema.has_attribute('bad key'))
+
+        self.assertRaises(Domain.DoesNotExist, schema.domain_by_name, 'bad')
+        self.assertRaises(Specification.DoesNotExist, schema.specification, -1)
+
+        # schema is cached, only its version is checked in the shared cache
+        with self.assertNumQueries(1):
+            self.assertIs(get_schema(), schema)
+
+    def test_get_schema_invalidation(self):
+        schema = get_schema()
+
+        SpecificationF.create(
+            domain=self.domain, attribute=AttributeF.create(key='new')
+        )
+
+        self.assertIsNot(get_schema(), schema)
+        self.assertIn('new', get_schema().domain(self.domain.pk).spec_ids)
+
+        self.spec1.delete()
+
+        self.assertNotIn('test', get_schema().domain(self.domain.pk).spec_ids)
+
+    def test_get_schema_other_process(self):
+        get_schema()
+
+        # another process changed a Specification and the schema version
+        Specification.objects.filter(pk=self.spec2.pk).update(required=True)
+        shared_cache().set(registry.VERSION_KEY, 'new version', None)
+
+        domain = get_schema().domain(self.domain.pk)
+        self.assertEqual(
+            [spec.key for spec in domain.required], ['test', 'osm']
+        )
+
+    @override_settings(CACHE_VERSION_CHECK_INTERVAL=60)
+    def test_get_schema_version_check_interval(self):
+        # the version of an earlier test could have been checked recently
+        registry.invalidate_schema()
+        schema = get_schema()
+
+        # the version was checked recently, the schema is not queried
+        with self.assertNumQueries(0):
+            self.assertIs(get_schema(), schema)
+
+        # changes made by this process are seen immediately
+        SpecificationF.create(
+            domain=self.domain, attribute=AttributeF.create(key='new')
+        )
+        self.assertIn('new', get_schema().domain(self.domain.pk).spec_ids)
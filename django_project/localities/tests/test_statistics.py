@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+
+from django.db import IntegrityError, transaction
+from django.test import TestCase
+from django.utils import timezone
+
+from social_users.tests.model_factories import UserF
+
+from .model_factories import (
+    AttributeF,
+    CountryF,
+    DomainF,
+    LocalityF,
+    SpecificationF
+)
+
+from ..batching import batch
+from ..invalidation import STATISTICS_PENDING_KEY
+from ..models import DataHistory, Locality, LocalityStatistic
+from ..statistics import (
+    _store_statistic,
+    get_statistic,
+    get_stored_statistic,
+    refresh_statistics
+)
+from ..utils import shared_cache
+
+
+class TestStatistics(TestCase):
+    def setUp(self):
+        user = UserF.create(username='test')
+
+        domain = DomainF.create()
+        for key in ['type', 'name'] + ['a{}'.format(i) for i in range(16)]:
+            SpecificationF.create(
+                domain=domain, attribute=AttributeF.create(key=key)
+            )
+
+        # complete
+        self.hospital = LocalityF.create(domain=domain)
+        values = {'a{}'.format(i): 'x' for i in range(16)}
+        values.update(type='Hospital', name='General hospital')
+        self.hospital.set_values(values, social_user=user)
+        # partial
+        clinic = LocalityF.create(domain=domain)
+        clinic.set_values({
+            'type': 'clinic', 'name': 'Clinic', 'a0': 'x', 'a1': 'x', 'a2': ''
+        }, social_user=user)
+        # basic
+        basic = LocalityF.create(domain=domain)
+        basic.set_values({'type': 'other'}, social_user=user)
+        # without values, also basic
+        LocalityF.create(domain=domain)
+
+        DataHistory.objects.create(
+            locality=self.hospital, mode=1, author=user,
+            time_changed=timezone.make_aware(
+                datetime(2015, 1, 2), timezone.utc)
+        )
+        for locality in (clinic, basic):
+            DataHistory.objects.create(
+                locality=locality, mode=2, author=user,
+                time_changed=timezone.make_aware(
+                    datetime(2015, 1, 1), timezone.utc)
+            )
+
+    def test_get_statistic(self):
+        with self.assertNumQueries(2):
+            output = get_statistic(Locality.objects.all())
+
+        self.assertEqual(output['localities'], 4)
+        self.assertDictEqual(output['numbers'], {
+            'hospital': 1, 'medical_clinic': 1, 'orthopaedic_clinic': 0
+        })
+        self.assertDictEqual(output['completeness'], {
+            'complete': 1, 'partial': 1, 'basic': 2
+        })
+        self.assertListEqual(output['last_update'], [{
+            'author': 'test',
+            'date_applied': timezone.make_aware(
+                datetime(2015, 1, 2), timezone.utc),
+            'mode': 1,
+            'locality': 'General hospital',
+            'locality_uuid': self.hospital.uuid,
+            'data_count': 1
+        }, {
+            'author': 'test',
+            'date_applied': timezone.make_aware(
+                datetime(2015, 1, 1), timezone.utc),
+            'mode': 2,
+            'locality': '',
+            'locality_uuid': '',
+            'data_count': 2
+        }])
+
+    def test_get_statistic_filtered(self):
+        output = get_statistic(Locality.objects.filter(pk=self.hospital.pk))
+
+        self.assertEqual(output['localities'], 1)
+        self.assertDictEqual(output['completeness'], {
+            'complete': 1, 'partial': 0, 'basic': 0
+        })
+        self.assertEqual(len(output['last_update']), 1)
+
+    def test_get_stored_statistic(self):
+        # statistics are refreshed after every change
+        self.assertEqual(LocalityStatistic.objects.count(), 1)
+
+        with self.assertNumQueries(1):
+            output = get_stored_statistic()
+
+        self.assertDictEqual(output, get_statistic(Locality.objects.all()))
+
+        with batch():
+            LocalityF.create()
+            LocalityF.create()
+
+        self.assertEqual(get_stored_statistic()['localities'], 6)
+
+    def test_refresh_pending(self):
+        pending_key = STATISTICS_PENDING_KEY.format(None)
+
+        # a refresh of the statistic of all Localities is already pending
+        shared_cache().add(pending_key, True)
+        LocalityF.create()
+
+        self.assertEqual(get_stored_statistic()['localities'], 4)
+
+        # the pending refresh includes the change
+        refresh_statistics([None])
+
+        self.assertEqual(get_stored_statistic()['localities'], 5)
+        self.assertIsNone(shared_cache().get(pending_key))
+
+    def test_stored_statistic_unique(self):
+        # statistic of all Localities was stored by a concurrent refresh
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            LocalityStatistic.objects.create(country=None, data='{}')
+
+        output = get_statistic(Locality.objects.all())
+        _store_statistic(None, output)
+
+        self.assertEqual(LocalityStatistic.objects.count(), 1)
+        self.assertDictEqual(get_stored_statistic(), output)
+
+    def test_get_stored_statistic_country(self):
+        country = CountryF.create()
+
+        # statistics are computed on the first request
+        self.assertEqual(get_stored_statistic(country.pk)['localities'], 0)
+        self.assertEqual(LocalityStatistic.objects.count(), 2)
+
+        LocalityF.create(geom='POINT (5 5)')
+
+        self.assertEqual(get_stored_statistic(country.pk)['localities'], 1)
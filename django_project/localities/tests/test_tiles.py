@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase, Client
+from django.test.utils import override_settings
+from django.core.urlresolvers import reverse
+
+from .model_factories import LocalityF
+
+from ..models import Locality
+from ..pyramid import build_cluster_pyramid
+from ..tiles import (
+    cluster_tile,
+    get_tile_clusters,
+    tile_cache,
+    tile_cache_key
+)
+
+
+@override_settings(CLUSTER_PYRAMID_ICON_SIZES=((40, 40),))
+class TestTiles(TestCase):
+    def setUp(self):
+        self.client = Client()
+        tile_cache().clear()
+
+        # cluster cell of these points straddles the prime meridian
+        LocalityF.create(
+            uuid='93b7e8c4621a4597938dfd3d27659160', geom='POINT(-1 45)'
+        )
+        LocalityF.create(
+            uuid='93b7e8c4621a4597938dfd3d27659161', geom='POINT(1 45)'
+        )
+        LocalityF.create(
+            uuid='93b7e8c4621a4597938dfd3d27659162', geom='POINT(-100 10)'
+        )
+
+    def test_cluster_tile(self):
+        localities = Locality.objects.all()
+
+        # cluster is returned only by the tile of its representative point
+        clusters = cluster_tile(localities, 1, 0, 0, 40, 40)
+
+        self.assertListEqual([clu['count'] for clu in clusters], [2])
+        self.assertListEqual(cluster_tile(localities, 1, 1, 0, 40, 40), [])
+
+        # every locality is counted once
+        self.assertEqual(sum(
+            clu['count']
+            for tile_x in range(2) for tile_y in range(2)
+            for clu in cluster_tile(localities, 1, tile_x, tile_y, 40, 40)
+        ), 3)
+
+    def test_get_tile_clusters_pyramid(self):
+        live = get_tile_clusters(1, 0, 0, 40, 40)
+
+        build_cluster_pyramid(zoom_levels=[1], icon_sizes=[(40, 40)])
+
+        self.assertEqual(
+            sorted(clu['uuid'] for clu in get_tile_clusters(1, 0, 0, 40, 40)),
+            sorted(clu['uuid'] for clu in live)
+        )
+
+    def test_localities_tile_view(self):
+        resp = self.client.get(reverse('localities-tile', kwargs={
+            'zoom': 1, 'tile_x': 1, 'tile_y': 1
+        }), data={'iconsize': '40,40'})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/json')
+        self.assertIn('max-age=300', resp['Cache-Control'])
+        self.assertEqual(resp.content, '[]')
+
+        # tile is stored in the tile cache
+        self.assertEqual(
+            tile_cache().get(tile_cache_key(1, 1, 1, 40, 40)), '[]'
+        )
+
+        # and removed from the cache by a new Locality within the tile
+        LocalityF.create(
+            uuid='93b7e8c4621a4597938dfd3d27659163', geom='POINT(100 -10)'
+        )
+
+        self.assertIsNone(tile_cache().get(tile_cache_key(1, 1, 1, 40, 40)))
+
+        resp = self.client.get(reverse('localities-tile', kwargs={
+            'zoom': 1, 'tile_x': 1, 'tile_y': 1
+        }), data={'iconsize': '40,40'})
+
+        self.assertIn('93b7e8c4621a4597938dfd3d27659163', resp.content)
+
+    def test_localities_tile_view_uncached_iconsize(self):
+        self.client.get(reverse('localities-tile', kwargs={
+            'zoom': 1, 'tile_x': 1, 'tile_y': 1
+        }), data={'iconsize': '48,46'})
+
+        self.assertIsNone(tile_cache().get(tile_cache_key(1, 1, 1, 48, 46)))
+
+    def test_localities_tile_view_bad_params(self):
+        resp = self.client.get(reverse('localities-tile', kwargs={
+            'zoom': 1, 'tile_x': 0, 'tile_y': 0
+        }))
+
+        self.assertEqual(resp.status_code, 404)
+
+        resp = self.client.get(reverse('localities-tile', kwargs={
+            'zoom': 1, 'tile_x': 2, 'tile_y': 0
+        }), data={'iconsize': '40,40'})
+
+        self.assertEqual(resp.status_code, 404)
+
+        resp = self.client.get(reverse('localities-tile', kwargs={
+            'zoom': 21, 'tile_x': 0, 'tile_y': 0
+        }), data={'iconsize': '40,40'})
+
+        self.assertEqual(resp.status_code, 404)
+
+        resp = self.client.get(reverse('localities-tile', kwargs={
+            'zoom': 1, 'tile_x': 0, 'tile_y': 0
+        }), data={'iconsize': '0,40'})
+
+        self.assertEqual(resp.status_code, 404)
+
+    def test_localities_vector_tile_view(self):
+        url = reverse('localities-vector-tile', kwargs={
+            'zoom': 1, 'tile_x': 0, 'tile_y': 0
+        })
+        resp = self.client.get(url, data={'iconsize': '40,40'})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/x-protobuf')
+        self.assertIn('max-age=300', resp['Cache-Control'])
+        self.assertIn('\x0a\x08clusters', resp.content)
+        self.assertIn('93b7e8c4621a4597938dfd3d27659160', resp.content)
+
+        # vector tile is much smaller than the JSON tile
+        json_resp = self.client.get(reverse('localities-tile', kwargs={
+            'zoom': 1, 'tile_x': 0, 'tile_y': 0
+        }), data={'iconsize': '40,40'})
+
+        self.assertLess(len(resp.content) * 2, len(json_resp.content))
+
+        resp = self.client.get(url)
+
+        self.assertEqual(resp.status_code, 404)
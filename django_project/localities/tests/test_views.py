@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from django.test import TestCase, Client
+from django.utils import timezone
 from django.core.urlresolvers import reverse
 
 from social_users.tests.model_factories import UserF
@@ -14,7 +15,7 @@ from .model_factories import (
     ChangesetF
 )
 
-from ..models import Locality
+from ..models import DataLoader, Locality
 
 
 class TestViews(TestCase):
@@ -43,6 +44,41 @@ class TestViews(TestCase):
             )
         )
 
+    def test_localities_view_backend(self):
+        LocalityF.create(
+            uuid='93b7e8c4621a4597938dfd3d27659162', geom='POINT(16 45)'
+        )
+        resp = self.client.get(reverse('localities'), data={
+            'zoom': 1,
+            'bbox': '-180,-90,180,90',
+            'iconsize': '40,40',
+            'geoname': '',
+            'tag': '',
+            'backend': 'postgis'
+        })
+
+        self.assertEqual(resp.status_code, 200)
+
+        self.assertEqual(
+            resp.content, (
+                u'[{"count": 1, "minbbox": [16.0, 45.0, 16.0, 45.0], "geom": ['
+                u'16.0, 45.0], "uuid": "93b7e8c4621a4597938dfd3d27659162", "bb'
+                u'ox": [-11.25, 11.178401873711781, 73.125, 68.65655498475736]'
+                u'}]'
+            )
+        )
+
+        resp = self.client.get(reverse('localities'), data={
+            'zoom': 1,
+            'bbox': '-180,-90,180,90',
+            'iconsize': '40,40',
+            'geoname': '',
+            'tag': '',
+            'backend': 'unknown'
+        })
+
+        self.assertEqual(resp.status_code, 404)
+
     def test_localities_view_bad_params(self):
         resp = self.client.get(reverse('localities'), data={
             'bbox': '-180,-90,180,90'
@@ -535,3 +571,51 @@ class TestViews(TestCase):
 
         self.assertFormError(resp, 'form', 'lat', [u'This field is required.'])
         self.assertFormError(resp, 'form', 'lon', [u'This field is required.'])
+
+    def test_load_data_diff_author(self):
+        author = UserF(username='author', password='author')
+        UserF(username='test', password='test')
+
+        # bypass loading of data on save
+        DataLoader.objects.bulk_create([DataLoader(
+            organisation_name='test', data_loader_mode=1, author=author,
+            date_time_uploaded=timezone.now(), dry_run=True
+        )])
+        url = reverse(
+            'load-data-diff', kwargs={'pk': DataLoader.objects.get().pk}
+        )
+
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 302)
+
+        self.client.login(username='test', password='test')
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 403)
+
+        # the author can download the report, once it's written
+        self.client.login(username='author', password='author')
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 404)
+
+    def test_load_data_apply_author(self):
+        author = UserF(username='author', password='author')
+        UserF(username='test', password='test')
+
+        # bypass loading of data on save
+        DataLoader.objects.bulk_create([DataLoader(
+            organisation_name='test', data_loader_mode=1, author=author,
+            date_time_uploaded=timezone.now(), dry_run=True
+        )])
+        url = reverse(
+            'load-data-apply', kwargs={'pk': DataLoader.objects.get().pk}
+        )
+
+        # anonymous users are redirected to log in
+        resp = self.client.post(url)
+        self.assertEqual(resp.status_code, 302)
+        self.assertTrue(DataLoader.objects.get().dry_run)
+
+        self.client.login(username='test', password='test')
+        resp = self.client.post(url)
+        self.assertEqual(resp.status_code, 403)
+        self.assertTrue(DataLoader.objects.get().dry_run)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import logging
+LOG = logging.getLogger(__name__)
+
+from django.conf import settings
+from django.contrib.gis.geos import Polygon
+from django.core.cache import caches
+
+from .map_clustering import (
+    cell_cluster,
+    tile_index,
+    tile_bbox,
+    tile_cells_bbox
+)
+from .models import Locality
+from .pyramid import get_pyramid_clusters
+
+
+def tile_cache():
+    """
+    Server side cache of rendered tiles, defined by the 'tiles' alias of
+    *CACHES* setting
+    """
+
+    return caches['tiles']
+
+
+# formats of rendered tiles, every format is cached separately
+TILE_FORMATS = ('json', 'mvt')
+
+# zoom levels of tiles served by the localities tile layers
+TILE_ZOOM_LEVELS = range(0, 21)
+
+
+def tile_cache_key(zoom, tile_x, tile_y, pix_x, pix_y, tile_format='json'):
+    return 'localities-tile:{}x{}:{}/{}/{}.{}'.format(
+        pix_x, pix_y, zoom, tile_x, tile_y, tile_format
+    )
+
+
+def is_cached_icon_size(pix_x, pix_y):
+    """
+    Only tiles for icon sizes of the cluster pyramid are stored in the tile
+    cache, so every cached tile can be invalidated
+    """
+
+    return (pix_x, pix_y) in settings.CLUSTER_PYRAMID_ICON_SIZES
+
+
+def _in_tile(clusters, zoom, tile_x, tile_y):
+    """
+    Filter clusters which are represented by a point within a tile
+    """
+
+    return [
+        clu for clu in clusters
+        if tile_index(clu['geom'][0], clu['geom'][1], zoom) == (tile_x, tile_y)
+    ]
+
+
+def cluster_tile(query_set, zoom, tile_x, tile_y, pix_x, pix_y):
+    """
+    Cluster a set of Localities for a World Mercator tile
+
+    Cluster cells which straddle tile edges are clustered using all of their
+    points, including points in neighbouring tiles, and a cluster is only
+    returned by the tile which contains its representative point. This way
+    every Locality is counted exactly once for any set of tiles
+    """
+
+    cells_bbox = Polygon.from_bbox(
+        tile_cells_bbox(zoom, tile_x, tile_y, pix_x, pix_y)
+    )
+
+    points = query_set.in_bbox(cells_bbox).order_by('id').iter_points()
+    clusters = cell_cluster(points, zoom, pix_x, pix_y)
+
+    return _in_tile(clusters.itervalues(), zoom, tile_x, tile_y)
+
+
+def get_tile_clusters(zoom, tile_x, tile_y, pix_x, pix_y):
+    """
+    Return clusters of all Localities for a World Mercator tile, using the
+    cluster pyramid when the pyramid level was built
+    """
+
+    clusters = get_pyramid_clusters(
+        Polygon.from_bbox(tile_bbox(zoom, tile_x, tile_y)), zoom, pix_x, pix_y
+    )
+
+    if clusters is None:
+        return cluster_tile(
+            Locality.objects.all(), zoom, tile_x, tile_y, pix_x, pix_y
+        )
+
+    # representative points on tile edges are within more than one tile
+    return _in_tile(clusters, zoom, tile_x, tile_y)
@@ -2,6 +2,8 @@
 from django.conf.urls import patterns, url
 from .views import (
     LocalitiesLayer,
+    LocalitiesTileLayer,
+    LocalitiesVectorTileLayer,
     LocalityInfo,
     LocalityUpdate,
     LocalityCreate,
@@ -15,6 +17,14 @@ urlpatterns = patterns(
         r'^localities.json$', LocalitiesLayer.as_view(),
         name='localities'
     ),
+    url(
+        r'^localities/(?P<zoom>\d+)/(?P<tile_x>\d+)/(?P<tile_y>\d+).json$',
+        LocalitiesTileLayer.as_view(), name='localities-tile'
+    ),
+    url(
+        r'^localities/(?P<zoom>\d+)/(?P<tile_x>\d+)/(?P<tile_y>\d+).mvt$',
+        LocalitiesVectorTileLayer.as_view(), name='localities-vector-tile'
+    ),
     url(
         r'^localities/(?P<uuid>\w{32})$', LocalityInfo.as_view(),
         name='locality-info'
@@ -72,6 +82,18 @@ urlpatterns = patterns(
     url(
         r'^load-data$', 'localities.views.load_data', name='load-data'
     ),
+    url(
+        r'^load-data/(?P<pk>\d+)/progress$',
+        'localities.views.load_data_progress', name='load-data-progress'
+    ),
+    url(
+        r'^load-data/(?P<pk>\d+)/diff$',
+        'localities.views.load_data_diff', name='load-data-diff'
+    ),
+    url(
+        r'^load-data/(?P<pk>\d+)/apply$',
+        'localities.views.load_data_apply', name='load-data-apply'
+    ),
 
     url(r'^search$', SearchView.as_view(), name='search')
 )
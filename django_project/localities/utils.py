@@ -1,4 +1,9 @@
 # -*- coding: utf-8 -*-
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
 from django.template import Template, Context
 from django.contrib.gis.geos import Polygon
 
@@ -27,3 +32,62 @@ def parse_bbox(bbox):
             raise ValueError
     # create polygon from bbox
     return Polygon.from_bbox(tmp_bbox)
+
+
+def shared_cache():
+    """
+    Cache shared by all processes, defined by the 'shared' alias of *CACHES*
+    setting
+    """
+
+    return caches['shared']
+
+
+# version stamps read from the shared cache, and when they were read, keyed
+# by their cache keys
+_cache_versions = {}
+
+
+def get_cache_version(key):
+    """
+    Get a version stamp of in-process cached data from the shared cache, a
+    new version is created if there is none
+
+    The stamp is read from the shared cache at most every
+    *CACHE_VERSION_CHECK_INTERVAL* seconds
+    """
+
+    now = time.time()
+
+    try:
+        version, checked = _cache_versions[key]
+    except KeyError:
+        pass
+    else:
+        if now - checked < settings.CACHE_VERSION_CHECK_INTERVAL:
+            return version
+
+    cache = shared_cache()
+    version = cache.get(key)
+
+    if version is None:
+        version = uuid.uuid4().hex
+        # another process could have set the version in the meantime
+        if not cache.add(key, version, None):
+            version = cache.get(key)
+
+    _cache_versions[key] = (version, now)
+
+    return version
+
+
+def new_cache_version(key):
+    """
+    Set a new version stamp, invalidating in-process cached data of every
+    process, immediately in this process
+    """
+
+    version = uuid.uuid4().hex
+    shared_cache().set(key, version, None)
+
+    _cache_versions[key] = (version, time.time())
@@ -9,18 +9,36 @@ import json
 import uuid
 # register signals
 import signals  # noqa
+from .archive import archive_queue
+from .batching import batch
+from .countries import get_country
 from .forms import LocalityForm, DomainForm, DataLoaderForm, SearchForm
-from .map_clustering import cluster
+from .map_clustering import cluster, CLUSTER_BACKENDS
+from .mvt import encode_tile, tile_point
+from .statistics import get_statistic, get_stored_statistic, CORE_SCORE
+from .progress import get_progress
+from .pyramid import get_pyramid_clusters
+from .registry import get_schema
+from .tiles import (
+    cluster_tile,
+    get_tile_clusters,
+    is_cached_icon_size,
+    tile_cache,
+    tile_cache_key
+)
 from .models import Locality, Domain, Changeset, Value, Attribute, Specification, Tag
 from .utils import render_fragment, parse_bbox
 from braces.views import JSONResponseMixin, LoginRequiredMixin
 from datetime import datetime
 from django.conf import settings
+from django.contrib.auth.decorators import login_required
 from django.contrib.gis.geos import Point
 from django.core.urlresolvers import reverse
 from django.db import transaction
 from django.db.models import Count
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, HttpResponseForbidden, Http404
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_POST
 from django.views.generic import DetailView, ListView, FormView
 from django.views.generic.detail import SingleObjectMixin
 from localities.models import Country, DataHistory, DataLoader
@@ -63,35 +81,203 @@ class LocalitiesLayer(JSONResponseMixin, ListView):
 
         return (bbox_poly, zoom, icon_size, geoname, tag)
 
-    def get(self, request, *args, **kwargs):
-        # parse request params
-        bbox, zoom, iconsize, geoname, tag = self._parse_request_params(request)
-        # cluster Localites for a view
-        localities = Locality.objects.in_bbox(bbox)
-        exception = False
+    def _get_backend(self, request):
+        """
+        Clustering backend is defined by the *CLUSTER_BACKEND* setting and it
+        can be overridden by a *backend* request argument
+        """
+
+        backend = request.GET.get('backend', settings.CLUSTER_BACKEND)
+
+        if backend not in CLUSTER_BACKENDS:
+            raise Http404
+
+        return backend
+
+    def _is_unfiltered(self, geoname, tag):
+        """
+        Check if the request is for all of the Localities
+        """
+
+        return geoname in ('', 'undefined') and tag in ('', 'undefined')
+
+    def _filter_localities(self, localities, geoname, tag):
+        """
+        Filter Localities by a country (*geoname*) or by a *tag*
+
+        Returns None if the country does not exist
+        """
+
         try:
             if geoname != "":
-                # getting country's polygon
-                country = Country.objects.get(
-                        name__iexact=geoname)
-                polygon = country.polygon_geometry
-                localities = localities.in_polygon(polygon)
+                # getting country's id
+                country = get_country(geoname)
+                localities = localities.in_country(country.pk)
         except Country.DoesNotExist:
             if geoname != "" and geoname != "undefined":
-                exception = True
+                return None
             else:
                 # searching by tag
                 if tag != "" and tag != "undefined":
                     tags = Tag.objects.filter(tag=tag).values_list('locality')
                     localities = Locality.objects.filter(pk__in=tags)
 
+        return localities
+
+    def get(self, request, *args, **kwargs):
+        # parse request params
+        bbox, zoom, iconsize, geoname, tag = self._parse_request_params(request)
+        backend = self._get_backend(request)
+
+        if self._is_unfiltered(geoname, tag) and 'backend' not in request.GET:
+            # use precomputed clusters for the unfiltered map, unless a
+            # clustering backend was explicitly requested
+            object_list = get_pyramid_clusters(bbox, zoom, *iconsize)
+            if object_list is not None:
+                return self.render_json_response(object_list)
+
+        # cluster Localites for a view
+        localities = self._filter_localities(
+            Locality.objects.in_bbox(bbox), geoname, tag
+        )
+
         object_list = []
-        if not exception:
-            object_list = cluster(localities, zoom, *iconsize)
+        if localities is not None:
+            object_list = cluster(localities, zoom, *iconsize, backend=backend)
 
         return self.render_json_response(object_list)
 
 
+class LocalitiesTileLayer(LocalitiesLayer):
+    """
+    Returns JSON representation of clustered points for a World Mercator tile
+
+    Tile is defined by a *zoom*, *tile_x* and *tile_y* and clusters are
+    defined by an *iconsize*. Tiles of the unfiltered map, for icon sizes of
+    the cluster pyramid, are stored in the server side tile cache
+    """
+
+    def _parse_request_params(self, request):
+        """
+        Try to parse arguments for a request and any error during parsing will
+        raise Http404 exception
+        """
+
+        if 'iconsize' not in request.GET:
+            raise Http404
+
+        try:
+            zoom = int(self.kwargs['zoom'])
+            tile_x = int(self.kwargs['tile_x'])
+            tile_y = int(self.kwargs['tile_y'])
+            icon_size = map(int, request.GET.get('iconsize').split(','))
+            geoname = request.GET.get('geoname', '')
+            tag = request.GET.get('tag', '')
+        except:
+            # return 404 if any of parameters are missing or not parsable
+            raise Http404
+
+        if zoom < 0 or zoom > 20:
+            # zoom should be between 0 and 20
+            raise Http404
+        if not (0 <= tile_x < 2 ** zoom and 0 <= tile_y < 2 ** zoom):
+            # tile should be within the world
+            raise Http404
+        if len(icon_size) != 2 or any((size <= 0 for size in icon_size)):
+            # icon sizes should be positive
+            raise Http404
+
+        return (zoom, tile_x, tile_y, icon_size, geoname, tag)
+
+    tile_format = 'json'
+
+    def render_tile(self, object_list, zoom, tile_x, tile_y):
+        """
+        Serialize clusters of a tile
+        """
+
+        return json.dumps(object_list, cls=DjangoJSONEncoder)
+
+    def get(self, request, *args, **kwargs):
+        # parse request params
+        zoom, tile_x, tile_y, iconsize, geoname, tag = (
+            self._parse_request_params(request)
+        )
+
+        if self._is_unfiltered(geoname, tag):
+            cached = is_cached_icon_size(*iconsize)
+            cache_key = tile_cache_key(
+                zoom, tile_x, tile_y, *iconsize, tile_format=self.tile_format
+            )
+            content = tile_cache().get(cache_key) if cached else None
+
+            if content is None:
+                content = self.render_tile(
+                    get_tile_clusters(zoom, tile_x, tile_y, *iconsize),
+                    zoom, tile_x, tile_y
+                )
+                if cached:
+                    tile_cache().set(cache_key, content)
+
+            response = HttpResponse(
+                content, content_type=self.get_content_type()
+            )
+            patch_cache_control(
+                response, public=True, max_age=settings.TILE_MAX_AGE
+            )
+            return response
+
+        localities = self._filter_localities(
+            Locality.objects.all(), geoname, tag
+        )
+
+        object_list = []
+        if localities is not None:
+            object_list = cluster_tile(
+                localities, zoom, tile_x, tile_y, *iconsize
+            )
+
+        return HttpResponse(
+            self.render_tile(object_list, zoom, tile_x, tile_y),
+            content_type=self.get_content_type()
+        )
+
+
+class LocalitiesVectorTileLayer(LocalitiesTileLayer):
+    """
+    Returns Mapbox Vector Tile representation of clustered points for a World
+    Mercator tile
+
+    Single Localities are features of the *localities* layer and clusters of
+    many Localities are features of the *clusters* layer, both have *uuid* and
+    *count* properties
+    """
+
+    tile_format = 'mvt'
+    content_type = 'application/x-protobuf'
+
+    def render_tile(self, object_list, zoom, tile_x, tile_y):
+        """
+        Encode clusters of a tile as a vector tile
+        """
+
+        layers = {'clusters': [], 'localities': []}
+
+        for feature_id, clu in enumerate(object_list, start=1):
+            layer = 'clusters' if clu['count'] > 1 else 'localities'
+            layers[layer].append((
+                feature_id,
+                tile_point(
+                    clu['geom'][0], clu['geom'][1], zoom, tile_x, tile_y
+                ),
+                {'uuid': clu['uuid'], 'count': clu['count']}
+            ))
+
+        return encode_tile(
+            (name, layers[name]) for name in ('clusters', 'localities')
+        )
+
+
 class LocalityInfo(JSONResponseMixin, DetailView):
     """
     Returns JSON representation of an Locality object (repr_dict) and a
@@ -110,16 +296,13 @@ class LocalityInfo(JSONResponseMixin, DetailView):
 
     def get(self, request, *args, **kwargs):
         self.object = self.get_object()
-        # get attributes
-        attribute_count = 18
-        # count completeness based attributes
         obj_repr = self.object.repr_dict()
         data_repr = render_fragment(
                 self.object.domain.template_fragment, obj_repr
         )
         obj_repr.update({'repr': data_repr})
-        num_data = len(obj_repr['values']) + 1  # geom
-        completeness = (num_data + 0.0) / (attribute_count + 0.0) * 100  # percentage
+        # stored completeness percentage
+        completeness = self.object.completeness
         obj_repr.update({'completeness': '%s%%' % format(completeness, '.2f')})
 
         # get all tags of locality
@@ -173,8 +356,9 @@ class LocalityUpdate(LoginRequiredMixin, SingleObjectMixin, FormView):
         return super(LocalityUpdate, self).post(request, *args, **kwargs)
 
     def form_valid(self, form):
-        # update everything in one transaction
-        with transaction.atomic():
+        # update everything in one transaction, derived data is refreshed
+        # (and its tasks are sent) once, after the commit
+        with batch(), transaction.atomic(), batch(archive_queue):
             self.object.set_geom(
                     form.cleaned_data.pop('lon'),
                     form.cleaned_data.pop('lat')
@@ -205,6 +389,7 @@ def get_json_from_request(request):
 
     mstring = []
     json = {}
+    schema = get_schema()
     for key in request.POST.iterkeys():  # "for key in request.GET" works too.
         # Add filtering logic here.
         valuelist = request.POST.getlist(key)
@@ -213,9 +398,7 @@ def get_json_from_request(request):
     for str in mstring:
         req = str.split('=', 1)
         json[req[0].lower()] = req[1]
-        try:
-            Attribute.objects.get(key=req[0].lower())
-        except:
+        if not schema.has_attribute(req[0].lower()):
             if req[0] not in special_request:
                 tmp_changeset = Changeset.objects.create(
                         social_user=request.user
@@ -224,12 +407,13 @@ def get_json_from_request(request):
                 attribute.key = req[0]
                 attribute.changeset = tmp_changeset
                 attribute.save()
-                domain = Domain.objects.get(name="Health")
                 specification = Specification()
-                specification.domain = domain
+                specification.domain_id = schema.domain_by_name("Health").pk
                 specification.attribute = attribute
                 specification.changeset = tmp_changeset
                 specification.save()
+                # the schema has changed
+                schema = get_schema()
 
     # check mandatory
     is_valid = True
@@ -243,13 +427,12 @@ def get_json_from_request(request):
         json['invalid_key'] = "longitude"
 
     if is_valid:
-        domain = Domain.objects.get(name="Health")
-        attributes = Specification.objects.filter(domain=domain).filter(required=True)
-        for attribute in attributes:
+        domain = schema.domain_by_name("Health")
+        for specification in domain.required:
             try:
-                if len(json[attribute.attribute.key]) == 0:
+                if len(json[specification.key]) == 0:
                     is_valid = False
-                    json['invalid_key'] = attribute.attribute.key
+                    json['invalid_key'] = specification.key
                     break
             except:
                 print "except"
@@ -288,13 +471,19 @@ def locality_edit(request):
             # checking mandatory
             if json_request['is_valid'] == True:
                 locality = Locality.objects.get(uuid=json_request['uuid'])
-                locality.set_geom(float(json_request['long']), float(json_request['lat']))
-                locality.save()
-                locality.set_values(json_request, request.user)
-                extract_tag_and_save(locality, json_request['tags'], request.user)
-                # create history
-                time = datetime.utcnow()
-                locality.update_history(time, 2, request.user)
+                # refresh derived data once for the whole edit
+                with batch():
+                    locality.set_geom(
+                        float(json_request['long']), float(json_request['lat'])
+                    )
+                    locality.save()
+                    locality.set_values(json_request, request.user)
+                    extract_tag_and_save(
+                        locality, json_request['tags'], request.user
+                    )
+                    # create history
+                    time = datetime.utcnow()
+                    locality.update_history(time, 2, request.user)
 
                 return HttpResponse(json.dumps(
                         {"valid": json_request['is_valid'], "uuid": json_request['uuid']}))
@@ -321,7 +510,7 @@ def locality_create(request):
 
                 loc = Locality()
                 loc.changeset = tmp_changeset
-                loc.domain = Domain.objects.get(name="Health")
+                loc.domain_id = get_schema().domain_by_name("Health").pk
                 loc.uuid = tmp_uuid
 
                 # generate unique upstream_id
@@ -330,13 +519,17 @@ def locality_create(request):
                 loc.geom = Point(
                         float(json_request['long']), float(json_request['lat'])
                 )
-                loc.save()
-                loc.set_values(json_request, request.user)
-                extract_tag_and_save(loc, json_request['tags'], request.user)
-
-                # create history
-                time = datetime.utcnow()
-                loc.update_history(time, 1, request.user)
+                # refresh derived data once for the whole creation
+                with batch():
+                    loc.save()
+                    loc.set_values(json_request, request.user)
+                    extract_tag_and_save(
+                        loc, json_request['tags'], request.user
+                    )
+
+                    # create history
+                    time = datetime.utcnow()
+                    loc.update_history(time, 1, request.user)
                 return HttpResponse(json.dumps(
                         {"valid": json_request['is_valid'], "uuid": tmp_uuid}))
             else:
@@ -379,8 +572,9 @@ class LocalityCreate(LoginRequiredMixin, SingleObjectMixin, FormView):
         return super(LocalityCreate, self).post(request, *args, **kwargs)
 
     def form_valid(self, form):
-        # create new as a single transaction
-        with transaction.atomic():
+        # create new as a single transaction, derived data is refreshed
+        # (and its tasks are sent) once, after the commit
+        with batch(), transaction.atomic(), batch(archive_queue):
             tmp_changeset = Changeset.objects.create(
                     social_user=self.request.user
             )
@@ -447,10 +641,19 @@ def load_data(request):
 
             response['message'] = success_message
             response['success'] = True
+            response['progress_url'] = reverse(
+                'load-data-progress', kwargs={'pk': data_loader.pk}
+            )
             response['detailed_message'] = (
                 'Please wait several minutes for Healthsites to load your data. We will send you an email if we '
                 'have finished loading the data.'
             )
+            if data_loader.dry_run:
+                response['detailed_message'] = (
+                    'Please wait several minutes for Healthsites to compare '
+                    'your data to existing localities. Your data is not '
+                    'loaded until you apply it.'
+                )
             # if response['duplicated'] > 0:
             #     response['detailed_message'] += (
             #         ' You also have %s possible duplicated localities, '
@@ -505,70 +708,6 @@ def search_locality_by_name(request):
         return HttpResponse(result, content_type='application/json')
 
 
-def get_statistic(healthsites):
-    # locality which in polygon
-    # data for frontend
-    complete = 0
-    partial = 0
-    basic = 0
-
-    healthsites_number = healthsites.count()
-    values = Value.objects.filter(locality__in=healthsites)
-
-    hospital_number = values.filter(
-            specification__attribute__key='type').filter(
-            data__iexact='hospital').count()
-    medical_clinic_number = values.filter(
-            specification__attribute__key='type').filter(
-            data__iexact='clinic').count()
-    orthopaedic_clinic_number = values.filter(
-            specification__attribute__key='type').filter(
-            data__iexact='orthopaedic').count()
-
-    # check completnees
-    values = Value.objects.filter(locality__in=healthsites).exclude(data__isnull=True).exclude(
-            data__exact='').values('locality').annotate(
-            value_count=Count('locality'))
-    # get attributes
-    attribute_count = 18
-    # count completeness based attributes
-    # this make long waiting, need to more good query
-    complete = values.filter(value_count__gte=attribute_count).count()
-    partial = values.filter(value_count__gte=4).filter(value_count__lte=attribute_count - 1).count()
-    basic = values.filter(value_count__lte=3).count()
-
-    output = {"numbers": {"hospital": hospital_number, "medical_clinic": medical_clinic_number
-        , "orthopaedic_clinic": orthopaedic_clinic_number},
-              "completeness": {"complete": complete, "partial": partial, "basic": basic},
-              "localities": healthsites_number}
-    # updates
-    last_updates = []
-    historys = DataHistory.objects.filter(locality__in=healthsites).order_by(
-            '-time_changed').values('time_changed', 'author__username',
-                                    'mode').annotate(
-            value_count=Count('time_changed'))[:5]
-    for update in historys:
-        update['locality_uuid'] = ""
-        update['locality'] = ""
-        if update['value_count'] == 1:
-            # get the locality
-            data_history = DataHistory.objects.filter(time_changed=update['time_changed'],
-                                                      author__username=update['author__username'],
-                                                      mode=update['mode'])
-            locality_name = Value.objects.filter(locality=data_history[0].locality).filter(
-                    specification__attribute__key='name')
-            update['locality_uuid'] = data_history[0].locality.uuid
-            update['locality'] = locality_name[0].data
-
-        last_updates.append({"author": update['author__username'],
-                             "date_applied": update['time_changed'],
-                             "mode": update['mode'], "locality": update['locality'],
-                             "locality_uuid": update['locality_uuid'],
-                             "data_count": update['value_count']})
-    output["last_update"] = last_updates;
-    return output
-
-
 def search_locality_by_tag(query):
     try:
         tags = Tag.objects.filter(tag=query).values_list('locality')
@@ -598,19 +737,14 @@ def get_country_statistic(query):
                 southwest_lng = viewport['southwest']['lng']
             except:
                 print "except"
-            # getting country's polygon
-            country = Country.objects.get(
-                    name__iexact=query)
-            polygons = country.polygon_geometry
+            # getting country's id
+            country = get_country(query)
 
-            # query for each of attribute
-            healthsites = Locality.objects.in_polygon(
-                    polygons)
-            output = get_statistic(healthsites)
+            # precomputed statistics of the country
+            output = get_stored_statistic(country.pk)
         else:
-            # query for each of attribute
-            healthsites = Locality.objects.all()
-            output = get_statistic(healthsites)
+            # precomputed statistics of all of the localities
+            output = get_stored_statistic()
 
         output["viewport"] = {"northeast_lat": northeast_lat, "northeast_lng": northeast_lng,
                               "southwest_lat": southwest_lat, "southwest_lng": southwest_lng}
@@ -660,25 +794,19 @@ def get_simple_statistic_by_country(request):
         result = []
         try:
             output = {}
-            # getting country's polygon
+            # getting country's id
             print query
-            country = Country.objects.get(
-                    name__iexact=query)
-            polygons = country.polygon_geometry
+            country = get_country(query)
 
             # query for each of attribute
-            healthsites = Locality.objects.in_polygon(
-                    polygons)
+            healthsites = Locality.objects.in_country(country.pk)
             output['number'] = healthsites.count()
 
-            # check completnees
-            values = Value.objects.filter(locality__in=healthsites).values('locality').annotate(
-                    value_count=Count('locality'))
-            # 16 = 4 mandatory + 12 core
-            # this make long waiting, need to more good query
-            complete = values.filter(value_count__gte=15).count()
-            if values.count() > 0:
-                complete = complete * 100.0 / values.count()
+            # check completeness
+            complete = healthsites.filter(
+                    completeness__gte=CORE_SCORE).count()
+            if output['number'] > 0:
+                complete = complete * 100.0 / output['number']
             else:
                 complete = 0.0
             output['completeness'] = "%.2f" % complete
@@ -691,3 +819,95 @@ def get_simple_statistic_by_country(request):
 
         result = json.dumps(output)
         return HttpResponse(result, content_type='application/json')
+
+
+@login_required
+def load_data_progress(request, pk):
+    """Progress of loading data of a DataLoader, polled by uploaders."""
+    try:
+        data_loader = DataLoader.objects.get(pk=pk)
+    except DataLoader.DoesNotExist:
+        raise Http404
+
+    if data_loader.author != request.user:
+        return HttpResponseForbidden()
+
+    progress = get_progress(data_loader.pk, settings.CSV_IMPORT_PARTITIONS)
+
+    if data_loader.applied:
+        status = 'applied'
+    elif data_loader.dry_run and data_loader.diff_report:
+        status = 'diffed'
+    elif progress is None:
+        status = 'queued'
+    else:
+        status = 'loading'
+
+    response = {
+        'status': status,
+        'progress': progress,
+        'notes': data_loader.notes if data_loader.applied else ''
+    }
+    if status == 'diffed':
+        response['notes'] = data_loader.notes
+        response['diff_url'] = reverse(
+            'load-data-diff', kwargs={'pk': data_loader.pk}
+        )
+    return HttpResponse(json.dumps(
+            response,
+            ensure_ascii=False),
+            content_type='application/javascript')
+
+
+@login_required
+def load_data_diff(request, pk):
+    """Download the diff report of a dry run of a DataLoader."""
+    try:
+        data_loader = DataLoader.objects.get(pk=pk, dry_run=True)
+    except DataLoader.DoesNotExist:
+        raise Http404
+
+    if data_loader.author != request.user:
+        return HttpResponseForbidden()
+
+    if not data_loader.diff_report:
+        raise Http404
+
+    response = HttpResponse(
+        data_loader.diff_report.read(), content_type='text/csv'
+    )
+    response['Content-Disposition'] = (
+        'attachment; filename="diff_report_{}.csv"'.format(data_loader.pk)
+    )
+    return response
+
+
+@login_required
+@require_POST
+def load_data_apply(request, pk):
+    """Load data of a DataLoader after its dry run."""
+    try:
+        data_loader = DataLoader.objects.get(
+            pk=pk, dry_run=True, applied=False
+        )
+    except DataLoader.DoesNotExist:
+        raise Http404
+
+    if data_loader.author != request.user:
+        return HttpResponseForbidden()
+
+    # saving the DataLoader triggers loading of its data
+    data_loader.dry_run = False
+    data_loader.save()
+
+    response = {
+        'message': 'You have successfully applied your data',
+        'success': True,
+        'progress_url': reverse(
+            'load-data-progress', kwargs={'pk': data_loader.pk}
+        )
+    }
+    return HttpResponse(json.dumps(
+            response,
+            ensure_ascii=False),
+            content_type='application/javascript')